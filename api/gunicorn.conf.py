@@ -0,0 +1,36 @@
+# Multi-process serving for api/server.py:
+#
+#     gunicorn -c api/gunicorn.conf.py api.server:app
+#
+# The app is imported once in the master (preload_app) and warmed up there
+# before the workers are forked from it, so everything the server builds --
+# the segment and doc store mmaps, the embedding matrix and IVF index, the
+# autocomplete trie, the speller tables and the MiniLM weights -- is shared
+# copy-on-write instead of being rebuilt per worker. Segments added later are opened with
+# mmap in each worker and shared through the OS page cache.
+import gc
+import multiprocessing
+import os
+import sys
+
+# must be set before torch is imported: OpenMP / tokenizer thread pools do
+# not survive fork(), and workers already use every core
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+bind = os.environ.get("SEARCH_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("SEARCH_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("SEARCH_THREADS", "4"))
+preload_app = True
+timeout = 60
+
+
+def when_ready(server):
+    # finish the background warm-up before forking: workers start ready and
+    # no half-built component (or running thread) is copied into them
+    sys.modules["api.server"].warm_up(block=True)
+
+    # Objects created at import are moved out of the collector's reach, so a
+    # GC pass in a worker does not write to (and un-share) their pages.
+    gc.freeze()
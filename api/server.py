@@ -2,22 +2,27 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from collections import Counter
 import math
-
-from crawler.crawler import Crawler
-from indexer.inverted_index import InvertedIndex
-from indexer.storage import save_index, load_index
-from search.query import search, build_snippet
+import threading
+import time
+
+from indexer.build import SPELLER_FILE, TRIE_FILE
+from indexer.segments import SegmentedIndex
+from crawler.analyzer import ANALYZER
+from search.query import search, build_snippet, parse_query
+from search.ann import IVFIndex
+from search.embedding_cache import EmbeddingCache
+from search.hybrid import FUSIONS, HybridSearcher
+from search.ranking import get_ranker
+from search.cache import LRUCache, ResultCache, normalize_query
 from search.autocomplete import Trie
 from search.spell import Speller
-speller = Speller(vocabulary=idx.index.keys())
-from search.semantic import SemanticSearch
-
-semantic = SemanticSearch(docs)
-print("Semantic vectors built for", len(docs), "docs")
+from search.analytics import QueryTracker
+from search.metrics import METRICS, begin_breakdown, end_breakdown, stage
+from search.shards import ShardedSearcher, open_shards
 
 # ---------------------------
 # Optional Redis (still safe)
@@ -32,6 +37,186 @@ except Exception:
     r = None
     redis_enabled = False
 
+# ---------------------------
+# Query caches
+# ---------------------------
+# /search responses keyed by (normalized query, category, index version);
+# Redis, when present, shares them between server processes.
+result_cache = ResultCache(maxsize=2048, ttl=300, redis_client=r if redis_enabled else None)
+# query text -> MiniLM embedding, so repeated queries skip the encoder
+query_embeddings = LRUCache(maxsize=1024, ttl=3600)
+
+# ---------------------------
+# Optional sharded /search
+# ---------------------------
+# SEARCH_SHARDS="127.0.0.1:6100,127.0.0.1:6101" (shard servers, or shard
+# directories to open in-process) makes /search scatter-gather over them;
+# SEARCH_SHARD_TIMEOUT_MS bounds each shard round trip.
+SEARCH_SHARDS = os.environ.get("SEARCH_SHARDS")
+sharded = None
+if SEARCH_SHARDS:
+    sharded = ShardedSearcher(
+        open_shards(SEARCH_SHARDS),
+        timeout=float(os.environ.get("SEARCH_SHARD_TIMEOUT_MS", "500")) / 1000.0,
+    )
+    print(f"Sharded search over {len(sharded.shards)} shards ✔")
+
+app = Flask(__name__)
+CORS(app)
+
+
+# ---------------------------
+# Lazy components
+# ---------------------------
+class Component:
+    """A subsystem built on first get() or by warm_up(), reported by /ready.
+
+    Request handlers use peek(), which never blocks: until the component
+    is ready they degrade (no spelling correction, no suggestions, ...).
+    """
+
+    def __init__(self, name, build):
+        self.name = name
+        self._build = build
+        self._lock = threading.Lock()
+        self.value = None
+        self.state = "cold"             # cold -> loading -> ready | failed
+        self.error = None
+        self.seconds = None
+
+    def get(self):
+        if self.state in ("ready", "failed"):
+            return self.value
+        with self._lock:
+            if self.state in ("cold", "loading"):
+                self.state = "loading"
+                start = time.perf_counter()
+                try:
+                    self.value = self._build()
+                    self.state = "ready"
+                except Exception as e:
+                    print(f"⚠ {self.name} unavailable:", e)
+                    self.error = str(e)
+                    self.state = "failed"
+                self.seconds = round(time.perf_counter() - start, 3)
+        return self.value
+
+    def peek(self):
+        return self.value if self.state == "ready" else None
+
+    def reload(self):
+        """Rebuild a ready component; the old value serves until the new one is in."""
+        if self.state != "ready":
+            return
+        start = time.perf_counter()
+        try:
+            value = self._build()
+        except Exception as e:
+            print(f"⚠ {self.name} reload failed, keeping the old one:", e)
+            return
+        self.value = value
+        self.seconds = round(time.perf_counter() - start, 3)
+
+    def status(self):
+        out = {"state": self.state}
+        if self.seconds is not None:
+            out["seconds"] = self.seconds
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+# ---------------------
+# LOAD INDEX + DOCS
+# ---------------------
+# Segmented index under data/segments. Re-crawl jobs (python -m indexer.pipeline)
+# write new segments and run the merger; the server only reads and picks
+# them up per request. Opening it only maps the segment files.
+index = SegmentedIndex()
+docs = index.docs
+
+
+def bootstrap_index():
+    """Import an older index format, or crawl, when data/segments is empty."""
+    if len(index):
+        print("DOCS COUNT:", len(docs))
+        return index
+
+    from indexer.inverted_index import InvertedIndex
+    from indexer.storage import load_index, load_segment
+
+    try:
+        # single segment written by older builds
+        index.add_segment(*load_segment())
+        print("Imported data/index segment.")
+    except Exception:
+        try:
+            idx = InvertedIndex()
+            idx.index, idx.doc_lengths, pages = load_index()
+            index.add_segment(idx.freeze(), pages)
+            print("Imported data/index.json.")
+        except Exception:
+            from crawler.concurrent import ConcurrentCrawler
+            from indexer.pipeline import run_pipeline
+
+            print("Index not found — crawling Wikipedia...")
+            crawler = ConcurrentCrawler(max_pages=50)
+            # pages are tokenized and indexed while the crawl is running
+            run_pipeline(crawler.iter_pages("https://en.wikipedia.org/wiki/India"), index)
+            index.flush()
+            print("Index & docs saved.")
+    print("DOCS COUNT:", len(docs))
+    return index
+
+
+# ---------------------
+# AUTOCOMPLETE TRIE
+# ---------------------
+# weights: document frequency, raised by query popularity as queries come in.
+# Saved next to the segments (python -m indexer.build writes both) and
+# reused while the index version matches, like the speller tables.
+TRIE_PATH = os.path.join(index.directory, TRIE_FILE)
+SPELLER_PATH = os.path.join(index.directory, SPELLER_FILE)
+QUERY_WEIGHT = 5.0         # weight added to a word each time it is searched
+
+
+def load_trie():
+    components["index"].get()
+    try:
+        trie = Trie.load(TRIE_PATH)
+        if trie.version != index.version:
+            raise ValueError("stale autocomplete trie")
+        print("Trie loaded with", len(trie), "words.")
+    except (OSError, ValueError):
+        trie = Trie({w: index.df(w) for w in index.vocabulary()})
+        trie.save(TRIE_PATH, version=index.version)
+        print("Trie built with", len(trie), "words.")
+
+    if redis_enabled:
+        # popularity survives restarts through the Redis trending set
+        try:
+            for query, count in r.zrange("trending_searches", 0, -1, withscores=True):
+                for word in ANALYZER.tokens(query):
+                    trie.add_weight(word, QUERY_WEIGHT * count)
+        except Exception:
+            pass
+    return trie
+
+
+def load_speller():
+    components["index"].get()
+    try:
+        speller = Speller.load(SPELLER_PATH)
+        if speller.version != index.version:
+            raise ValueError("stale speller tables")
+        print("Speller loaded with", len(speller.freq), "words.")
+    except (OSError, ValueError):
+        speller = Speller.from_index(index)
+        speller.save(SPELLER_PATH, version=index.version)
+        print("Speller built with", len(speller.freq), "words.")
+    return speller
+
+
 # ---------------------------
 # Semantic Embeddings (MiniLM)
 # ---------------------------
@@ -39,62 +224,36 @@ semantic_enabled = False
 semantic_model = None
 doc_embed_matrix = None
 doc_embed_urls = []
+doc_ann = None             # IVF index over doc_embed_matrix
+hybrid = None              # lexical + semantic fusion (needs MiniLM)
 
-try:
-    import numpy as np
+
+def load_semantic_model():
+    global semantic_model, semantic_enabled
+
+    # torch is only imported here, off the startup path
     from sentence_transformers import SentenceTransformer
 
     print("Loading semantic model (MiniLM)...")
     semantic_model = SentenceTransformer("all-MiniLM-L6-v2")
     semantic_enabled = True
     print("Semantic model loaded ✔")
-except Exception as e:
-    print("⚠ Semantic model unavailable:", e)
-    semantic_enabled = False
+    return semantic_model
 
-app = Flask(__name__)
-CORS(app)
 
 # ---------------------
-# LOAD INDEX + DOCS
+# Trending & history
 # ---------------------
-idx = InvertedIndex()
-docs = {}
+def boost_autocomplete(query):
+    trie = components["autocomplete"].peek()
+    if trie is not None:
+        for word in ANALYZER.tokens(query):
+            trie.add_weight(word, QUERY_WEIGHT)
 
-try:
-    index_data, doc_lengths, stored_docs = load_index()
-    idx.index = index_data
-    idx.doc_lengths = doc_lengths
-    docs = stored_docs
-    print("Loaded index & docs from storage.")
-except Exception:
-    print("Index not found — crawling Wikipedia...")
-    crawler = Crawler(max_pages=50)
-    docs = crawler.crawl("https://en.wikipedia.org/wiki/India")
 
-    for url, data in docs.items():
-        idx.add_document(url, data["text"])
-
-    save_index(idx.index, idx.doc_lengths, docs)
-    print("Index & docs saved.")
-
-print("DOCS COUNT:", len(docs))
-
-# ---------------------
-# AUTOCOMPLETE TRIE
-# ---------------------
-trie = Trie()
-for word in idx.index.keys():
-    trie.insert(word)
-print("Trie loaded with", len(idx.index), "words.")
-
-# ---------------------
-# Trending & history
-# ---------------------
-trending_storage = {}      # query -> count
-user_history = {}          # user_id -> [query, ...]
-categories = set()         # optional categories
-N_DOCS = max(len(docs), 1)
+# applied in batches by a background thread, not per request
+tracker = QueryTracker(redis_client=r if redis_enabled else None, on_query=boost_autocomplete)
+doc_categories = set()     # optional categories
 
 
 def get_user_id():
@@ -108,51 +267,59 @@ def get_user_id():
 # ---------------------
 # Lightweight category & semantic vectors (fallback if no MiniLM)
 # ---------------------
-doc_vectors = {}           # url -> {word: tfidf}  (used only if semantic model missing)
+doc_vectors = {}           # url -> {term id: tfidf}  (used only if semantic model missing)
 
 
-def build_doc_vectors_fallback():
-    """TF-IDF vector fallback for semantic if MiniLM is not available."""
-    global categories, doc_vectors
+def tfidf_vector(words, n_docs, dfs):
+    """{term id: tf * idf} over the indexed words; dfs caches index.df per id."""
+    vec = {}
+    if not words:
+        return vec
+    for tid, freq in Counter(map(ANALYZER.vocabulary.add, words)).items():
+        df = dfs.get(tid)
+        if df is None:
+            df = dfs[tid] = index.df(ANALYZER.vocabulary.terms[tid])
+        if df:
+            vec[tid] = freq / len(words) * math.log(n_docs / df)
+    return vec
+
 
+def build_doc_vectors_fallback():
+    """TF-IDF vector fallback for semantic if MiniLM is not available.
+
+    Texts are tokenized by the index's analyzer, so the vectors use exactly
+    the indexed terms (as interned term ids). This runs on the warm-up
+    thread (or in the gunicorn master) alongside other threads, so it stays
+    in-process: forking a pool there could deadlock on their locks.
+    """
+    urls, texts = [], []
     for url, data in docs.items():
-        text = data.get("text", "")
+        urls.append(url)
+        texts.append(data.get("text", ""))
         cat = data.get("category")
         if cat:
-            categories.add(cat.lower())
-
-        words = text.lower().split()
-        if not words:
-            continue
-
-        counts = Counter(words)
-        doc_len = len(words)
-        vec = {}
-
-        for w, freq in counts.items():
-            if w in idx.index:
-                tf = freq / doc_len
-                df = len(idx.index[w])
-                if df == 0:
-                    continue
-                idf = math.log(N_DOCS / df)
-                vec[w] = tf * idf
+            doc_categories.add(cat.lower())
 
+    n_docs = max(len(docs), 1)
+    dfs = {}
+    for url, words in zip(urls, ANALYZER.analyze_many(texts)):
+        vec = tfidf_vector(words, n_docs, dfs)
         if vec:
             doc_vectors[url] = vec
 
     print(f"Fallback semantic vectors (TF-IDF) built for {len(doc_vectors)} docs.")
-    print(f"Categories detected: {sorted(list(categories))}")
+    print(f"Categories detected: {sorted(list(doc_categories))}")
 
 
 def build_semantic_embeddings():
-    """Build MiniLM embeddings once at startup if model is available."""
-    global doc_embed_matrix, doc_embed_urls, categories
+    """Load / update cached MiniLM embeddings if the model is available."""
+    global doc_embed_matrix, doc_embed_urls, doc_ann, hybrid
 
-    if not semantic_enabled:
+    components["index"].get()
+    if components["semantic_model"].get() is None:
         print("Semantic disabled — using TF-IDF fallback only.")
         build_doc_vectors_fallback()
-        return
+        return "tfidf-fallback"
 
     texts = []
     urls = []
@@ -165,37 +332,50 @@ def build_semantic_embeddings():
 
         cat = data.get("category")
         if cat:
-            categories.add(cat.lower())
+            doc_categories.add(cat.lower())
 
     if not texts:
         print("No texts available for semantic embeddings.")
-        return
+        return "empty"
+
+    # only new / changed docs are encoded; the rest come from data/embeddings
+    cache = EmbeddingCache("all-MiniLM-L6-v2")
+    doc_embed_matrix, doc_embed_urls = cache.sync(
+        zip(urls, texts),
+        lambda batch: semantic_model.encode(batch, convert_to_numpy=True),
+    )
+    doc_ann = IVFIndex(doc_embed_matrix, doc_embed_urls)
+    hybrid = HybridSearcher(index, docs, doc_ann, doc_embed_matrix, doc_embed_urls, encode_query)
+    print(f"Semantic embeddings built for {len(doc_embed_urls)} docs ({doc_ann.n_lists} IVF lists).")
+    print(f"Categories detected: {sorted(list(doc_categories))}")
+    return "minilm"
+
+
+def encode_query(query):
+    key = normalize_query(query)
+    q_emb = query_embeddings.get(key)
+    if q_emb is None:
+        q_emb = semantic_model.encode([query], convert_to_numpy=True)[0]
+        query_embeddings.put(key, q_emb)
+    return q_emb
 
-    print("Encoding documents for semantic search...")
-    doc_embed_matrix = semantic_model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-    doc_embed_urls = urls
-    print(f"Semantic embeddings built for {len(doc_embed_urls)} docs.")
-    print(f"Categories detected: {sorted(list(categories))}")
 
+def semantic_search(query: str, top_k: int = 20, nprobe=None):
+    """Return list of semantic search results using MiniLM or fallback.
 
-def semantic_search(query: str, top_k: int = 20):
-    """Return list of semantic search results using MiniLM or fallback."""
+    nprobe trades recall for latency on the IVF index (None = default).
+    """
     query = query.strip()
-    if not query:
+    if not query or components["embeddings"].peek() is None:
+        # empty query, or vectors still being built by warm_up()
         return []
 
     # MiniLM path
-    if semantic_enabled and doc_embed_matrix is not None:
-        q_emb = semantic_model.encode([query], convert_to_numpy=True)[0]
-        # cosine similarity
-        norms = np.linalg.norm(doc_embed_matrix, axis=1) * (np.linalg.norm(q_emb) + 1e-10)
-        sims = (doc_embed_matrix @ q_emb) / (norms + 1e-10)
-
-        idxs = np.argsort(sims)[::-1][:top_k]
+    if semantic_enabled and doc_ann is not None:
+        q_emb = encode_query(query)
+        # approximate cosine top-k over pre-normalized embeddings
         results = []
-        for i in idxs:
-            url = doc_embed_urls[i]
-            score = float(sims[i])
+        for url, score in doc_ann.search(q_emb, top_k=top_k, nprobe=nprobe):
             page = docs.get(url, {})
             snippet = build_snippet(page.get("text", ""), query)
             results.append({
@@ -208,22 +388,11 @@ def semantic_search(query: str, top_k: int = 20):
         return results
 
     # fallback path (cosine on TF-IDF vectors)
-    print("Semantic fallback (TF-IDF cosine) in use.")
-    words = query.lower().split()
+    METRICS.inc("semantic_fallback_queries_total")
+    words = [w for w in ANALYZER.tokens(query) if w in ANALYZER.vocabulary]
     if not words:
         return []
-
-    counts = Counter(words)
-    q_len = len(words)
-    q_vec = {}
-    for w, freq in counts.items():
-        if w in idx.index:
-            tf = freq / q_len
-            df = len(idx.index[w])
-            if df == 0:
-                continue
-            idf = math.log(N_DOCS / df)
-            q_vec[w] = tf * idf
+    q_vec = tfidf_vector(words, max(len(docs), 1), {})
 
     def cosine(v1, v2):
         if not v1 or not v2:
@@ -256,8 +425,84 @@ def semantic_search(query: str, top_k: int = 20):
     return results
 
 
-# build semantic / fallback vectors at startup
-build_semantic_embeddings()
+components = {
+    c.name: c for c in (
+        Component("index", bootstrap_index),
+        Component("speller", load_speller),
+        Component("autocomplete", load_trie),
+        Component("semantic_model", load_semantic_model),
+        Component("embeddings", build_semantic_embeddings),
+    )
+}
+_warmup_thread = None
+
+
+def warm_up(block=False):
+    """Build every component in order, on a background thread unless block.
+
+    The lexical index comes first, so /search works while the rest loads.
+    Under gunicorn (api/gunicorn.conf.py) the master calls this with
+    block=True before forking, so workers start warm and share the result.
+    """
+    global _warmup_thread
+
+    def run():
+        for component in components.values():
+            component.get()
+        print("All components ready.")
+
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=run, name="warm-up", daemon=True)
+        _warmup_thread.start()
+    if block:
+        _warmup_thread.join()
+
+
+warm_up()
+
+# ---------------------
+# Live index updates
+# ---------------------
+# new segments change the vocabulary: the speller and autocomplete are
+# reloaded (from the tables the indexing job saved, or rebuilt) in the
+# background, one reload at a time, while the old ones keep serving
+WORD_TABLES = ("speller", "autocomplete")
+_reload_wanted = threading.Event()
+_reload_lock = threading.Lock()
+_reload_thread = None
+
+
+def _reload_word_tables():
+    while True:
+        _reload_wanted.wait()
+        _reload_wanted.clear()
+        for name in WORD_TABLES:
+            components[name].reload()
+
+
+@app.before_request
+def refresh_index():
+    global _reload_thread
+    g.request_start = time.perf_counter()
+    # cheap stat() of the manifest; reopens only new segments / tombstones
+    if index.refresh():
+        with _reload_lock:
+            if _reload_thread is None:
+                # started by the first refresh, i.e. in a worker, never before fork
+                _reload_thread = threading.Thread(target=_reload_word_tables, name="word-tables",
+                                                  daemon=True)
+                _reload_thread.start()
+        _reload_wanted.set()
+
+
+@app.after_request
+def record_latency(response):
+    end_breakdown()         # drop a ?debug=timing breakdown left on this thread
+    endpoint = request.endpoint or "unmatched"
+    METRICS.observe("http_request_seconds", time.perf_counter() - g.request_start, endpoint=endpoint)
+    METRICS.inc("http_requests_total", endpoint=endpoint, status=response.status_code)
+    return response
+
 
 # ---------------------
 # Query tracking
@@ -266,18 +511,7 @@ build_semantic_embeddings()
 def track_queries(response):
     query = request.args.get("q", "").strip()
     if query:
-        trending_storage[query] = trending_storage.get(query, 0) + 1
-
-        user = get_user_id()
-        user_history[user] = user_history.get(user, []) + [query]
-
-        if redis_enabled:
-            try:
-                r.zincrby("trending_searches", 1, query)
-                r.zincrby(f"user:{user}:history", 1, query)
-            except Exception:
-                # silent fallback
-                pass
+        tracker.record(query, get_user_id())
     return response
 
 
@@ -289,73 +523,155 @@ def home():
     return {"message": "Mini Search Engine with Semantic Search 🚀"}
 
 
+DEFAULT_RANKING = "bm25f"
+
+
 @app.get("/search")
 def perform_search():
+    """?rank=tfidf|bm25|bm25f picks the ranking function; ?debug=timing adds
+    a per-stage breakdown (ms) to the response."""
+    start = time.perf_counter()
     query = request.args.get("q", "").strip()
     category = request.args.get("category")
-
-    corrected, changed = speller.correct_query(query)
+    ranking = request.args.get("rank", DEFAULT_RANKING)
+    debug = request.args.get("debug") == "timing"
+    if debug:
+        begin_breakdown()
+    try:
+        scorer = get_ranker(ranking)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cached = None
+    if sharded is None:
+        # shard versions are not known up front, so sharded results are not cached
+        with stage("cache"):
+            cached = result_cache.get(query, category, index.version, scorer.name)
+    if cached is not None:
+        return respond(dict(cached, query=query), start, debug)
+
+    speller = components["speller"].peek()
+    with stage("spell"):
+        if speller is not None:
+            corrected, changed = speller.correct_query(query)
+        else:
+            # still warming up: search the query as typed
+            corrected, changed = query, False
     used_query = corrected if changed else query
 
-    base_results = search(used_query, idx, docs, total_docs=len(docs))
-
-    if category:
-        base_results = [
-            r for r in base_results
-            if docs.get(r["url"], {}).get("category") == category
-        ]
-
-    return jsonify({
-        "query": query,
+    # the category is a facet mask applied before scoring
+    filters = {"category": category} if category else None
+    if sharded is not None:
+        out = sharded.search(used_query, top_k=10, scorer=scorer, filters=filters)
+        base_results, facets = out["results"], out["facets"]
+    else:
+        base_results = search(used_query, index, docs, total_docs=len(docs), top_k=10,
+                              scorer=scorer, filters=filters)
+
+        # counts per category for the query, ignoring the selected category
+        with stage("facets"):
+            words, phrases = parse_query(used_query.lower())
+            facets = {"category": index.facet_counts("category", words, phrases) if words else {}}
+
+    response = {
         "used_query": used_query,
         "corrected": changed,
-        "results": base_results[:10],
-    })
+        "results": base_results,
+        "facets": facets,
+        "ranking": scorer.name,
+    }
+    if sharded is not None:
+        response["partial"] = out["partial"]
+        response["failed_shards"] = out["failed_shards"]
+        return respond(dict(response, query=query), start, debug)
+    if speller is not None:
+        # a query searched as typed during warm-up must not outlive it in the cache
+        result_cache.put(query, category, index.version, response, scorer.name)
+    return respond(dict(response, query=query), start, debug)
+
+
+def respond(body, start, debug):
+    """jsonify a /search body, timing serialization; adds the breakdown
+    (everything but serialization itself) when debugging."""
+    if debug:
+        body["timing"] = dict(end_breakdown(), total_ms=round((time.perf_counter() - start) * 1000.0, 3))
+    with stage("serialize"):
+        return jsonify(body)
 
 
 
 @app.get("/search_semantic")
 def perform_search_semantic_route():
     query = request.args.get("q", "").strip()
-    results = semantic_search(query, top_k=50)
+    nprobe = request.args.get("nprobe", type=int)
+    results = semantic_search(query, top_k=50, nprobe=nprobe)
     return jsonify(results)
 
 
+@app.get("/search_hybrid")
+def perform_search_hybrid():
+    """Lexical + semantic fusion; ?budget_ms= and ?candidates= cap the work,
+    ?rank= picks the lexical ranking function as for /search."""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"query": query, "results": [], "partial": False})
+    try:
+        scorer = get_ranker(request.args.get("rank", DEFAULT_RANKING))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fusion = request.args.get("fusion", "rrf")
+    if fusion not in FUSIONS:
+        return jsonify({"error": "unknown fusion %r (choose from %s)" % (fusion, ", ".join(FUSIONS))}), 400
+
+    top_k = request.args.get("k", default=10, type=int)
+    if hybrid is None:
+        # no MiniLM: lexical only
+        results = search(query, index, docs, total_docs=len(docs), top_k=top_k, scorer=scorer)
+        return jsonify({"query": query, "results": results, "partial": True})
+
+    out = hybrid.search(
+        query,
+        top_k=top_k,
+        max_candidates=request.args.get("candidates", default=100, type=int),
+        time_budget=request.args.get("budget_ms", default=250, type=int) / 1000.0,
+        fusion=fusion,
+        alpha=request.args.get("alpha", default=0.5, type=float),
+        scorer=scorer,
+    )
+    out["query"] = query
+    return jsonify(out)
+
+
 @app.get("/categories")
 def categories():
-    cats = set()
-    for d in docs.values():
-        c = d.get("category")
-        if c:
-            cats.add(c)
-    return jsonify(sorted(list(cats)))
+    # from the per-segment facet columns, not a scan of the documents
+    return jsonify(sorted(index.facet_counts("category")))
 
 
 
 @app.get("/suggest")
 def suggest():
     prefix = request.args.get("q", "")
-    suggestions = trie.autocomplete(prefix)
-    return jsonify(suggestions[:10])
+    trie = components["autocomplete"].peek()
+    if trie is None:
+        return jsonify([])
+    return jsonify(trie.autocomplete(prefix.lower(), k=10))
 
 
 @app.get("/trending")
 def trending_list():
-    ordered = sorted(trending_storage.items(), key=lambda x: x[1], reverse=True)
-    return jsonify([term for term, count in ordered][:10])
+    return jsonify([term for term, count in tracker.top(10)])
 
 
 @app.get("/trending_graph")
 def trending_graph():
-    ordered = sorted(trending_storage.items(), key=lambda x: x[1], reverse=True)
-    graph = [{"term": term, "count": count} for term, count in ordered]
-    return jsonify(graph[:10])
+    return jsonify([{"term": term, "count": count} for term, count in tracker.top(10)])
 
 
 @app.get("/recommended")
 def recommended():
     user = get_user_id()
-    history = user_history.get(user, [])
+    history = tracker.history(user)
     seen = set()
     unique_recent = []
     for q in reversed(history):
@@ -370,39 +686,68 @@ def recommended():
 @app.get("/user_history")
 def get_user_history():
     user = get_user_id()
-    return jsonify(user_history.get(user, []))
-@app.get("/search_semantic")
-def search_semantic():
-    query = request.args.get("q", "").strip()
-    raw = semantic.search(query, top_k=10)
-
-    out = []
-    for doc_id, score in raw:
-        doc = docs.get(doc_id, {})
-        snippet = build_snippet(doc.get("text", ""), query)
-        out.append({
-            "url": doc_id,
-            "title": doc.get("title", doc_id),
-            "snippet": snippet,
-            "image": doc.get("image"),
-            "score": score,
-        })
-    return jsonify(out)
-from collections import Counter
+    return jsonify(tracker.history(user))
+
+
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once lexical search can answer, 503 before.
+
+    Lists every component's state and build time; optional ones (speller,
+    autocomplete, semantic) may still be loading while the server is ready.
+    """
+    is_ready = components["index"].state == "ready"
+    body = {
+        "ready": is_ready,
+        "components": {name: c.status() for name, c in components.items()},
+    }
+    if sharded is not None:
+        body["shards"] = sharded.info()
+    return jsonify(body), 200 if is_ready else 503
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: stage / request latency histograms, counters,
+    and gauges for caches, analytics and warm-up state."""
+    gauges = {
+        "search_index_docs": len(docs),
+        "search_component_ready": [
+            ({"component": name}, int(c.state == "ready")) for name, c in components.items()
+        ],
+        "search_component_build_seconds": [
+            ({"component": name}, c.seconds) for name, c in components.items() if c.seconds is not None
+        ],
+    }
+    for cache_name, cache in (("results", result_cache), ("query_embeddings", query_embeddings)):
+        for key, value in cache.stats().items():
+            if isinstance(value, (int, float)):
+                gauges.setdefault("search_cache_" + key, []).append(({"cache": cache_name}, value))
+    for key, value in tracker.stats().items():
+        gauges["search_analytics_" + key] = value
+    return Response(METRICS.render(gauges), mimetype="text/plain; version=0.0.4")
+
 
 @app.get("/stats")
 def stats():
-    total_queries = sum(trending_storage.values())
-    unique_queries = len(trending_storage)
-
-    top_queries = sorted(
-        trending_storage.items(), key=lambda x: x[1], reverse=True
-    )[:10]
+    analytics = tracker.stats()
 
     return jsonify({
-        "total_queries": total_queries,
-        "unique_queries": unique_queries,
-        "top_queries": [{"term": t, "count": c} for t, c in top_queries],
+        "total_queries": analytics["total_queries"],
+        # distinct queries currently counted (capped by the tracker capacity)
+        "unique_queries": analytics["tracked_queries"],
+        "top_queries": [{"term": t, "count": c} for t, c in tracker.top(10)],
+        "analytics": analytics,
+        "cache": {
+            "results": result_cache.stats(),
+            "query_embeddings": query_embeddings.stats(),
+        },
     })
 
 
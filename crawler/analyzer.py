@@ -0,0 +1,133 @@
+import os
+import re
+from multiprocessing import Pool
+
+import numpy as np
+
+STOPWORDS = frozenset({"the","is","are","a","an","and","of","to","in","on","for","with","by","at","from","as","this","that"})
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# characters that can end up inside a token: the only non-ASCII ones that
+# lowercase into [a-z0-9] are U+0130 (-> "i" + combining dot) and the Kelvin sign
+TOKEN_CHARS = "A-Za-z0-9\u0130\u212a"
+
+
+def light_stem(word):
+    """Harman's S-stemmer: folds English plurals only ("cities" -> "city")."""
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies") and not word.endswith(("eies", "aies")):
+        return word[:-3] + "y"
+    if word.endswith("es") and not word.endswith(("aes", "ees", "oes")):
+        return word[:-1]
+    if word.endswith("s") and not word.endswith(("us", "ss")):
+        return word[:-1]
+    return word
+
+
+class Vocabulary:
+    """Interned terms <-> dense integer ids, grown as terms are seen.
+
+    Returning the one stored instance of each term keeps buffered token
+    lists and term-keyed tables from holding a copy per occurrence.
+    """
+
+    def __init__(self, terms=()):
+        self.ids = {}                   # term -> id
+        self.terms = []                 # id -> term
+        for term in terms:
+            self.add(term)
+
+    def add(self, term):
+        i = self.ids.get(term)
+        if i is None:
+            i = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return i
+
+    def get(self, term, default=-1):
+        return self.ids.get(term, default)
+
+    def intern(self, words):
+        """The stored instance of every word (new words are added)."""
+        terms = self.terms
+        return [terms[self.add(w)] for w in words]
+
+    def encode(self, words, add=True):
+        """int32 term ids; unknown words are -1 unless ``add``."""
+        if add:
+            return np.array([self.add(w) for w in words], dtype=np.int32)
+        return np.array([self.ids.get(w, -1) for w in words], dtype=np.int32)
+
+    def __contains__(self, term):
+        return term in self.ids
+
+    def __len__(self):
+        return len(self.terms)
+
+
+class Analyzer:
+    """The one text -> terms pipeline for indexing, queries and suggestions.
+
+    Lowercase, split on anything but [a-z0-9] with one compiled regex,
+    drop ``stopwords`` and optionally stem. The index and its queries must
+    use the same analyzer; ``ANALYZER`` below is the shared one.
+    """
+
+    def __init__(self, stopwords=STOPWORDS, stemmer=None):
+        self.stopwords = frozenset(stopwords)
+        self.stemmer = stemmer          # module-level function, so it pickles
+        self.vocabulary = Vocabulary()
+
+    def __getstate__(self):
+        # worker processes only tokenize; ids are assigned in the parent
+        state = dict(self.__dict__)
+        state["vocabulary"] = Vocabulary()
+        return state
+
+    def tokens(self, text):
+        words = _TOKEN.findall(text.lower())
+        stop = self.stopwords
+        if self.stemmer is None:
+            return [w for w in words if w not in stop]
+        stem = self.stemmer
+        return [stem(w) for w in words if w not in stop]
+
+    def spans(self, text):
+        """(start, end) character span of each token tokens() returns, in order."""
+        lowered = text.lower()
+        stop = self.stopwords
+        if len(lowered) == len(text):
+            for m in _TOKEN.finditer(lowered):
+                if m.group() not in stop:
+                    yield m.span()
+            return
+        # some char lowercased into two (U+0130): map offsets back to text
+        origin = [i for i, ch in enumerate(text) for _ in ch.lower()]
+        for m in _TOKEN.finditer(lowered):
+            if m.group() not in stop:
+                start, end = m.span()
+                yield origin[start], origin[end - 1] + 1
+
+    def is_stopword(self, word):
+        return word in self.stopwords
+
+    def term_ids(self, text, add=True):
+        """tokens() as int32 ids in this analyzer's vocabulary."""
+        return self.vocabulary.encode(self.tokens(text), add)
+
+    def analyze_many(self, texts, processes=None, chunksize=64):
+        """tokens() for many texts, in order; spread over a process pool
+        when ``processes`` > 1 (tokenizing is CPU-bound and holds the GIL)."""
+        texts = list(texts)
+        if not processes or processes < 2 or len(texts) < 2 * chunksize:
+            return [self.intern(self.tokens(t)) for t in texts]
+        with Pool(processes) as pool:
+            return [self.intern(words) for words in pool.imap(self.tokens, texts, chunksize)]
+
+    def intern(self, words):
+        return self.vocabulary.intern(words)
+
+
+# SEARCH_STEM=1 turns on plural stemming; rebuild the index after changing it
+ANALYZER = Analyzer(stemmer=light_stem if os.environ.get("SEARCH_STEM") == "1" else None)
@@ -0,0 +1,229 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from crawler.dedup import NearDuplicateDetector
+from crawler.frontier import Frontier, HostLimiter, RobotsCache
+from crawler.state import content_hash
+from crawler.utils import USER_AGENT, host_of, parse_page
+from search.metrics import METRICS
+
+
+class ConcurrentCrawler:
+    """Thread-pool crawler with per-host politeness and robots.txt support.
+
+    Up to ``concurrency`` fetches run at once over pooled keep-alive
+    connections (one requests.Session per worker thread). Each host gets at
+    least ``delay`` seconds between requests, or its robots.txt Crawl-delay
+    if larger. Same interface as Crawler: crawl(start_url) -> {url: page}.
+
+    Redirects onto already-seen URLs and near-duplicate content (SimHash,
+    see crawler/dedup.py) are skipped; ``stats`` reports the duplicate rate.
+
+    With a ``state`` (crawler/state.py), validators and content hashes are
+    persisted so iter_changed() can refresh known pages as a cheap delta.
+    A new or changed page is only recorded once the consumer calls
+    commit(url) for it, i.e. after the page is safely indexed; ``indexed``
+    (url -> bool) lets the crawler ignore records of pages the index lacks.
+    """
+
+    def __init__(self, max_pages=50, concurrency=8, delay=0.5,
+                 respect_robots=True, timeout=7, dedup=True, state=None, indexed=None):
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.respect_robots = respect_robots
+
+        self.frontier = Frontier()
+        self.limiter = HostLimiter(delay)
+        self._local = threading.local()
+        self.robots = RobotsCache(self._session(), timeout=timeout)
+
+        self.dedup = NearDuplicateDetector() if dedup else None
+        self.state = state              # optional CrawlState for conditional re-crawls
+        self.indexed = indexed
+        self._uncommitted = {}          # url -> state record (None: remove) awaiting commit()
+        self._commit_lock = threading.Lock()
+
+        self.stats = {"fetched": 0, "errors": 0, "robots_blocked": 0,
+                      "redirect_duplicates": 0, "duplicates": 0, "duplicate_rate": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["User-Agent"] = USER_AGENT
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def fetch(self, url, conditional=False):
+        """Fetch and parse one URL; returns (status, page, links).
+
+        status is "new", "changed", "unchanged" (304, or same content hash as
+        last time), "gone" (a known page now 404/410) or "skipped". Without a
+        crawl state every parsed page is "new".
+        """
+        if self.respect_robots and not self.robots.allowed(url):
+            self._count("robots_blocked")
+            return "skipped", None, []
+
+        delay = self.robots.crawl_delay(url) if self.respect_robots else None
+        if delay is not None:
+            delay = max(delay, self.limiter.delay)
+        self.limiter.wait(host_of(url), delay)
+
+        previous = self._previous(url)
+        headers = {}
+        if conditional and previous is not None:
+            headers = self.state.conditional_headers(url)
+
+        print("Crawling:", url)
+        with METRICS.timer("crawler_fetch_seconds"):
+            response = self._session().get(url, headers=headers, timeout=self.timeout)
+        self._count("fetched")
+        METRICS.inc("crawler_responses_total", status=response.status_code)
+        if response.status_code == 304 and self.state is not None:
+            self.state.touch(url)
+            self._count("not_modified")
+            return "unchanged", None, []
+        if response.status_code in (404, 410) and self.state is not None and self.state.get(url):
+            self._defer(url, None)
+            self._count("gone")
+            return "gone", None, []
+        if response.status_code != 200:
+            return "skipped", None, []
+        if response.url != url and not self.frontier.mark_seen(response.url):
+            # redirected onto a page we already have (or have queued)
+            self._count("redirect_duplicates")
+            return "skipped", None, []
+
+        with METRICS.timer("crawler_parse_seconds"):
+            page, links = parse_page(url, response.text)
+        if page is None:
+            return "skipped", None, []
+        if self.state is None:
+            return "new", page, links
+
+        page_hash = content_hash(page)
+        record = (response.headers.get("ETag"), response.headers.get("Last-Modified"), page_hash)
+        if previous is not None and previous["content_hash"] == page_hash:
+            # already indexed as is: only the validators may be new
+            self.state.record(url, *record)
+            self._count("unchanged")
+            return "unchanged", page, links
+        self._defer(url, record)
+        return "new" if previous is None else "changed", page, links
+
+    def _previous(self, url):
+        """The state's record of url, unless the index no longer has the page."""
+        if self.state is None:
+            return None
+        previous = self.state.get(url)
+        if previous is not None and self.indexed is not None and not self.indexed(url):
+            return None
+        return previous
+
+    def _defer(self, url, record):
+        with self._commit_lock:
+            self._uncommitted[url] = record
+
+    def commit(self, url):
+        """Record a yielded page (or its removal) in the crawl state.
+
+        Call it once the change is durable in the index; a page that is
+        never committed is fetched and yielded again by the next crawl.
+        """
+        with self._commit_lock:
+            if url not in self._uncommitted:
+                return
+            record = self._uncommitted.pop(url)
+        if record is None:
+            self.state.remove(url)
+        else:
+            self.state.record(url, *record)
+
+    def _is_duplicate(self, url, page):
+        if self.dedup is None:
+            return False
+        canonical = self.dedup.check(url, page["text"])
+        with self._stats_lock:
+            self.stats["duplicates"] = self.dedup.duplicates
+            self.stats["duplicate_rate"] = round(self.dedup.duplicate_rate(), 4)
+        return canonical is not None
+
+    def crawl(self, start_url):
+        pages = {url: page for url, page in self.iter_pages(start_url) if page is not None}
+        print(f"Finished crawling {len(pages)} pages.", self.stats)
+        return pages
+
+    def iter_pages(self, start_url):
+        """Yield (url, page) as fetches complete; at most concurrency in flight.
+
+        With a crawl state, unchanged pages are not yielded (their links are
+        still followed) and known pages that are gone yield (url, None).
+        """
+        self.frontier.add(start_url)
+        return self._run(conditional=False, follow_links=True, limit=self.max_pages)
+
+    def iter_changed(self, urls=None):
+        """Re-check known URLs with conditional requests (a cheap refresh).
+
+        Yields (url, page) for pages whose content changed and (url, None)
+        for pages that are gone; unchanged pages cost a 304 and are skipped.
+        """
+        if self.state is None:
+            raise ValueError("iter_changed() needs a CrawlState")
+        for url in self.state.urls() if urls is None else urls:
+            self.frontier.add(url)
+        return self._run(conditional=True, follow_links=False, limit=None)
+
+    def _run(self, conditional, follow_links, limit):
+        count = 0
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while pending or len(self.frontier):
+                # keep the pool busy without overshooting the page limit
+                while (len(self.frontier) and len(pending) < self.concurrency
+                       and (limit is None or count + len(pending) < limit)):
+                    url = self.frontier.pop()
+                    pending[pool.submit(self.fetch, url, conditional)] = url
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        status, page, links = future.result()
+                    except Exception as e:
+                        self._count("errors")
+                        print("Error fetching:", url, "|", e)
+                        continue
+
+                    if status == "skipped" or (limit is not None and count >= limit):
+                        continue
+                    if status == "gone":
+                        yield url, None
+                        continue
+                    if page is not None and self._is_duplicate(url, page):
+                        with self._commit_lock:
+                            self._uncommitted.pop(url, None)
+                        continue
+                    if follow_links:
+                        for link in links:
+                            self.frontier.add(link)
+                    count += 1
+                    if status != "unchanged":
+                        yield url, page
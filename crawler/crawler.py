@@ -1,19 +1,31 @@
 import requests
 from collections import deque
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+
+from crawler.dedup import NearDuplicateDetector
+from crawler.utils import USER_AGENT, parse_page
+from search.metrics import METRICS
 
 class Crawler:
-    def __init__(self, max_pages=50):
+    def __init__(self, max_pages=50, dedup=True):
         self.visited = set()
         self.queue = deque()
         self.max_pages = max_pages
+        self.dedup = NearDuplicateDetector() if dedup else None
+        self.stats = {"pages": 0, "duplicates": 0, "duplicate_rate": 0.0}
+        self.session = requests.Session()   # keep-alive across fetches
+        self.session.headers["User-Agent"] = USER_AGENT
 
     def crawl(self, start_url):
+        pages = dict(self.iter_pages(start_url))
+        print(f"Finished crawling {len(pages)} pages.", self.stats)
+        return pages
+
+    def iter_pages(self, start_url):
+        """Yield (url, page) as each page is fetched, without keeping them."""
         self.queue.append(start_url)
-        pages = {}
+        count = 0
 
-        while self.queue and len(pages) < self.max_pages:
+        while self.queue and count < self.max_pages:
             url = self.queue.popleft()
 
             if url in self.visited:
@@ -22,53 +34,39 @@ class Crawler:
             print("Crawling:", url)
 
             try:
-                headers = {"User-Agent": "Mozilla/5.0 (compatible; MiniSearchBot/1.0)"}
-                response = requests.get(url, headers=headers, timeout=7)
-                soup = BeautifulSoup(response.text, "html.parser")
-
-                content = soup.select_one("div.mw-parser-output")
-                if not content:
-                    continue
-
-                # Extract valid text
-                full_text = content.get_text(separator=" ", strip=True)
-
-                # Find first featured image
-                og_image = soup.find("meta", property="og:image")
-                image_url = og_image["content"] if og_image else None
-
-                if not image_url:
-                    first_img = content.find("img")
-                    if first_img and first_img.get("src", "").startswith("//"):
-                        image_url = "https:" + first_img["src"]
+                with METRICS.timer("crawler_fetch_seconds"):
+                    response = self.session.get(url, timeout=7)
+                METRICS.inc("crawler_responses_total", status=response.status_code)
+                self.visited.add(url)
 
-                # Derive category from URL
-                try:
-                    category = url.split("/wiki/")[1].split("_")[0]
-                except:
-                    category = "general"
+                # redirected onto a page we already crawled
+                if response.url != url:
+                    if response.url in self.visited:
+                        continue
+                    self.visited.add(response.url)
 
-                # Store result
-                pages[url] = {
-                    "title": soup.title.string if soup.title else url,
-                    "text": full_text,
-                    "image": image_url,
-                    "category": category.lower()
-                }
+                with METRICS.timer("crawler_parse_seconds"):
+                    page, links = parse_page(url, response.text)
+                if page is None:
+                    continue
 
-                self.visited.add(url)
+                # near-duplicate content (mirrors, printable variants, ...)
+                if self.dedup is not None:
+                    canonical = self.dedup.check(url, page["text"])
+                    self.stats["duplicates"] = self.dedup.duplicates
+                    self.stats["duplicate_rate"] = round(self.dedup.duplicate_rate(), 4)
+                    if canonical is not None:
+                        continue
 
                 # Queue discovery links
-                for link in soup.find_all("a", href=True):
-                    href = link["href"]
-                    if href.startswith("/wiki/") and ":" not in href:
-                        full_url = urljoin(url, href)
-                        if full_url not in self.visited:
-                            self.queue.append(full_url)
+                for full_url in links:
+                    if full_url not in self.visited:
+                        self.queue.append(full_url)
 
             except Exception as e:
                 print("Error fetching:", url, "|", e)
                 continue
 
-        print(f"Finished crawling {len(pages)} pages.")
-        return pages
+            count += 1
+            self.stats["pages"] = count
+            yield url, page
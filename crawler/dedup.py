@@ -0,0 +1,87 @@
+import hashlib
+import threading
+from collections import Counter
+
+from crawler.parser import clean
+
+FINGERPRINT_BITS = 64
+
+
+def _token_hash(token):
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(words):
+    """64-bit SimHash of a token list, weighted by term frequency."""
+    totals = [0] * FINGERPRINT_BITS
+    for token, count in Counter(words).items():
+        h = _token_hash(token)
+        for bit in range(FINGERPRINT_BITS):
+            if h >> bit & 1:
+                totals[bit] += count
+            else:
+                totals[bit] -= count
+
+    fingerprint = 0
+    for bit, total in enumerate(totals):
+        if total > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateDetector:
+    """SimHash fingerprints with LSH band buckets for near-duplicate lookup.
+
+    Fingerprints within ``max_distance`` bits of each other must agree
+    exactly on at least one of ``max_distance + 1`` bands (pigeonhole), so a
+    lookup only compares against docs sharing a band instead of every doc.
+    """
+
+    def __init__(self, max_distance=3, min_words=20):
+        self.max_distance = max_distance
+        self.min_words = min_words
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self.buckets = [{} for _ in range(self.bands)]   # band value -> [(fp, doc_id)]
+        self.canonical = {}                              # duplicate doc_id -> canonical doc_id
+        self.checked = 0
+        self._lock = threading.Lock()
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (b * self.band_bits)) & mask for b in range(self.bands)]
+
+    def check(self, doc_id, text):
+        """Register a doc; return the canonical doc_id if it is a near-duplicate.
+
+        Very short texts are never treated as duplicates, since a handful of
+        shared words says little about the page.
+        """
+        words = clean(text)
+        fingerprint = simhash(words)
+        keys = self._band_keys(fingerprint)
+
+        with self._lock:
+            self.checked += 1
+            if len(words) >= self.min_words:
+                for band, key in enumerate(keys):
+                    for other_fp, other_id in self.buckets[band].get(key, ()):
+                        if hamming(fingerprint, other_fp) <= self.max_distance:
+                            self.canonical[doc_id] = other_id
+                            return other_id
+
+            for band, key in enumerate(keys):
+                self.buckets[band].setdefault(key, []).append((fingerprint, doc_id))
+        return None
+
+    @property
+    def duplicates(self):
+        return len(self.canonical)
+
+    def duplicate_rate(self):
+        return self.duplicates / self.checked if self.checked else 0.0
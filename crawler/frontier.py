@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+from urllib import robotparser
+from urllib.parse import urlparse
+
+from crawler.utils import USER_AGENT, host_of
+
+
+class Frontier:
+    """FIFO crawl frontier that de-duplicates URLs when they are enqueued.
+
+    A URL is only ever queued once, so the queue never fills up with copies
+    of popular links the way a visited-check at dequeue time does.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.queue = deque()
+        self._lock = threading.Lock()
+
+    def add(self, url):
+        with self._lock:
+            if url in self.seen:
+                return False
+            self.seen.add(url)
+            self.queue.append(url)
+            return True
+
+    def mark_seen(self, url):
+        """Record a URL reached another way (e.g. a redirect); False if seen."""
+        with self._lock:
+            if url in self.seen:
+                return False
+            self.seen.add(url)
+            return True
+
+    def pop(self):
+        with self._lock:
+            return self.queue.popleft() if self.queue else None
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class HostLimiter:
+    """Per-host politeness: at least ``delay`` seconds between requests."""
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self._next_slot = {}          # host -> earliest time of next request
+        self._lock = threading.Lock()
+
+    def wait(self, host, delay=None):
+        """Block until this host may be fetched again (reserves the slot)."""
+        delay = self.delay if delay is None else delay
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RobotsCache:
+    """robots.txt rules per host, fetched once through the crawl session."""
+
+    def __init__(self, session, user_agent=USER_AGENT, timeout=7):
+        self.session = session
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def _parser(self, url):
+        host = host_of(url)
+        with self._lock:
+            if host in self._parsers:
+                return self._parsers[host]
+
+        parts = urlparse(url)
+        rp = robotparser.RobotFileParser()
+        try:
+            resp = self.session.get(f"{parts.scheme}://{parts.netloc}/robots.txt", timeout=self.timeout)
+            if resp.status_code >= 400:
+                rp.allow_all = True
+            else:
+                rp.parse(resp.text.splitlines())
+        except Exception:
+            rp.allow_all = True
+
+        with self._lock:
+            self._parsers[host] = rp
+        return rp
+
+    def allowed(self, url):
+        return self._parser(url).can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url):
+        return self._parser(url).crawl_delay(self.user_agent)
@@ -1,9 +1,10 @@
-import re
-
-STOPWORDS = {"the","is","are","a","an","and","of","to","in","on","for","with","by","at","from","as","this","that"}
+from crawler.analyzer import ANALYZER, STOPWORDS
 
 def clean(text):
-    text = text.lower()
-    text = re.sub(r'[^a-z0-9 ]', ' ', text)
-    words = text.split()
-    return [w for w in words if w not in STOPWORDS]
+    """Index terms of text (see crawler/analyzer.py)."""
+    return ANALYZER.tokens(text)
+
+
+def token_spans(text):
+    """Yield (start, end) character spans of the tokens clean() returns, in order."""
+    return ANALYZER.spans(text)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+STATE_PATH = "data/crawl_state.sqlite"
+
+
+def content_hash(page):
+    return hashlib.sha1(json.dumps(page, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """Persistent per-URL crawl record: fetch time, HTTP validators, content hash.
+
+    Lets a refresh send conditional requests (If-None-Match /
+    If-Modified-Since) and tell changed pages from unchanged ones.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY,"
+                " fetched_at REAL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " content_hash TEXT)"
+            )
+
+    def close(self):
+        self._db.close()
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fetched_at, etag, last_modified, content_hash FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("fetched_at", "etag", "last_modified", "content_hash"), row))
+
+    def conditional_headers(self, url):
+        record = self.get(url)
+        headers = {}
+        if record:
+            if record["etag"]:
+                headers["If-None-Match"] = record["etag"]
+            if record["last_modified"]:
+                headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def record(self, url, etag, last_modified, page_hash):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (url, time.time(), etag, last_modified, page_hash),
+            )
+
+    def touch(self, url):
+        """Mark a URL as re-checked (e.g. after a 304) without other changes."""
+        with self._lock, self._db:
+            self._db.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def remove(self, url):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    def urls(self, fetched_before=None):
+        """Known URLs, oldest fetch first; optionally only those due a refresh."""
+        query = "SELECT url FROM pages"
+        args = ()
+        if fetched_before is not None:
+            query += " WHERE fetched_at < ?"
+            args = (fetched_before,)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY fetched_at", args).fetchall()
+        return [url for (url,) in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
@@ -0,0 +1,54 @@
+from urllib.parse import urljoin, urldefrag, urlparse
+
+from bs4 import BeautifulSoup
+
+USER_AGENT = "Mozilla/5.0 (compatible; MiniSearchBot/1.0)"
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+def extract_links(url, soup):
+    """Absolute article links found on a page (namespaced pages skipped)."""
+    links = []
+    for link in soup.find_all("a", href=True):
+        href = link["href"]
+        if href.startswith("/wiki/") and ":" not in href:
+            links.append(urldefrag(urljoin(url, href))[0])
+    return links
+
+
+def parse_page(url, html):
+    """Parse a fetched article into (page, links); page is None if unusable."""
+    soup = BeautifulSoup(html, "html.parser")
+
+    content = soup.select_one("div.mw-parser-output")
+    if not content:
+        return None, []
+
+    # Extract valid text
+    full_text = content.get_text(separator=" ", strip=True)
+
+    # Find first featured image
+    og_image = soup.find("meta", property="og:image")
+    image_url = og_image["content"] if og_image else None
+
+    if not image_url:
+        first_img = content.find("img")
+        if first_img and first_img.get("src", "").startswith("//"):
+            image_url = "https:" + first_img["src"]
+
+    # Derive category from URL
+    try:
+        category = url.split("/wiki/")[1].split("_")[0]
+    except IndexError:
+        category = "general"
+
+    page = {
+        "title": soup.title.string if soup.title else url,
+        "text": full_text,
+        "image": image_url,
+        "category": category.lower()
+    }
+    return page, extract_links(url, soup)
@@ -0,0 +1,149 @@
+import argparse
+import os
+import shutil
+import time
+from itertools import islice
+from multiprocessing import Pool
+
+from indexer.frozen import FrozenIndex
+from indexer.segments import SEGMENTS_DIR, SegmentedIndex, freeze_pages, merge_docs
+from indexer.storage import load_segment, save_segment, segment_files
+
+TRIE_FILE = "autocomplete.trie"
+SPELLER_FILE = "speller.tables"
+
+
+# ---------------------------
+# Map: pages -> partial segments
+# ---------------------------
+def _build_part(task):
+    path, pages, positional = task
+    save_segment(freeze_pages(pages, positional=positional), pages, path)
+    return path
+
+
+# ---------------------------
+# Reduce: k-way merge of partial segments
+# ---------------------------
+def _merge_parts(paths):
+    """Merge opened segments into one FrozenIndex; returns (frozen, (url, page)
+    pairs), the pairs read from the parts' doc stores as they are written."""
+    opened = [load_segment(p) for p in paths]
+    frozen = FrozenIndex.merge([(segment, None) for segment, _ in opened])
+    return frozen, merge_docs([(store, segment.doc_ids) for segment, store in opened])
+
+
+def _merge_task(task):
+    paths, out = task
+    frozen, docs = _merge_parts(paths)
+    save_segment(frozen, docs, out)
+    for path in paths:
+        for name in segment_files(path):
+            if os.path.exists(name):
+                os.remove(name)
+    return out
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = dict(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _deletes_task(task):
+    from search.spell import build_deletes
+
+    words, max_distance, prefix_length = task
+    return build_deletes(words, max_distance, prefix_length)
+
+
+def build_index(pages, out, processes=None, chunk_docs=2000, fan_in=4, positional=True):
+    """Build ``out`` (a fresh segments directory) from (url, page) pairs.
+
+    Map: chunks of ``chunk_docs`` pages are indexed into partial segments
+    by a pool of ``processes`` workers. Reduce: partial segments are
+    k-way merged (FrozenIndex.merge) ``fan_in`` at a time, in parallel,
+    until one segment remains. The autocomplete trie and the speller
+    tables are then built from its vocabulary -- the speller's delete
+    table sharded over the same pool -- and saved next to it, stamped with
+    the index version so the server loads them instead of rebuilding.
+    """
+    processes = processes or os.cpu_count()
+    if os.path.exists(out):
+        raise FileExistsError("%s already exists" % out)
+    work = out + ".parts"
+    os.makedirs(work)
+    started = time.time()
+
+    with Pool(processes) as pool:
+        tasks = (
+            (os.path.join(work, "part_%06d" % i), chunk, positional)
+            for i, chunk in enumerate(_chunks(pages, chunk_docs))
+        )
+        paths = sorted(pool.imap_unordered(_build_part, tasks))
+        print(f"Indexed {len(paths)} partial segments in {time.time() - started:.1f}s.")
+
+        level = 0
+        while len(paths) > fan_in:
+            level += 1
+            groups = [paths[i:i + fan_in] for i in range(0, len(paths), fan_in)]
+            tasks = [(g, os.path.join(work, "merge%d_%06d" % (level, i))) for i, g in enumerate(groups)]
+            paths = pool.map(_merge_task, tasks)
+            print(f"Merge level {level}: {len(paths)} segments.")
+
+        index = SegmentedIndex(out, positional=positional)
+        if paths:
+            index.add_segment(*_merge_parts(paths))
+        shutil.rmtree(work)
+        print(f"Built {out}: {len(index)} docs in {time.time() - started:.1f}s.")
+
+        words = save_word_tables(index, pool, processes)
+        print(f"Autocomplete and speller built for {len(words)} words in {time.time() - started:.1f}s.")
+    return index
+
+
+def save_word_tables(index, pool=None, processes=1):
+    """Build the autocomplete trie and speller tables of a SegmentedIndex and
+    save them in its directory, stamped with its version so the server
+    loads them instead of rebuilding. The speller's delete table is sharded
+    over ``pool`` if given. Returns the vocabulary's weights."""
+    from search.autocomplete import Trie
+    from search.spell import Speller
+
+    weights = {w: index.df(w) for w in index.vocabulary()}
+    Trie(weights).save(os.path.join(index.directory, TRIE_FILE), version=index.version)
+
+    words = list(weights)
+    shard = max(1, -(-len(words) // processes))
+    tasks = [(words[i:i + shard], 2, 7) for i in range(0, len(words), shard)]
+    deletes = {}
+    for part in (pool.imap(_deletes_task, tasks) if pool is not None else map(_deletes_task, tasks)):
+        for key, found in part.items():
+            deletes.setdefault(key, []).extend(found)
+    Speller(weights, 2, 7, _deletes=deletes).save(os.path.join(index.directory, SPELLER_FILE),
+                                                   version=index.version)
+    return weights
+
+
+def main():
+    """Rebuild a segments directory from stored pages (python -m indexer.build)."""
+    parser = argparse.ArgumentParser(description="Parallel bulk (re)index of stored pages.")
+    parser.add_argument("--source", default=SEGMENTS_DIR, help="segments directory to read pages from")
+    parser.add_argument("--out", default=SEGMENTS_DIR + ".rebuilt")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-docs", type=int, default=2000)
+    parser.add_argument("--fan-in", type=int, default=4)
+    parser.add_argument("--no-positions", action="store_true")
+    args = parser.parse_args()
+
+    source = SegmentedIndex(args.source)
+    build_index(source.docs.items(), args.out, args.processes, args.chunk_docs,
+                args.fan_in, positional=not args.no_positions)
+    print(f"Move {args.out} to {args.source} (with the server stopped) to serve it.")
+
+
+if __name__ == "__main__":
+    main()
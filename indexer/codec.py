@@ -0,0 +1,144 @@
+import shutil
+from bisect import bisect_left
+
+import numpy as np
+
+
+# ---------------------------
+# Varint (LEB128) coding
+# ---------------------------
+def varint_sizes(values):
+    """Number of bytes each value takes when varint-encoded."""
+    v = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(v), dtype=np.int64)
+    rest = v >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    return nbytes
+
+
+def encode_varints(values):
+    """Encode non-negative integers as little-endian base-128 varints."""
+    v = np.asarray(values, dtype=np.uint64)
+    if not len(v):
+        return b""
+
+    nbytes = varint_sizes(v)
+    starts = np.concatenate(([0], np.cumsum(nbytes)[:-1]))
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for b in range(int(nbytes.max())):
+        sel = nbytes > b
+        chunk = (v[sel] >> np.uint64(7 * b)) & np.uint64(0x7F)
+        more = (nbytes[sel] - 1 > b).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + b] = chunk | more
+    return out.tobytes()
+
+
+def decode_varints(buf):
+    """Decode a buffer of varints into a uint64 array (vectorized)."""
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if not len(b):
+        return np.zeros(0, dtype=np.uint64)
+
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = ((np.arange(len(b)) - starts[group]) * 7).astype(np.uint64)
+    parts = (b & 0x7F).astype(np.uint64) << shift
+    return np.add.reduceat(parts, starts)
+
+
+# ---------------------------
+# String tables
+# ---------------------------
+def pack_strings(strings):
+    """Return (offsets, blob) for a list of strings stored back to back."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return offsets, b"".join(encoded)
+
+
+class StringTable:
+    """List-like, zero-copy view over strings packed by pack_strings."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def find(self, s):
+        """Binary search a sorted table; return the position of s or -1."""
+        i = bisect_left(self, s)
+        if i < len(self) and self[i] == s:
+            return i
+        return -1
+
+
+# ---------------------------
+# Section file layout
+# ---------------------------
+def _pad(n):
+    return (-n) % 8
+
+
+def _section_len(data):
+    return data.seek(0, 2) if hasattr(data, "seek") else len(data)
+
+
+def write_sections(f, magic, counts, sections):
+    """Write a header followed by 8-byte aligned sections.
+
+    Header: magic (4 bytes), section count, the given counts, then an
+    (offset, length) pair per section. A section is bytes or a binary file
+    (copied from its start), for data too big to join in memory.
+    """
+    header_len = 4 + 8 + 8 * len(counts) + 16 * len(sections)
+    pos = header_len + _pad(header_len)
+    table = []
+    lengths = [_section_len(data) for data in sections]
+    for n in lengths:
+        table.append((pos, n))
+        pos += n + _pad(n)
+
+    f.write(magic)
+    f.write(np.array([len(sections)], dtype=np.uint64).tobytes())
+    f.write(np.array(counts, dtype=np.uint64).tobytes())
+    f.write(np.array(table, dtype=np.uint64).reshape(-1).tobytes())
+    f.write(b"\0" * _pad(header_len))
+    for data, n in zip(sections, lengths):
+        if hasattr(data, "seek"):
+            data.seek(0)
+            shutil.copyfileobj(data, f)
+        else:
+            f.write(data)
+        f.write(b"\0" * _pad(n))
+
+
+def read_sections(buf, magic, n_counts):
+    """Return (counts, [memoryview per section]) for a buffer written above."""
+    if bytes(buf[:4]) != magic:
+        raise ValueError("bad file magic: expected %r" % magic)
+    n_sections = int(np.frombuffer(buf, dtype=np.uint64, count=1, offset=4)[0])
+    counts = [int(c) for c in np.frombuffer(buf, dtype=np.uint64, count=n_counts, offset=12)]
+    table = np.frombuffer(buf, dtype=np.uint64, count=2 * n_sections, offset=12 + 8 * n_counts)
+    view = memoryview(buf)
+    sections = [view[int(off):int(off) + int(length)] for off, length in table.reshape(-1, 2)]
+    return counts, sections
@@ -0,0 +1,283 @@
+import json
+import mmap
+import re
+import tempfile
+import zlib
+from bisect import bisect_right
+from collections.abc import Mapping
+
+import numpy as np
+
+from crawler.analyzer import TOKEN_CHARS
+from indexer.codec import StringTable, pack_strings, read_sections, write_sections
+
+DOCSTORE_MAGIC = b"MDC2"
+LEGACY_MAGIC = b"MDOC"          # one plain JSON record per page
+
+BLOCK_DOCS = 32                 # pages per compressed block of small fields
+TEXT_CHUNK = 4096               # chars per independently compressed text chunk
+LEVEL = 6
+
+# last char that cannot be part of a token (see crawler/analyzer.py)
+_LAST_BREAK = re.compile(r"[^%s][%s]*$" % (TOKEN_CHARS, TOKEN_CHARS))
+_BREAK = re.compile(r"[^%s]" % TOKEN_CHARS)
+
+
+def split_text(text, size=TEXT_CHUNK):
+    """Cut text into pieces of about ``size`` chars, between tokens, so
+    each piece can be tokenized on its own."""
+    pieces = []
+    start, n = 0, len(text)
+    while start < n:
+        end = min(n, start + size)
+        if end < n:
+            m = _LAST_BREAK.search(text, start, end)
+            if m is not None and m.start() > start:
+                end = m.start() + 1
+            else:
+                # one token longer than size: run on to its end
+                m = _BREAK.search(text, end)
+                end = m.start() + 1 if m is not None else n
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+def write_doc_store(path, docs):
+    """Write {url: page}, or (url, page) pairs in url order, as a doc store.
+
+    Urls are sorted. Every field but the text is JSON, zlib-compressed in
+    blocks of BLOCK_DOCS pages; the text is cut into TEXT_CHUNK pieces
+    compressed one by one, so a reader inflates only what it touches.
+    Pages read from another doc store have their compressed chunks copied
+    across as they are, and pairs are consumed one at a time, so a merge
+    never holds (or inflates) more than one page's text.
+    """
+    pages = ((url, docs[url]) for url in sorted(docs)) if isinstance(docs, Mapping) else docs
+
+    urls = []
+    blocks, block_offsets = [], [0]
+    text_lengths = []                   # -1: no text
+    doc_chunks = [0]                    # first chunk of each doc
+    chunk_starts, chunk_offsets = [], [0]
+    records = []
+    with tempfile.TemporaryFile() as chunks:
+        for url, page in pages:
+            if urls and url <= urls[-1]:
+                raise ValueError("doc store urls must be unique and sorted: %r after %r" % (url, urls[-1]))
+            urls.append(url)
+            text = page.lazy("text") if isinstance(page, StoredPage) and "text" in page else page.get("text")
+            records.append({k: page[k] for k in page if k != "text"})
+            if isinstance(text, StoredText):
+                text_lengths.append(len(text))
+                pieces = text.raw_chunks()
+            elif isinstance(text, str):
+                text_lengths.append(len(text))
+                pieces = _compressed_pieces(text)
+            else:
+                text_lengths.append(-1)
+                if "text" in page:
+                    records[-1]["text"] = text
+                pieces = ()
+            for start, blob in pieces:
+                chunk_starts.append(start)
+                chunks.write(blob)
+                chunk_offsets.append(chunk_offsets[-1] + len(blob))
+            doc_chunks.append(len(chunk_starts))
+            if len(records) == BLOCK_DOCS:
+                blocks.append(_compress_block(records))
+                block_offsets.append(block_offsets[-1] + len(blocks[-1]))
+                records = []
+        if records:
+            blocks.append(_compress_block(records))
+            block_offsets.append(block_offsets[-1] + len(blocks[-1]))
+
+        url_offsets, url_blob = pack_strings(urls)
+        sections = [
+            url_offsets.tobytes(), url_blob,
+            np.array(block_offsets, dtype=np.uint64).tobytes(), b"".join(blocks),
+            np.array(text_lengths, dtype=np.int64).tobytes(),
+            np.array(doc_chunks, dtype=np.uint64).tobytes(),
+            np.array(chunk_starts, dtype=np.uint64).tobytes(),
+            np.array(chunk_offsets, dtype=np.uint64).tobytes(), chunks,
+        ]
+        with open(path, "wb") as f:
+            write_sections(f, DOCSTORE_MAGIC, [len(urls), BLOCK_DOCS], sections)
+
+
+def _compress_block(records):
+    return zlib.compress(json.dumps(records, ensure_ascii=False).encode("utf-8"), LEVEL)
+
+
+def _compressed_pieces(text):
+    pos = 0
+    for piece in split_text(text):
+        yield pos, zlib.compress(piece.encode("utf-8"), LEVEL)
+        pos += len(piece)
+
+
+class StoredText:
+    """One page's text, inflated chunk by chunk as it is read."""
+
+    def __init__(self, store, i):
+        self._store = store
+        self._i = i
+        self._pieces = {}
+
+    def __len__(self):
+        return int(self._store._text_lengths[self._i])
+
+    def _piece(self, c):
+        piece = self._pieces.get(c)
+        if piece is None:
+            piece = self._pieces[c] = self._store._chunk(c)
+        return piece
+
+    def chunks(self):
+        """(char offset, piece) pairs in order; pieces break between tokens."""
+        store = self._store
+        first, last = int(store._doc_chunks[self._i]), int(store._doc_chunks[self._i + 1])
+        for c in range(first, last):
+            yield int(store._chunk_starts[c]), self._piece(c)
+
+    def window(self, start, end):
+        """text[start:end], inflating only the chunks it overlaps."""
+        store = self._store
+        first, last = int(store._doc_chunks[self._i]), int(store._doc_chunks[self._i + 1])
+        starts = store._chunk_starts[first:last]
+        lo = max(0, bisect_right(starts, start) - 1)
+        hi = bisect_right(starts, max(start, end - 1))
+        base = int(starts[lo]) if lo < len(starts) else 0
+        text = "".join(self._piece(first + c) for c in range(lo, hi))
+        return text[start - base:end - base]
+
+    def raw_chunks(self):
+        """(char offset, compressed piece) pairs, for copying to another store."""
+        store = self._store
+        first, last = int(store._doc_chunks[self._i]), int(store._doc_chunks[self._i + 1])
+        for c in range(first, last):
+            start, end = int(store._chunk_offsets[c]), int(store._chunk_offsets[c + 1])
+            yield int(store._chunk_starts[c]), bytes(store._chunks[start:end])
+
+    def __str__(self):
+        return "".join(piece for _, piece in self.chunks())
+
+
+class StoredPage(Mapping):
+    """A page read from a DocStore: small fields parsed from their block,
+    the text inflated only when it is asked for."""
+
+    def __init__(self, store, i, fields):
+        self._store = store
+        self._i = i
+        self._fields = fields
+        self._text = None
+
+    def _has_text(self):
+        return self._store._text_lengths[self._i] >= 0
+
+    def lazy(self, key):
+        """Like page[key], but the text comes back as a StoredText."""
+        if key == "text" and self._has_text():
+            return StoredText(self._store, self._i)
+        return self._fields[key]
+
+    def __getitem__(self, key):
+        if key == "text" and self._has_text():
+            if self._text is None:
+                self._text = str(StoredText(self._store, self._i))
+            return self._text
+        return self._fields[key]
+
+    def __reduce__(self):
+        # pickles (to pool workers, shard clients) as a plain dict, text included
+        return dict, (dict(self),)
+
+    def __contains__(self, key):
+        # without this, Mapping would read (and inflate) the text to check
+        if key == "text" and self._has_text():
+            return True
+        return key in self._fields
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __iter__(self):
+        yield from self._fields
+        if self._has_text():
+            yield "text"
+
+    def __len__(self):
+        return len(self._fields) + bool(self._has_text())
+
+
+class DocStore(Mapping):
+    """Read-only {url: page} mapping backed by an mmap'd doc store file.
+
+    Opening the store costs nothing: lookups binary-search the url table,
+    inflate one block of small fields and return a StoredPage whose text
+    is inflated on access (or only a window of it, for snippets). Stores
+    written in the older uncompressed format are still readable.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if bytes(self._mmap[:4]) == LEGACY_MAGIC:
+            _, s = read_sections(self._mmap, LEGACY_MAGIC, 1)
+            self.urls = StringTable(np.frombuffer(s[0], dtype=np.uint64), s[1])
+            self._records = StringTable(np.frombuffer(s[2], dtype=np.uint64), s[3])
+            return
+        self._records = None
+        self._last_block = (-1, None)   # scans read the same block BLOCK_DOCS times
+        counts, s = read_sections(self._mmap, DOCSTORE_MAGIC, 2)
+        self.block_docs = counts[1]
+        self.urls = StringTable(np.frombuffer(s[0], dtype=np.uint64), s[1])
+        self._block_offsets = np.frombuffer(s[2], dtype=np.uint64)
+        self._blocks = s[3]
+        self._text_lengths = np.frombuffer(s[4], dtype=np.int64)
+        self._doc_chunks = np.frombuffer(s[5], dtype=np.uint64)
+        self._chunk_starts = np.frombuffer(s[6], dtype=np.uint64)
+        self._chunk_offsets = np.frombuffer(s[7], dtype=np.uint64)
+        self._chunks = s[8]
+
+    def close(self):
+        self._file.close()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass                        # still viewed: unmapped when freed (see Segment.close)
+
+    def _block(self, b):
+        last, records = self._last_block
+        if last != b:
+            start, end = int(self._block_offsets[b]), int(self._block_offsets[b + 1])
+            records = json.loads(zlib.decompress(self._blocks[start:end]))
+            self._last_block = (b, records)
+        return records
+
+    def _chunk(self, c):
+        start, end = int(self._chunk_offsets[c]), int(self._chunk_offsets[c + 1])
+        return zlib.decompress(self._chunks[start:end]).decode("utf-8")
+
+    def __getitem__(self, url):
+        i = self.urls.find(url)
+        if i < 0:
+            raise KeyError(url)
+        if self._records is not None:
+            return json.loads(self._records[i])
+        b, r = divmod(i, self.block_docs)
+        return StoredPage(self, i, self._block(b)[r])
+
+    def __contains__(self, url):
+        return self.urls.find(url) >= 0
+
+    def __iter__(self):
+        return iter(self.urls)
+
+    def __len__(self):
+        return len(self.urls)
@@ -0,0 +1,91 @@
+import mmap
+
+import numpy as np
+
+from indexer.codec import StringTable, pack_strings, read_sections, write_sections
+
+FACETS_MAGIC = b"FCT1"
+
+
+class FacetColumn:
+    """One categorical value per doc ordinal, like Lucene's sorted doc values.
+
+    ``codes[ord]`` indexes the sorted ``values`` table (-1: no value). A
+    filter is a vectorized compare giving a bool mask over the ordinals --
+    the per-value bitset -- which is cached, so category filters can be
+    ANDed with live / phrase masks before any posting is scored.
+    """
+
+    def __init__(self, values, codes):
+        self.values = values                    # sorted value strings
+        self.codes = codes                      # int32 per doc ordinal
+        self._masks = {}
+
+    @classmethod
+    def build(cls, doc_ids, docs, field):
+        """Column for ``field`` of each page, in doc ordinal order."""
+        raw = []
+        for doc_id in doc_ids:
+            value = docs.get(doc_id, {}).get(field)
+            raw.append(str(value) if value else None)
+        values = sorted({v for v in raw if v is not None})
+        code_of = {v: i for i, v in enumerate(values)}
+        codes = np.array([code_of[v] if v is not None else -1 for v in raw], dtype=np.int32)
+        return cls(values, codes)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        if isinstance(self.values, StringTable):
+            return self.values.find(value)
+        try:
+            return self.values.index(value)
+        except ValueError:
+            return -1
+
+    def mask(self, value):
+        """bool array over doc ordinals: True where the doc has ``value``."""
+        mask = self._masks.get(value)
+        if mask is None:
+            code = self.code(value)
+            if code < 0:
+                mask = np.zeros(len(self.codes), dtype=bool)
+            else:
+                mask = self.codes == code
+            if len(self._masks) >= 64:
+                self._masks.clear()
+            self._masks[value] = mask
+        return mask
+
+    def counts(self, mask=None):
+        """{value: docs} over the docs selected by ``mask`` (all if None)."""
+        codes = self.codes if mask is None else self.codes[mask]
+        codes = codes[codes >= 0]
+        totals = np.bincount(codes, minlength=len(self.values))
+        return {self.values[i]: int(n) for i, n in enumerate(totals) if n}
+
+
+def write_facets(path, facets):
+    """Write {field: FacetColumn} to one file (fields in sorted order)."""
+    names = sorted(facets)
+    sections = []
+    for name in names:
+        offsets, blob = pack_strings(list(facets[name].values))
+        sections += [offsets.tobytes(), blob, np.asarray(facets[name].codes, dtype=np.int32).tobytes()]
+    name_offsets, name_blob = pack_strings(names)
+    with open(path, "wb") as f:
+        write_sections(f, FACETS_MAGIC, [len(names)], [name_offsets.tobytes(), name_blob] + sections)
+
+
+def read_facets(path):
+    """Open a facets file via mmap; returns {field: FacetColumn}."""
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    counts, s = read_sections(buf, FACETS_MAGIC, 1)
+    names = StringTable(np.frombuffer(s[0], dtype=np.uint64), s[1])
+    facets = {}
+    for i in range(counts[0]):
+        values = StringTable(np.frombuffer(s[2 + 3 * i], dtype=np.uint64), s[3 + 3 * i])
+        facets[names[i]] = FacetColumn(values, np.frombuffer(s[4 + 3 * i], dtype=np.int32))
+    return facets
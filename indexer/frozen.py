@@ -0,0 +1,442 @@
+import heapq
+from bisect import bisect_left
+from collections import Counter
+from itertools import groupby
+
+import numpy as np
+
+from search.metrics import count
+from search.topk import max_score_top_k
+
+
+class FrozenIndex:
+    """Read-only, array-backed view of an InvertedIndex.
+
+    Postings for each term are stored as contiguous slices of two flat arrays
+    (doc ordinals sorted ascending, term frequencies). idf and the per-posting
+    ``tf / doc_length`` weights are computed once at freeze time, so scoring a
+    query term is a single vectorized accumulate.
+
+    Doc ids and terms are kept in sorted order, so both can be looked up by
+    binary search once written to a segment file.
+
+    Scoring methods take two optional overrides used when several indexes
+    are queried together: ``idf`` (term -> idf from global statistics) and
+    ``allowed`` (bool array over doc ordinals; False docs are skipped).
+
+    ``facets`` maps a page field (the category) to a FacetColumn over the
+    same ordinals (indexer/facets.py); ``filters=`` ({field: value}) turns
+    them into masks ANDed with ``allowed`` before scoring.
+
+    Token positions are optional: ``positions`` holds every posting's
+    positions back to back (tfs[i] of them for posting i), enabling phrase
+    filters (``phrases=``) and doc_positions() for proximity and snippets.
+
+    ``fields`` holds optional per-field indexes over the same doc ordinals
+    (the page title), used by BM25F; ``scorer=`` picks a ranking function
+    from search/ranking.py.
+    """
+
+    def __init__(self, doc_ids, doc_lengths, terms, offsets, doc_ords, tfs, positions=None):
+        self.doc_ids = list(doc_ids)                      # ordinal -> doc_id
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.int32)
+        self.terms = terms                                # term -> term ordinal
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ords = np.asarray(doc_ords, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.int32)
+
+        self.total_docs = len(self.doc_ids)
+        self.dfs = np.diff(self.offsets)
+        self.doc_norms = 1.0 / np.maximum(self.doc_lengths, 1)
+        self.weights = self.tfs * self.doc_norms[self.doc_ords]
+        self.idfs = self._idf(self.dfs, self.total_docs)
+        # per-term upper bound of tf / doc_length, for top-k pruning
+        self.max_weights = (
+            np.maximum.reduceat(self.weights, self.offsets[:-1])
+            if len(self.weights) else np.zeros(0)
+        )
+
+        self.fields = {}                # extra fields, e.g. "title" -> FrozenIndex
+        self.facets = {}                # filter fields, e.g. "category" -> FacetColumn
+        self._norms = {}
+
+        self.positions = None
+        self.pos_offsets = None
+        if positions is not None:
+            self.positions = np.asarray(positions, dtype=np.int32)
+            self.pos_offsets = np.concatenate(([0], np.cumsum(self.tfs, dtype=np.int64)))
+
+    @classmethod
+    def from_index(cls, idx):
+        doc_ids = sorted(idx.doc_lengths)
+        ordinal = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        doc_lengths = [idx.doc_lengths[d] for d in doc_ids]
+
+        term_positions = getattr(idx, "positions", None)
+        terms = {}
+        offsets = [0]
+        doc_ords = []
+        tfs = []
+        positions = [] if term_positions is not None else None
+        for term in sorted(idx.index):
+            postings = sorted((ordinal[d], tf, d) for d, tf in idx.index[term].items())
+            if not postings:
+                continue
+            terms[term] = len(terms)
+            for o, tf, d in postings:
+                doc_ords.append(o)
+                tfs.append(tf)
+                if positions is not None:
+                    positions.extend(term_positions[term][d])
+            offsets.append(len(doc_ords))
+
+        return cls(doc_ids, doc_lengths, terms, offsets, doc_ords, tfs, positions)
+
+    @classmethod
+    def merge(cls, parts):
+        """K-way merge of frozen indexes into one, dropping excluded docs.
+
+        ``parts`` is a list of ``(frozen, allowed)`` pairs where ``allowed``
+        is a bool mask over that part's doc ordinals (None keeps all). A doc
+        id must be live in at most one part.
+        """
+        parts = [(part.materialize(), allowed) for part, allowed in parts]
+        live = []
+        for p, (part, allowed) in enumerate(parts):
+            keep = np.ones(part.total_docs, dtype=bool) if allowed is None else allowed
+            live.extend((part.doc_ids[o], p, o) for o in np.flatnonzero(keep))
+        live.sort()
+
+        remap = [np.full(part.total_docs, -1, dtype=np.int64) for part, _ in parts]
+        doc_lengths = np.zeros(len(live), dtype=np.int32)
+        for new, (_, p, old) in enumerate(live):
+            remap[p][old] = new
+            doc_lengths[new] = parts[p][0].doc_lengths[old]
+
+        positional = all(part.has_positions for part, _ in parts)
+        terms = {}
+        offsets = [0]
+        doc_ords = []
+        tfs = []
+        positions = []
+        # (term, part, term ordinal) in term order: no per-part term lookups
+        vocabularies = [_numbered_terms(part, p) for p, (part, _) in enumerate(parts)]
+        for term, group in groupby(heapq.merge(*vocabularies), key=lambda x: x[0]):
+            ords_parts, tfs_parts, pos_parts = [], [], []
+            for _, p, t in group:
+                raw = parts[p][0].postings_at(t, positional)
+                ords_parts.append(remap[p][raw[0]])
+                tfs_parts.append(raw[1])
+                if positional:
+                    pos_parts.append(raw[2])
+            if not ords_parts:
+                continue
+            ords = np.concatenate(ords_parts)
+            term_tfs = np.concatenate(tfs_parts)
+            keep = np.flatnonzero(ords >= 0)
+            if not len(keep):
+                continue
+            order = keep[np.argsort(ords[keep], kind="stable")]
+            terms[term] = len(terms)
+            doc_ords.append(ords[order])
+            tfs.append(term_tfs[order])
+            offsets.append(offsets[-1] + len(order))
+            if positional:
+                starts = np.concatenate(([0], np.cumsum(term_tfs, dtype=np.int64)))
+                positions.append(_gather_runs(np.concatenate(pos_parts), starts, term_tfs, order))
+
+        doc_ords = np.concatenate(doc_ords) if doc_ords else np.zeros(0, dtype=np.int32)
+        tfs = np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.int32)
+        if positional:
+            positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int32)
+        else:
+            positions = None
+        merged = cls([d for d, _, _ in live], doc_lengths, terms, offsets, doc_ords, tfs, positions)
+
+        # fields share the doc ordinals of their index, so the same masks apply
+        names = set.intersection(*(set(part.fields) for part, _ in parts)) if parts else ()
+        for name in sorted(names):
+            merged.fields[name] = FrozenIndex.merge(
+                [(part.fields[name], allowed) for part, allowed in parts]
+            )
+        return merged
+
+    @staticmethod
+    def _idf(dfs, total_docs):
+        with np.errstate(divide="ignore"):
+            return np.log(total_docs / np.maximum(dfs, 1))
+
+    def __len__(self):
+        return self.total_docs
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def vocabulary(self):
+        """Terms in sorted order."""
+        return iter(self.terms)
+
+    def df(self, term):
+        t = self.terms.get(term)
+        return 0 if t is None else int(self.dfs[t])
+
+    def doc_ordinal(self, doc_id):
+        """Ordinal of doc_id, or -1 if this index does not hold it."""
+        i = bisect_left(self.doc_ids, doc_id)
+        if i < len(self.doc_ids) and self.doc_ids[i] == doc_id:
+            return i
+        return -1
+
+    def materialize(self):
+        """In-memory FrozenIndex of this index (see Segment.materialize)."""
+        return self
+
+    def raw_postings(self, term):
+        """Return (doc_ords, tfs) for a term, or None."""
+        t = self.terms.get(term)
+        if t is None:
+            return None
+        return self.postings_at(t)
+
+    def postings_at(self, t, positional=False):
+        """(doc_ords, tfs[, positions]) of the term with ordinal t.
+
+        Terms are numbered in sorted order, so ordinal i is the i-th term of
+        vocabulary(); merges walk them without looking terms up.
+        """
+        start, end = self.offsets[t], self.offsets[t + 1]
+        if not positional:
+            return self.doc_ords[start:end], self.tfs[start:end]
+        return (self.doc_ords[start:end], self.tfs[start:end],
+                self.positions[self.pos_offsets[start]:self.pos_offsets[end]])
+
+    def postings(self, term):
+        """Return (doc_ords, weights, idf) slices for a term, or None."""
+        t = self.terms.get(term)
+        if t is None:
+            return None
+        start, end = self.offsets[t], self.offsets[t + 1]
+        return self.doc_ords[start:end], self.weights[start:end], self.idfs[t]
+
+    def total_length(self):
+        return int(np.sum(self.doc_lengths, dtype=np.int64))
+
+    def avg_length(self):
+        return self.total_length() / self.total_docs if self.total_docs else 1.0
+
+    def length_norms(self, b, avgdl):
+        """Per-doc BM25 length factor 1 - b + b * len / avgdl, cached."""
+        key = (b, avgdl)
+        norms = self._norms.get(key)
+        if norms is None:
+            norms = 1.0 - b + b * self.doc_lengths / max(avgdl, 1e-9)
+            # avgdl only changes when the collection does: keep the latest few
+            if len(self._norms) >= 4:
+                self._norms.clear()
+            self._norms[key] = norms
+        return norms
+
+    @property
+    def has_positions(self):
+        return self.positions is not None
+
+    def positional_postings(self, term):
+        """Return (doc_ords, tfs, positions) for a term, or None.
+
+        None as well when the index was built without positions.
+        """
+        t = self.terms.get(term)
+        if t is None or not self.has_positions:
+            return None
+        start, end = self.offsets[t], self.offsets[t + 1]
+        return (self.doc_ords[start:end], self.tfs[start:end],
+                self.positions[self.pos_offsets[start]:self.pos_offsets[end]])
+
+    def phrase_mask(self, words):
+        """Bool mask over doc ordinals of docs containing ``words`` in order.
+
+        Returns None if the index has no positions.
+        """
+        if not self.has_positions:
+            return None
+        mask = np.zeros(self.total_docs, dtype=bool)
+        keys = None
+        for i, word in enumerate(words):
+            p = self.positional_postings(word)
+            if p is None:
+                return mask
+            ords, tfs, pos = p
+            # (doc, position the phrase would start at) packed in one int64
+            start = pos.astype(np.int64) - i
+            ok = start >= 0
+            k = (np.repeat(ords.astype(np.int64), tfs)[ok] << 32) + start[ok]
+            keys = k if keys is None else np.intersect1d(keys, k, assume_unique=True)
+            if not len(keys):
+                return mask
+        if keys is not None:
+            mask[keys >> 32] = True
+        return mask
+
+    def doc_positions(self, words, doc_ids):
+        """Return {doc_id: {word: positions}} for the docs held here."""
+        found = [(d, self.doc_ordinal(d)) for d in doc_ids]
+        found = [(d, o) for d, o in found if o >= 0]
+        out = {d: {} for d, _ in found}
+        if not found or not self.has_positions:
+            return out
+        for word in set(words):
+            p = self.positional_postings(word)
+            if p is None:
+                continue
+            ords, tfs, pos = p
+            starts = np.concatenate(([0], np.cumsum(tfs, dtype=np.int64)))
+            for d, o in found:
+                i = int(np.searchsorted(ords, o))
+                if i < len(ords) and ords[i] == o:
+                    out[d][word] = pos[starts[i]:starts[i + 1]]
+        return out
+
+    def _with_phrases(self, allowed, phrases):
+        for phrase in phrases:
+            mask = self.phrase_mask(phrase)
+            if mask is not None:
+                allowed = mask if allowed is None else allowed & mask
+        return allowed
+
+    def facet_mask(self, field, value):
+        """bool mask of the docs whose ``field`` is ``value``."""
+        column = self.facets.get(field)
+        if column is None:
+            return np.zeros(self.total_docs, dtype=bool)
+        return column.mask(value)
+
+    def _with_filters(self, allowed, filters):
+        for field, value in (filters or {}).items():
+            mask = self.facet_mask(field, value)
+            allowed = mask if allowed is None else allowed & mask
+        return allowed
+
+    def matching(self, words, allowed=None, phrases=()):
+        """bool mask of the docs containing any of ``words`` (and the phrases)."""
+        matched = np.zeros(self.total_docs, dtype=bool)
+        for word in set(words):
+            raw = self.raw_postings(word)
+            if raw is not None:
+                matched[raw[0]] = True
+        allowed = self._with_phrases(allowed, phrases)
+        return matched if allowed is None else matched & allowed
+
+    def facet_counts(self, field, words=None, allowed=None, phrases=()):
+        """{value: docs} for ``field`` over the docs matching ``words``
+        (every allowed doc if words is None)."""
+        column = self.facets.get(field)
+        if column is None:
+            return {}
+        mask = allowed if words is None else self.matching(words, allowed, phrases)
+        return column.counts(mask)
+
+    def _term_idf(self, term, df, total_docs, idf=None):
+        if idf is not None:
+            return idf[term]
+        if total_docs is not None and total_docs != self.total_docs:
+            return float(self._idf(df, total_docs))
+        return float(self.idfs[self.terms[term]])
+
+    def _scored_postings(self, word, total_docs, idf, scorer, avgdl):
+        """Return (doc_ords, score contributions, upper bound) of a term, or None.
+
+        ``scorer`` is a ranking function from search/ranking.py; None keeps
+        the precomputed TF-IDF weights.
+        """
+        if scorer is None:
+            p = self.postings(word)
+            if p is None:
+                return None
+            ords, weights, _ = p
+            term_idf = self._term_idf(word, len(ords), total_docs, idf)
+            return ords, weights * term_idf, float(self.max_weights[self.terms[word]]) * term_idf
+        df = scorer.df(self, word)
+        if not df:
+            return None
+        term_idf = idf[word] if idf is not None else scorer.idf(df, total_docs or self.total_docs)
+        return scorer.contributions(self, word, term_idf, avgdl)
+
+    def score(self, words, total_docs=None, idf=None, allowed=None, phrases=(),
+              scorer=None, avgdl=None, filters=None):
+        """Accumulate scores for all docs; returns (scores, matched)."""
+        allowed = self._with_phrases(self._with_filters(allowed, filters), phrases)
+        scores = np.zeros(self.total_docs, dtype=np.float64)
+        matched = np.zeros(self.total_docs, dtype=bool)
+
+        scanned = 0
+        for word in words:
+            p = self._scored_postings(word, total_docs, idf, scorer, avgdl)
+            if p is None:
+                continue
+            ords, contribs, _ = p
+            scores[ords] += contribs
+            matched[ords] = True
+            scanned += len(ords)
+        count("postings_scanned", scanned)
+
+        if allowed is not None:
+            matched &= allowed
+        return scores, matched
+
+    def rank(self, words, total_docs=None, idf=None, allowed=None, phrases=(),
+             scorer=None, avgdl=None, filters=None):
+        """Return [(doc_id, score), ...] for every matching doc, best first."""
+        scores, matched = self.score(words, total_docs, idf, allowed, phrases, scorer, avgdl, filters)
+        hits = np.flatnonzero(matched)
+        count("docs_scored", len(hits))
+        order = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.doc_ids[o], float(scores[o])) for o in order]
+
+    def top_k(self, words, k, total_docs=None, idf=None, allowed=None, phrases=(),
+              scorer=None, avgdl=None, filters=None):
+        """Return the k best [(doc_id, score), ...] using MaxScore pruning."""
+        allowed = self._with_phrases(self._with_filters(allowed, filters), phrases)
+        postings = []
+        for word, n in Counter(words).items():
+            p = self._scored_postings(word, total_docs, idf, scorer, avgdl)
+            if p is None:
+                continue
+            ords, contribs, bound = p
+            if allowed is not None:
+                keep = allowed[ords]
+                ords, contribs = ords[keep], contribs[keep]
+            postings.append((ords.tolist(), (contribs * n).tolist(), bound * n))
+        count("postings_scanned", sum(len(p[0]) for p in postings))
+
+        return [(self.doc_ids[o], s) for o, s in max_score_top_k(postings, k)]
+
+    def to_index(self):
+        """Expand back into a dict-of-dicts InvertedIndex (for JSON export)."""
+        from indexer.inverted_index import InvertedIndex
+
+        idx = InvertedIndex(positional=self.has_positions)
+        doc_ids = list(self.doc_ids)
+        idx.doc_lengths = {d: int(n) for d, n in zip(doc_ids, self.doc_lengths)}
+        for term in self.vocabulary():
+            ords, tfs = self.raw_postings(term)
+            idx.index[term] = {doc_ids[o]: int(tf) for o, tf in zip(ords, tfs)}
+            if self.has_positions:
+                _, _, pos = self.positional_postings(term)
+                starts = np.concatenate(([0], np.cumsum(tfs, dtype=np.int64)))
+                idx.positions[term] = {
+                    doc_ids[o]: pos[starts[i]:starts[i + 1]].tolist() for i, o in enumerate(ords)
+                }
+        return idx
+
+
+def _numbered_terms(index, p):
+    for t, term in enumerate(index.vocabulary()):
+        yield term, p, t
+
+
+def _gather_runs(values, starts, lengths, order):
+    """Concatenate the runs values[starts[i]:starts[i] + lengths[i]] for i in order."""
+    lengths = np.asarray(lengths, dtype=np.int64)[order]
+    new_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    idx = np.repeat(starts[order] - new_starts, lengths) + np.arange(int(lengths.sum()))
+    return values[idx]
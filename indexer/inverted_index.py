@@ -4,21 +4,33 @@ from crawler.parser import clean
 
 
 class InvertedIndex:
-    def __init__(self):
+    def __init__(self, positional=False):
         self.index = defaultdict(dict)  # word -> {doc_id: frequency}
         self.doc_lengths = {}           # doc_id -> word count
+        # word -> {doc_id: [token position, ...]}, only if positional
+        self.positions = defaultdict(dict) if positional else None
 
     def add_document(self, doc_id, text):
-        words = clean(text)             # use cleaned words
+        self.add_tokens(doc_id, clean(text))   # use cleaned words
+
+    def add_tokens(self, doc_id, words):
+        """Index an already tokenized document."""
         self.doc_lengths[doc_id] = len(words)
 
-        for word in words:
+        for pos, word in enumerate(words):
             if doc_id not in self.index[word]:
                 self.index[word][doc_id] = 0
             self.index[word][doc_id] += 1
+            if self.positions is not None:
+                self.positions[word].setdefault(doc_id, []).append(pos)
 
     def tfidf(self, word, doc_id, total_docs):
         tf = self.index[word][doc_id] / self.doc_lengths[doc_id]
         df = len(self.index[word])
         idf = math.log(total_docs / df)
         return tf * idf
+
+    def freeze(self):
+        """Build an array-backed FrozenIndex for fast read-only scoring."""
+        from indexer.frozen import FrozenIndex
+        return FrozenIndex.from_index(self)
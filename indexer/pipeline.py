@@ -0,0 +1,153 @@
+import argparse
+import queue
+import threading
+from functools import partial
+from multiprocessing import Pool
+
+from crawler.analyzer import ANALYZER
+from crawler.parser import clean
+
+_DONE = object()
+
+
+def _stage(source, sink, work, errors):
+    """Move items from source to sink through work() until _DONE arrives."""
+    try:
+        for item in source:
+            sink.put(work(item))
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        sink.put(_DONE)
+
+
+def _drain(q):
+    while True:
+        item = q.get()
+        if item is _DONE:
+            return
+        yield item
+
+
+def _tokenize(tokenizer, item):
+    url, page = item
+    if page is None:
+        return url, None, None
+    return url, page, tokenizer(page.get("text", ""))
+
+
+def run_pipeline(pages, index, buffer_size=64, tokenizer=clean, processes=None, commit=None):
+    """Index a stream of (url, page) pairs while it is still being produced.
+
+    Stages run overlapped, connected by bounded queues of ``buffer_size``:
+
+      fetch + parse  (the ``pages`` iterator, e.g. Crawler.iter_pages)
+      -> tokenize    (tokenizer thread)
+      -> index       (caller's thread, index.add_document(url, page, words))
+
+    A full queue blocks the stage before it, so memory stays bounded by the
+    buffers plus the index's own flush size, whatever the crawl size.
+    A ``(url, None)`` item deletes the document. Returns the number of
+    documents indexed.
+
+    ``commit(url)`` (e.g. ConcurrentCrawler.commit) is called for each url
+    once its change is durable: after the index flushes it to disk, or, for
+    an index without flush(), when the stream ends. If indexing fails
+    first, those urls stay uncommitted and are crawled again.
+
+    With ``processes`` > 1 tokenizing runs in that many worker processes
+    (in order; ``tokenizer`` must be picklable). Tokens are interned in the
+    shared analyzer's vocabulary before they are buffered.
+    """
+    fetched = queue.Queue(maxsize=buffer_size)
+    tokenized = queue.Queue(maxsize=buffer_size)
+    errors = []
+
+    pool = Pool(processes) if processes and processes > 1 else None
+    if pool is None:
+        tokenize_stage = (_drain(fetched), tokenized, partial(_tokenize, tokenizer), errors)
+    else:
+        tokenize_stage = (pool.imap(partial(_tokenize, tokenizer), _drain(fetched), 4),
+                          tokenized, lambda item: item, errors)
+
+    threads = [
+        threading.Thread(target=_stage, args=(pages, fetched, lambda item: item, errors),
+                         name="pipeline-fetch", daemon=True),
+        threading.Thread(target=_stage, args=tokenize_stage,
+                         name="pipeline-tokenize", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    count = 0
+    uncommitted = []
+    for url, page, words in _drain(tokenized):
+        if page is None:
+            # page is gone (see ConcurrentCrawler.iter_changed)
+            index.delete_document(url)
+        else:
+            index.add_document(url, page, ANALYZER.intern(words))
+            count += 1
+        if commit is not None:
+            uncommitted.append(url)
+            if getattr(index, "durable", False):
+                _commit(commit, uncommitted)
+
+    for t in threads:
+        t.join()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if errors:
+        raise errors[0]
+    if uncommitted:
+        if hasattr(index, "flush"):
+            index.flush()
+        _commit(commit, uncommitted)
+    return count
+
+
+def _commit(commit, urls):
+    for url in urls:
+        commit(url)
+    urls.clear()
+
+
+def main():
+    """Crawl into the segmented index the server reads (python -m indexer.pipeline)."""
+    from crawler.concurrent import ConcurrentCrawler
+    from crawler.state import STATE_PATH, CrawlState
+    from indexer.build import save_word_tables
+    from indexer.segments import SEGMENTS_DIR, SegmentedIndex
+
+    parser = argparse.ArgumentParser(description="Stream a crawl into data/segments.")
+    parser.add_argument("start_url", nargs="?", default="https://en.wikipedia.org/wiki/India")
+    parser.add_argument("--max-pages", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=None,
+                        help="tokenize in this many worker processes")
+    parser.add_argument("--segments", default=SEGMENTS_DIR)
+    parser.add_argument("--state", default=STATE_PATH)
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-check known pages with conditional requests; reindex only changes")
+    args = parser.parse_args()
+
+    index = SegmentedIndex(args.segments)
+    index.start_merger()
+    crawler = ConcurrentCrawler(max_pages=args.max_pages, concurrency=args.concurrency,
+                                state=CrawlState(args.state), indexed=index.docs.__contains__)
+    if args.refresh:
+        pages = crawler.iter_changed()
+    else:
+        pages = crawler.iter_pages(args.start_url)
+    count = run_pipeline(pages, index, processes=args.processes, commit=crawler.commit)
+    index.flush()
+    index.maybe_merge()
+    index.close()
+    # running servers pick these up with the new segments (see api/server.py)
+    save_word_tables(index)
+    print(f"Indexed {count} pages into {args.segments}.", crawler.stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import mmap
+from collections.abc import Mapping
+
+import numpy as np
+
+from indexer.codec import (
+    StringTable, decode_varints, encode_varints, pack_strings,
+    read_sections, varint_sizes, write_sections,
+)
+from indexer.frozen import FrozenIndex
+
+SEGMENT_MAGIC = b"MSEG"
+
+# header counts: format version, docs, terms
+# version 2 adds the (optional) positions sections
+SEGMENT_VERSION = 2
+
+
+def write_segment(path, frozen):
+    """Write a FrozenIndex as a binary segment file.
+
+    Layout (each section 8-byte aligned, see codec.write_sections):
+      doc lengths int32[N], doc id string table,
+      sorted term string table, per-term df uint32[T] and max tf/len float64[T],
+      per-term byte offsets uint64[T+1] into the postings blob,
+      postings blob: per term, df varint doc-ordinal deltas then df varint tfs,
+      per-term byte offsets uint64[T+1] into the positions blob (empty if the
+      index has no positions),
+      positions blob: per posting, tf varint position deltas.
+    """
+    terms = sorted(frozen.terms, key=frozen.terms.get)
+    if terms != sorted(terms):
+        raise ValueError("segment terms must be in sorted order")
+
+    offsets = np.asarray(frozen.offsets, dtype=np.int64)
+    dfs = np.diff(offsets)
+    ords = np.asarray(frozen.doc_ords, dtype=np.int64)
+    tfs = np.asarray(frozen.tfs, dtype=np.int64)
+
+    # delta-encode doc ordinals within each term's list
+    deltas = ords.copy()
+    deltas[1:] -= ords[:-1]
+    deltas[offsets[:-1][dfs > 0]] = ords[offsets[:-1][dfs > 0]]
+
+    # interleave per term: [deltas..., tfs...]
+    term_of = np.repeat(np.arange(len(dfs)), dfs)
+    local = np.arange(len(ords)) - offsets[term_of]
+    values = np.empty(2 * len(ords), dtype=np.uint64)
+    values[2 * offsets[term_of] + local] = deltas
+    values[2 * offsets[term_of] + dfs[term_of] + local] = tfs
+
+    sizes = np.concatenate(([0], np.cumsum(varint_sizes(values))))
+    byte_offsets = sizes[2 * offsets].astype(np.uint64)
+
+    pos_offsets, pos_blob = b"", b""
+    if frozen.has_positions:
+        pos_offsets, pos_blob = _encode_positions(frozen.positions, frozen.pos_offsets, offsets, tfs)
+
+    doc_offsets, doc_blob = pack_strings(frozen.doc_ids)
+    term_offsets, term_blob = pack_strings(terms)
+
+    sections = [
+        np.asarray(frozen.doc_lengths, dtype=np.int32).tobytes(),
+        doc_offsets.tobytes(),
+        doc_blob,
+        term_offsets.tobytes(),
+        term_blob,
+        dfs.astype(np.uint32).tobytes(),
+        np.asarray(frozen.max_weights, dtype=np.float64).tobytes(),
+        byte_offsets.tobytes(),
+        encode_varints(values),
+        pos_offsets,
+        pos_blob,
+    ]
+    with open(path, "wb") as f:
+        write_sections(f, SEGMENT_MAGIC, [SEGMENT_VERSION, len(frozen.doc_ids), len(terms)], sections)
+
+
+def _encode_positions(positions, pos_offsets, offsets, tfs):
+    """Delta-encode positions within each posting; return (offsets, blob)."""
+    positions = np.asarray(positions, dtype=np.int64)
+    deltas = positions.copy()
+    deltas[1:] -= positions[:-1]
+    firsts = pos_offsets[:-1][tfs > 0]
+    deltas[firsts] = positions[firsts]
+
+    sizes = np.concatenate(([0], np.cumsum(varint_sizes(deltas))))
+    byte_offsets = sizes[pos_offsets[offsets]].astype(np.uint64)
+    return byte_offsets.tobytes(), encode_varints(deltas)
+
+
+def _decode_positions(buf, tfs):
+    """Inverse of _encode_positions for one term's postings."""
+    values = decode_varints(buf).astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(tfs[:-1], dtype=np.int64)))
+    return _undelta(values, starts, tfs).astype(np.int32)
+
+
+def _undelta(values, starts, lengths):
+    """Prefix sums restarted at every run start (runs are back to back)."""
+    if not len(values):
+        return values
+    total = np.cumsum(values)
+    base = total[starts] - values[starts]
+    return total - np.repeat(base, lengths)
+
+
+class TermDictionary(Mapping):
+    """term -> term ordinal, by binary search over a sorted StringTable."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, term):
+        t = self.table.find(term)
+        if t < 0:
+            raise KeyError(term)
+        return t
+
+    def __contains__(self, term):
+        return self.table.find(term) >= 0
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+
+class Segment(FrozenIndex):
+    """A FrozenIndex opened from a segment file through mmap.
+
+    Nothing is decoded at open time: term lookups binary-search the mapped
+    term table and postings are varint-decoded on demand. Worker processes
+    that open the same file share its pages through the OS page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        counts, s = read_sections(self._mmap, SEGMENT_MAGIC, 3)
+        version, n_docs, n_terms = counts
+        if version not in (1, SEGMENT_VERSION):
+            raise ValueError("unsupported segment version %d" % version)
+
+        self.doc_lengths = np.frombuffer(s[0], dtype=np.int32)
+        self.doc_ids = StringTable(np.frombuffer(s[1], dtype=np.uint64), s[2])
+        self.terms = TermDictionary(StringTable(np.frombuffer(s[3], dtype=np.uint64), s[4]))
+        self.dfs = np.frombuffer(s[5], dtype=np.uint32)
+        self.max_weights = np.frombuffer(s[6], dtype=np.float64)
+        self._byte_offsets = np.frombuffer(s[7], dtype=np.uint64)
+        self._postings = s[8]
+        self.positions = None
+        self._pos_offsets = None
+        if version >= 2 and len(s[9]):
+            self._pos_offsets = np.frombuffer(s[9], dtype=np.uint64)
+            self._positions = s[10]
+
+        self.total_docs = n_docs
+        self.fields = {}
+        self.facets = {}
+        self._norms = {}
+        self.doc_norms = 1.0 / np.maximum(self.doc_lengths, 1)
+        self.idfs = self._idf(self.dfs, self.total_docs)
+
+    def materialize(self):
+        """Decode the whole segment at once into an in-memory FrozenIndex.
+
+        Merges read every posting, so one vectorized decode of each blob
+        beats decoding term by term.
+        """
+        dfs = self.dfs.astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(dfs)))
+        values = decode_varints(self._postings).astype(np.int64)
+        term_of = np.repeat(np.arange(len(dfs)), dfs)
+        first = 2 * offsets[term_of] + np.arange(offsets[-1]) - offsets[term_of]
+        ords = _undelta(values[first], offsets[:-1], dfs)
+        tfs = values[first + dfs[term_of]]
+
+        positions = None
+        if self.has_positions:
+            starts = np.concatenate(([0], np.cumsum(tfs[:-1])))
+            positions = _undelta(decode_varints(self._positions).astype(np.int64), starts, tfs)
+
+        terms = {term: t for t, term in enumerate(self.terms)}
+        frozen = FrozenIndex(list(self.doc_ids), self.doc_lengths, terms, offsets, ords, tfs, positions)
+        frozen.fields = {name: field.materialize() for name, field in self.fields.items()}
+        frozen.facets = self.facets
+        return frozen
+
+    def close(self):
+        self._file.close()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # arrays (ours, or a query's still running) view the mapping;
+            # it is unmapped when the last of them is freed
+            pass
+
+    def raw_postings(self, term):
+        t = self.terms.get(term)
+        if t is None:
+            return None
+        return self.postings_at(t)
+
+    def postings_at(self, t, positional=False):
+        start, end = int(self._byte_offsets[t]), int(self._byte_offsets[t + 1])
+        values = decode_varints(self._postings[start:end]).astype(np.int64)
+        df = int(self.dfs[t])
+        ords, tfs = np.cumsum(values[:df]).astype(np.int32), values[df:].astype(np.int32)
+        if not positional:
+            return ords, tfs
+        start, end = int(self._pos_offsets[t]), int(self._pos_offsets[t + 1])
+        return ords, tfs, _decode_positions(self._positions[start:end], tfs)
+
+    @property
+    def has_positions(self):
+        return self._pos_offsets is not None
+
+    def positional_postings(self, term):
+        if not self.has_positions:
+            return None
+        t = self.terms.get(term)
+        if t is None:
+            return None
+        return self.postings_at(t, positional=True)
+
+    def postings(self, term):
+        p = self.raw_postings(term)
+        if p is None:
+            return None
+        ords, tfs = p
+        return ords, tfs * self.doc_norms[ords], self.idfs[self.terms[term]]
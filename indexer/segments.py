@@ -0,0 +1,518 @@
+import heapq
+import json
+import math
+import os
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+from indexer.facets import FacetColumn
+from indexer.frozen import FrozenIndex
+from indexer.inverted_index import InvertedIndex
+from crawler.parser import clean
+from indexer.storage import FACETS, load_segment, save_segment, segment_files
+
+SEGMENTS_DIR = "data/segments"
+MANIFEST = "manifest.json"
+
+
+class _LiveSegment:
+    """An open segment + doc store and its tombstones."""
+
+    def __init__(self, name, index, docs, deleted=()):
+        self.name = name
+        self.index = index
+        self.docs = docs
+        self.deleted = set(deleted)                      # doc ids
+        self.live = np.ones(index.total_docs, dtype=bool)
+        for doc_id in self.deleted:
+            o = index.doc_ordinal(doc_id)
+            if o >= 0:
+                self.live[o] = False
+
+    def live_count(self):
+        return self.index.total_docs - len(self.deleted)
+
+    def close(self):
+        """Release a segment dropped from the index."""
+        for part in [self.index] + list(self.index.fields.values()) + [self.docs]:
+            if hasattr(part, "close"):
+                part.close()
+
+    def delete(self, doc_id):
+        if doc_id in self.deleted:
+            return False
+        o = self.index.doc_ordinal(doc_id)
+        if o < 0:
+            return False
+        self.deleted.add(doc_id)
+        self.live[o] = False
+        return True
+
+
+class SegmentedIndex:
+    """Append-only, multi-segment index with tombstones and background merges.
+
+    New and updated documents go into an in-memory buffer that is flushed to
+    an immutable segment (see indexer/segment.py) every ``flush_docs`` docs.
+    Deletes and updates tombstone the old copy. Queries fan out over all
+    segments plus the buffer using global idf statistics and merge the
+    per-segment top-k lists.
+
+    Merge policy is tiered: segments are grouped by size (powers of
+    ``merge_factor`` times ``flush_docs``); once a tier holds ``merge_factor``
+    segments they are merged into one, dropping tombstoned docs. Merges run
+    on a background thread after ``start_merger()``.
+
+    Like Lucene, df counts still include tombstoned docs until a merge
+    purges them.
+    """
+
+    def __init__(self, directory=SEGMENTS_DIR, flush_docs=1000, merge_factor=4, positional=True):
+        self.directory = directory
+        self.flush_docs = flush_docs
+        self.merge_factor = merge_factor
+        self.positional = positional    # store token positions in new segments
+
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._segments = []             # list of _LiveSegment, oldest first
+        self._buffer = {}               # doc_id -> page
+        self._buffer_tokens = {}        # doc_id -> words, if given pre-tokenized
+        self._buffer_index = None       # FrozenIndex of the buffer, built lazily
+        self._next_id = 1
+        self._manifest_mtime = None
+        self.generation = 0             # bumped on every visible change
+        self._dirty = False             # changes not yet in the manifest
+        self.docs = SegmentedDocs(self)
+        self._facet_totals = {}         # (field, version) -> index-wide counts
+
+        self._merge_wanted = threading.Event()
+        self._merger = None
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    # ---------------------------
+    # Manifest
+    # ---------------------------
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_manifest(self):
+        data = {
+            "next_id": self._next_id,
+            "segments": [
+                {"name": s.name, "deleted": sorted(s.deleted)} for s in self._segments
+            ],
+        }
+        tmp = self._path(MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._path(MANIFEST))
+        self._manifest_mtime = os.stat(self._path(MANIFEST)).st_mtime_ns
+        self._dirty = bool(self._buffer)    # a merge leaves the buffer unflushed
+
+    def refresh(self):
+        """Pick up a manifest written by another process; True if it changed."""
+        path = self._path(MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+
+        with self._lock:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            open_segments = {s.name: s for s in self._segments}
+            segments = []
+            for entry in data["segments"]:
+                name = entry["name"]
+                if name in open_segments:
+                    # segments are immutable; only tombstones can have grown
+                    segment = open_segments[name]
+                    for doc_id in entry["deleted"]:
+                        segment.delete(doc_id)
+                    segments.append(segment)
+                    continue
+                index, docs = load_segment(self._path(name))
+                segments.append(_LiveSegment(name, index, docs, entry["deleted"]))
+            kept = {s.name for s in segments}
+            for segment in open_segments.values():
+                if segment.name not in kept:
+                    segment.close()
+            self._segments = segments
+            self._next_id = data["next_id"]
+            self._manifest_mtime = mtime
+            self.generation += 1
+        return True
+
+    @property
+    def durable(self):
+        """True when every change so far is in the manifest on disk."""
+        return not self._dirty
+
+    @property
+    def version(self):
+        """Cache key for the visible state of the index.
+
+        Equal across processes reading the same manifest; unflushed local
+        changes make it process-specific.
+        """
+        if self._dirty:
+            return "%s+%d.%d" % (self._manifest_mtime, os.getpid(), self.generation)
+        return str(self._manifest_mtime)
+
+    # ---------------------------
+    # Writes
+    # ---------------------------
+    def _tombstone(self, doc_id):
+        for segment in self._segments:
+            segment.delete(doc_id)
+
+    def add_document(self, doc_id, page, words=None):
+        """Add or replace a document; flushes when the buffer is full.
+
+        ``words`` may carry the already tokenized text (see indexer/pipeline.py).
+        """
+        with self._lock:
+            self._tombstone(doc_id)
+            self._buffer[doc_id] = page
+            if words is not None:
+                self._buffer_tokens[doc_id] = words
+            else:
+                self._buffer_tokens.pop(doc_id, None)
+            self._buffer_index = None
+            self.generation += 1
+            self._dirty = True
+            if len(self._buffer) >= self.flush_docs:
+                self.flush()
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            self._tombstone(doc_id)
+            self._buffer_tokens.pop(doc_id, None)
+            if self._buffer.pop(doc_id, None) is not None:
+                self._buffer_index = None
+            self.generation += 1
+            self._dirty = True
+
+    def add_segment(self, frozen, docs):
+        """Write an already-built FrozenIndex + docs as a new segment."""
+        with self._lock:
+            for doc_id in frozen.doc_ids:
+                self._tombstone(doc_id)
+                self._buffer_tokens.pop(doc_id, None)
+                if self._buffer.pop(doc_id, None) is not None:
+                    self._buffer_index = None
+            self._segments = self._segments + [self._write_segment(frozen, docs)]
+            self._write_manifest()
+            self.generation += 1
+        self._merge_wanted.set()
+
+    def _write_segment(self, frozen, docs):
+        name = "seg_%06d" % self._next_id
+        self._next_id += 1
+        save_segment(frozen, docs, self._path(name))
+        index, stored = load_segment(self._path(name))
+        return _LiveSegment(name, index, stored)
+
+    def flush(self):
+        """Write the buffer as a new segment and persist tombstones."""
+        with self._lock:
+            if self._buffer:
+                frozen = self._freeze_buffer()
+                segment = self._write_segment(frozen, self._buffer)
+                self._segments = self._segments + [segment]
+                self._buffer = {}
+                self._buffer_tokens = {}
+                self._buffer_index = None
+            self._write_manifest()
+            self.generation += 1
+        self._merge_wanted.set()
+
+    def _freeze_buffer(self):
+        return freeze_pages(self._buffer, self._buffer_tokens, self.positional)
+
+    # ---------------------------
+    # Merging
+    # ---------------------------
+    def _tier(self, segment):
+        size = segment.live_count() / self.flush_docs
+        tier = 0
+        while size >= self.merge_factor:
+            size /= self.merge_factor
+            tier += 1
+        return tier
+
+    def _pick_merge(self):
+        tiers = {}
+        for segment in self._segments:
+            tiers.setdefault(self._tier(segment), []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        return None
+
+    def maybe_merge(self):
+        """Run merges until no tier is full; returns the number of merges."""
+        merges = 0
+        with self._merge_lock:
+            while not self._closed:
+                with self._lock:
+                    picked = self._pick_merge()
+                    if not picked:
+                        break
+                    deleted_before = {s.name: set(s.deleted) for s in picked}
+                    masks = [s.live.copy() for s in picked]
+
+                frozen = FrozenIndex.merge([(s.index, mask) for s, mask in zip(picked, masks)])
+                docs = merge_docs([(s.docs, [s.index.doc_ids[o] for o in np.flatnonzero(mask)])
+                                   for s, mask in zip(picked, masks)])
+
+                with self._lock:
+                    merged = self._write_segment(frozen, docs)
+                    # re-apply tombstones that arrived while we were merging
+                    for s in picked:
+                        for doc_id in s.deleted - deleted_before[s.name]:
+                            merged.delete(doc_id)
+                    picked_names = {s.name for s in picked}
+                    position = min(i for i, s in enumerate(self._segments) if s.name in picked_names)
+                    remaining = [s for s in self._segments if s.name not in picked_names]
+                    remaining.insert(position, merged)
+                    self._segments = remaining
+                    self._write_manifest()
+                    self.generation += 1
+
+                for s in picked:
+                    s.close()
+                    for path in segment_files(self._path(s.name)):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                merges += 1
+        return merges
+
+    def start_merger(self):
+        """Run maybe_merge() on a daemon thread whenever a flush happens."""
+        if self._merger is not None:
+            return
+
+        def loop():
+            while not self._closed:
+                self._merge_wanted.wait()
+                self._merge_wanted.clear()
+                try:
+                    self.maybe_merge()
+                except Exception as e:
+                    print("Segment merge failed:", e)
+
+        self._merger = threading.Thread(target=loop, name="segment-merger", daemon=True)
+        self._merger.start()
+        self._merge_wanted.set()
+
+    def close(self):
+        self._closed = True
+        self._merge_wanted.set()
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+    def _snapshot(self):
+        """Return [(index, live_mask), ...] over segments + buffer."""
+        with self._lock:
+            parts = [(s.index, s.live) for s in self._segments]
+            if self._buffer:
+                if self._buffer_index is None:
+                    self._buffer_index = self._freeze_buffer()
+                parts.append((self._buffer_index, None))
+        return parts
+
+    @property
+    def total_docs(self):
+        return len(self.docs)
+
+    def __len__(self):
+        return self.total_docs
+
+    def __contains__(self, term):
+        return any(term in index for index, _ in self._snapshot())
+
+    def df(self, term):
+        return sum(index.df(term) for index, _ in self._snapshot())
+
+    def vocabulary(self):
+        """Sorted, de-duplicated terms across all segments."""
+        last = None
+        for term in heapq.merge(*(index.vocabulary() for index, _ in self._snapshot())):
+            if term != last:
+                yield term
+                last = term
+
+    def _dfs(self, parts, words, scorer=None):
+        dfs = {}
+        for word in set(words):
+            if scorer is None:
+                dfs[word] = sum(index.df(word) for index, _ in parts)
+            else:
+                dfs[word] = sum(scorer.df(index, word) for index, _ in parts)
+        return dfs
+
+    def _global_idf(self, parts, words, total_docs, scorer=None):
+        n = total_docs or sum(index.total_docs for index, _ in parts)
+        return idf_from_dfs(self._dfs(parts, words, scorer), n, scorer)
+
+    def _global_avgdl(self, parts):
+        """Average body / title length over all parts, for BM25 norms."""
+        return avgdl_from_lengths(self._lengths(parts), sum(index.total_docs for index, _ in parts))
+
+    def _lengths(self, parts):
+        lengths = {"body": sum(index.total_length() for index, _ in parts)}
+        if all("title" in index.fields for index, _ in parts):
+            lengths["title"] = sum(index.fields["title"].total_length() for index, _ in parts)
+        return lengths
+
+    def term_stats(self, words, scorer=None):
+        """Raw counts behind idf / avgdl, summable across indexes: live docs,
+        indexed docs and their total lengths, and df of each of ``words``.
+        A sharded coordinator adds these up for globally consistent scores."""
+        parts = self._snapshot()
+        return {
+            "docs": len(self),
+            "indexed_docs": sum(index.total_docs for index, _ in parts),
+            "lengths": self._lengths(parts),
+            "df": self._dfs(parts, words, scorer),
+        }
+
+    def _query_args(self, parts, words, total_docs, scorer, idf=None, avgdl=None):
+        if idf is None:
+            idf = self._global_idf(parts, words, total_docs, scorer)
+        words = [w for w in words if w in idf]
+        if avgdl is None and scorer is not None:
+            avgdl = self._global_avgdl(parts)
+        return words, idf, avgdl
+
+    @property
+    def has_positions(self):
+        return any(index.has_positions for index, _ in self._snapshot())
+
+    def doc_positions(self, words, doc_ids):
+        """Return {doc_id: {word: positions}} from the live copy of each doc."""
+        out = {}
+        # newest part last, so it wins over stale copies in older segments
+        for index, _ in self._snapshot():
+            out.update(index.doc_positions(words, doc_ids))
+        return out
+
+    def rank(self, words, total_docs=None, phrases=(), scorer=None, filters=None,
+             idf=None, avgdl=None):
+        """``idf`` / ``avgdl`` override this index's own statistics."""
+        parts = self._snapshot()
+        words, idf, avgdl = self._query_args(parts, words, total_docs, scorer, idf, avgdl)
+        ranked = []
+        for index, live in parts:
+            ranked.extend(index.rank(words, idf=idf, allowed=live, phrases=phrases,
+                                     scorer=scorer, avgdl=avgdl, filters=filters))
+        ranked.sort(key=lambda x: x[1], reverse=True)
+        return ranked
+
+    def top_k(self, words, k, total_docs=None, phrases=(), scorer=None, filters=None,
+              idf=None, avgdl=None):
+        parts = self._snapshot()
+        words, idf, avgdl = self._query_args(parts, words, total_docs, scorer, idf, avgdl)
+        hits = []
+        for index, live in parts:
+            hits.extend(index.top_k(words, k, idf=idf, allowed=live, phrases=phrases,
+                                    scorer=scorer, avgdl=avgdl, filters=filters))
+        return heapq.nlargest(k, hits, key=lambda x: x[1])
+
+    def facet_counts(self, field, words=None, phrases=()):
+        """{value: live docs} for ``field``, over the docs matching ``words``
+        or, with words=None, the whole index (cached per version)."""
+        if words is None:
+            key = (field, self.version)
+            cached = self._facet_totals.get(key)
+            if cached is not None:
+                return cached
+        totals = {}
+        for index, live in self._snapshot():
+            for value, n in index.facet_counts(field, words, allowed=live, phrases=phrases).items():
+                totals[value] = totals.get(value, 0) + n
+        if words is None:
+            self._facet_totals = {key: totals}
+        return totals
+
+
+def idf_from_dfs(dfs, n, scorer=None):
+    """{word: idf} for words with df > 0 (TF-IDF's log(N/df) when scorer is None)."""
+    return {
+        word: math.log(max(n, df) / df) if scorer is None else scorer.idf(df, n)
+        for word, df in dfs.items() if df
+    }
+
+
+def avgdl_from_lengths(lengths, n):
+    return {name: total / (n or 1) for name, total in lengths.items()}
+
+
+def freeze_pages(pages, tokens=None, positional=True):
+    """FrozenIndex (with title field and facets) of a {doc_id: page} dict.
+
+    ``tokens`` optionally maps doc_id -> already tokenized text.
+    """
+    idx = InvertedIndex(positional=positional)
+    titles = InvertedIndex()
+    for doc_id, page in pages.items():
+        words = tokens.get(doc_id) if tokens else None
+        if words is None:
+            idx.add_document(doc_id, page.get("text", ""))
+        else:
+            idx.add_tokens(doc_id, words)
+        titles.add_tokens(doc_id, clean(page.get("title") or ""))
+    frozen = idx.freeze()
+    frozen.fields["title"] = titles.freeze()
+    frozen.facets = {f: FacetColumn.build(frozen.doc_ids, pages, f) for f in FACETS}
+    return frozen
+
+
+def merge_docs(parts):
+    """(url, page) pairs of the live docs of ``parts`` -- (doc store, live
+    doc ids) pairs -- in url order, for write_doc_store. Pages are read one
+    at a time, so their text is never all in memory."""
+    live = sorted((doc_id, p) for p, (_, doc_ids) in enumerate(parts) for doc_id in doc_ids)
+    for doc_id, p in live:
+        yield doc_id, parts[p][0][doc_id]
+
+
+class SegmentedDocs(Mapping):
+    """{url: page} view over the buffer and every segment's doc store."""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, url):
+        idx = self._index
+        page = idx._buffer.get(url)
+        if page is not None:
+            return page
+        for segment in reversed(idx._segments):
+            if url not in segment.deleted and url in segment.docs:
+                return segment.docs[url]
+        raise KeyError(url)
+
+    def __iter__(self):
+        idx = self._index
+        yield from list(idx._buffer)
+        for segment in list(idx._segments):
+            for url in segment.docs:
+                if url not in segment.deleted:
+                    yield url
+
+    def __len__(self):
+        idx = self._index
+        return len(idx._buffer) + sum(s.live_count() for s in idx._segments)
@@ -1,4 +1,11 @@
 import json
+import os
+from collections.abc import Mapping
+
+SEGMENT_PATH = "data/index"
+FIELDS = ("title",)         # indexed page fields besides the body text
+FACETS = ("category",)      # page fields stored as per-doc filter values
+
 
 def save_index(index, doc_lengths, docs):
     with open("data/index.json", "w", encoding="utf-8") as f:
@@ -8,3 +15,75 @@ def load_index():
     with open("data/index.json", "r", encoding="utf-8") as f:
         data = json.load(f)
     return data["index"], data["doc_lengths"], data["docs"]
+
+
+# ---------------------------
+# Binary segment + doc store
+# ---------------------------
+def save_segment(frozen, docs, path=SEGMENT_PATH):
+    """Write <path>.seg (postings), <path>.docs (documents), one
+    <path>.<field>.seg per extra field (e.g. the title) and <path>.facets
+    (category per doc, for filtering before scoring). ``docs`` is a
+    {url: page} mapping or (url, page) pairs in url order."""
+    from indexer.docstore import DocStore, write_doc_store
+    from indexer.facets import FacetColumn, write_facets
+    from indexer.segment import write_segment
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # write to temp names first so readers never see a half-written set;
+    # the main .seg goes last since its presence marks the segment
+    for name, field in frozen.fields.items():
+        write_segment(path + ".%s.seg.tmp" % name, field)
+    write_segment(path + ".seg.tmp", frozen)
+    write_doc_store(path + ".docs.tmp", docs)
+    if not isinstance(docs, Mapping):
+        # (url, page) pairs are read once: take the facets from the new store
+        docs = DocStore(path + ".docs.tmp")
+    write_facets(path + ".facets.tmp",
+                 {f: FacetColumn.build(frozen.doc_ids, docs, f) for f in FACETS})
+    for name in frozen.fields:
+        os.replace(path + ".%s.seg.tmp" % name, path + ".%s.seg" % name)
+    os.replace(path + ".docs.tmp", path + ".docs")
+    os.replace(path + ".facets.tmp", path + ".facets")
+    os.replace(path + ".seg.tmp", path + ".seg")
+
+
+def segment_files(path):
+    """All files a segment at path may consist of."""
+    return [path + ".seg", path + ".docs", path + ".facets"] + [path + ".%s.seg" % f for f in FIELDS]
+
+
+def load_segment(path=SEGMENT_PATH):
+    """Open a saved segment and doc store via mmap; returns (segment, docs)."""
+    from indexer.docstore import DocStore
+    from indexer.facets import FacetColumn, read_facets
+    from indexer.segment import Segment
+
+    segment = Segment(path + ".seg")
+    for field in FIELDS:
+        if os.path.exists(path + ".%s.seg" % field):
+            segment.fields[field] = Segment(path + ".%s.seg" % field)
+    docs = DocStore(path + ".docs")
+    if os.path.exists(path + ".facets"):
+        segment.facets = read_facets(path + ".facets")
+    else:
+        # written before facets existed: build them from the stored pages
+        segment.facets = {f: FacetColumn.build(segment.doc_ids, docs, f) for f in FACETS}
+    return segment, docs
+
+
+def json_to_segment(path=SEGMENT_PATH):
+    """Migrate data/index.json to the binary segment format."""
+    from indexer.inverted_index import InvertedIndex
+
+    idx = InvertedIndex()
+    idx.index, idx.doc_lengths, docs = load_index()
+    save_segment(idx.freeze(), docs, path)
+    return load_segment(path)
+
+
+def segment_to_json(path=SEGMENT_PATH):
+    """Export a binary segment back to data/index.json."""
+    segment, docs = load_segment(path)
+    idx = segment.to_index()
+    save_index(idx.index, idx.doc_lengths, {url: dict(page) for url, page in docs.items()})
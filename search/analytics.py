@@ -0,0 +1,166 @@
+import heapq
+import os
+import threading
+from collections import OrderedDict, deque
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in fixed memory (Metwally et al., Space-Saving).
+
+    At most ``capacity`` items are counted. A new item replaces the current
+    minimum and inherits its count, so counts are over-estimates by at most
+    ``error(item)``; any item seen more than total / capacity times is kept.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}            # item -> count
+        self.errors = {}            # item -> over-estimate inherited on entry
+        self._heap = []             # (count, item), lazily updated
+        self.total = 0
+
+    def add(self, item, count=1):
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            floor = self._pop_min()
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i) for i, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        # skip heap entries whose count has changed since they were pushed
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                del self.counts[item]
+                del self.errors[item]
+                return count
+
+    def top(self, n=10):
+        """[(item, count), ...] highest count first."""
+        return heapq.nlargest(n, self.counts.items(), key=lambda x: x[1])
+
+    def error(self, item):
+        return self.errors.get(item, 0)
+
+    def __len__(self):
+        return len(self.counts)
+
+
+class QueryTracker:
+    """Query analytics off the request path.
+
+    record() only appends to a deque (atomic in CPython, no lock); a daemon
+    thread drains it in batches into the trending counter and per-user
+    history, and sends each batch to Redis in one pipeline. Memory is
+    bounded: ``capacity`` trending queries, ``history_size`` queries for
+    each of at most ``max_users`` users (least recently active dropped), and
+    ``max_pending`` queued events (oldest dropped under overload).
+    """
+
+    def __init__(self, redis_client=None, capacity=1000, history_size=50, max_users=10000,
+                 batch_size=256, flush_interval=0.5, max_pending=100000, on_query=None):
+        self.redis = redis_client
+        self.trending = SpaceSaving(capacity)
+        self.history_size = history_size
+        self.max_users = max_users
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_query = on_query    # called with each query by the batcher
+        self._users = OrderedDict() # user -> deque of recent queries
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock() # one batcher per process
+        self._pid = None
+        self.dropped = 0
+        self.redis_errors = 0
+
+    def record(self, query, user):
+        if self._pid != os.getpid():
+            # (re)start the batcher; threads do not survive a gunicorn fork
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start()
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append((query, user))
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="query-tracker", daemon=True).start()
+
+    def _run(self):
+        pid = self._pid
+        while self._pid == pid:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Apply every queued event now; returns how many were applied."""
+        applied = 0
+        while self._pending:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popleft())
+            self._apply(batch)
+            applied += len(batch)
+        return applied
+
+    def _apply(self, batch):
+        with self._lock:
+            for query, user in batch:
+                self.trending.add(query)
+                history = self._users.pop(user, None)
+                if history is None:
+                    history = deque(maxlen=self.history_size)
+                history.append(query)
+                self._users[user] = history
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+
+        if self.on_query is not None:
+            for query, _ in batch:
+                self.on_query(query)
+
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for query, user in batch:
+                    pipe.zincrby("trending_searches", 1, query)
+                    pipe.zincrby(f"user:{user}:history", 1, query)
+                pipe.execute()
+            except Exception:
+                # Redis is optional; in-process counters still work
+                self.redis_errors += 1
+
+    def top(self, n=10):
+        with self._lock:
+            return self.trending.top(n)
+
+    def history(self, user):
+        with self._lock:
+            return list(self._users.get(user, ()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "total_queries": self.trending.total,
+                "tracked_queries": len(self.trending),
+                "tracked_users": len(self._users),
+                "pending": len(self._pending),
+                "dropped": self.dropped,
+                "redis_errors": self.redis_errors,
+            }
@@ -1,33 +1,160 @@
-class TrieNode:
-    def __init__(self):
-        self.children = {}
-        self.is_end = False
+import heapq
+import mmap
+import os
+
+import numpy as np
+
+from indexer.codec import read_sections, write_sections
+
+TRIE_MAGIC = b"MTRI"
+
 
 class Trie:
-    def __init__(self):
-        self.root = TrieNode()
-
-    def insert(self, word):
-        cur = self.root
-        for ch in word:
-            if ch not in cur.children:
-                cur.children[ch] = TrieNode()
-            cur = cur.children[ch]
-        cur.is_end = True
-
-    def _dfs(self, node, prefix):
-        results = []
-        if node.is_end:
-            results.append(prefix)
-        for ch, nxt in node.children.items():
-            results.extend(self._dfs(nxt, prefix + ch))
-        return results
-
-    def autocomplete(self, prefix):
-        cur = self.root
+    """Compact, array-backed trie for weighted top-k completion.
+
+    Nodes are laid out breadth-first, so the children of a node are one
+    contiguous, label-sorted run (CSR style). Every node stores the weight
+    of the word ending there (-1 if none) and the maximum weight in its
+    subtree, which lets autocomplete() run a best-first search that stops
+    after k words instead of walking every completion of the prefix.
+
+    Built from {word: weight}; weights can only be raised afterwards
+    (add_weight), which keeps the subtree maxima valid.
+    """
+
+    def __init__(self, weights=None, _arrays=None):
+        if _arrays is not None:
+            self.labels, self.child_offsets, self.parents, self.weights, self.max_weights = _arrays
+        else:
+            self._build(dict(weights or {}))
+        self.version = None
+
+    def _build(self, weights):
+        words = sorted(weights)
+        labels = [0]
+        parents = [-1]
+        node_weights = [-1.0]
+        child_offsets = [1]
+        # (first word, end word, depth) of each node, breadth first
+        queue = [(0, len(words), 0)]
+        for node, (start, end, depth) in enumerate(queue):
+            if start < end and len(words[start]) == depth:
+                node_weights[node] = float(weights[words[start]])
+                start += 1
+            i = start
+            while i < end:
+                ch = words[i][depth]
+                j = i + 1
+                while j < end and words[j][depth] == ch:
+                    j += 1
+                labels.append(ord(ch))
+                parents.append(node)
+                node_weights.append(-1.0)
+                queue.append((i, j, depth + 1))
+                i = j
+            child_offsets.append(len(labels))
+
+        self.labels = np.array(labels, dtype=np.int32)
+        self.child_offsets = np.array(child_offsets, dtype=np.int64)
+        self.parents = np.array(parents, dtype=np.int32)
+        self.weights = np.array(node_weights, dtype=np.float64)
+
+        # children always come after their parent, so one reverse pass
+        # over the BFS order folds subtree maxima up to the root
+        max_weights = self.weights.copy()
+        for node in range(len(max_weights) - 1, 0, -1):
+            p = parents[node]
+            if max_weights[node] > max_weights[p]:
+                max_weights[p] = max_weights[node]
+        self.max_weights = max_weights
+
+    def __len__(self):
+        return int((self.weights >= 0).sum())
+
+    def _child(self, node, ch):
+        lo, hi = self.child_offsets[node], self.child_offsets[node + 1]
+        i = lo + np.searchsorted(self.labels[lo:hi], ord(ch))
+        if i < hi and self.labels[i] == ord(ch):
+            return int(i)
+        return -1
+
+    def _find(self, prefix):
+        node = 0
         for ch in prefix:
-            if ch not in cur.children:
-                return []
-            cur = cur.children[ch]
+            node = self._child(node, ch)
+            if node < 0:
+                return -1
+        return node
+
+    def __contains__(self, word):
+        node = self._find(word)
+        return node >= 0 and self.weights[node] >= 0
+
+    def add_weight(self, word, delta):
+        """Raise the weight of an existing word (e.g. query popularity)."""
+        node = self._find(word)
+        if node < 0 or self.weights[node] < 0 or delta <= 0:
+            return
+        w = self.weights[node] + delta
+        self.weights[node] = w
+        while node >= 0 and self.max_weights[node] < w:
+            self.max_weights[node] = w
+            node = self.parents[node]
+
+    def autocomplete(self, prefix, k=10, with_weights=False):
+        """Top-k completions of prefix by weight (ties alphabetical)."""
+        node = self._find(prefix)
+        if node < 0 or self.max_weights[node] < 0:
+            return []
+
+        out = []
+        heap = [(-self.max_weights[node], prefix, False, node)]
+        while heap and len(out) < k:
+            neg_w, s, is_word, node = heapq.heappop(heap)
+            if is_word:
+                out.append((s, float(-neg_w)) if with_weights else s)
+                continue
+            if self.weights[node] >= 0:
+                heapq.heappush(heap, (-self.weights[node], s, True, node))
+            for child in range(self.child_offsets[node], self.child_offsets[node + 1]):
+                if self.max_weights[child] >= 0:
+                    heapq.heappush(heap, (-self.max_weights[child], s + chr(self.labels[child]), False, child))
+        return out
+
+    # ---------------------------
+    # Serialization
+    # ---------------------------
+    def save(self, path, version=None):
+        """Write the trie; ``version`` ties it to the index it was built from."""
+        sections = [
+            self.labels.tobytes(),
+            self.child_offsets.tobytes(),
+            self.parents.tobytes(),
+            self.weights.tobytes(),
+            self.max_weights.tobytes(),
+            (version or "").encode("utf-8"),
+        ]
+        with open(path + ".tmp", "wb") as f:
+            write_sections(f, TRIE_MAGIC, [len(self.labels)], sections)
+        os.replace(path + ".tmp", path)
+        self.version = version
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved trie via a copy-on-write mmap.
 
-        return self._dfs(cur, prefix)
+        Processes loading the same file share its pages; add_weight() only
+        copies the pages it writes to, and never changes the file.
+        """
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        _, s = read_sections(buf, TRIE_MAGIC, 1)
+        trie = cls(_arrays=(
+            np.frombuffer(s[0], dtype=np.int32),
+            np.frombuffer(s[1], dtype=np.int64),
+            np.frombuffer(s[2], dtype=np.int32),
+            np.frombuffer(s[3], dtype=np.float64),
+            np.frombuffer(s[4], dtype=np.float64),
+        ))
+        trie.version = bytes(s[5]).decode("utf-8") or None
+        return trie
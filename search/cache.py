@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with optional per-entry TTL."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()      # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ResultCache:
+    """Query-result cache: in-process LRU (L1) plus optional Redis (L2).
+
+    Keys combine the normalized query, the category filter and the index
+    version, so any index change makes old entries unreachable; the L1 is
+    also dropped as soon as a new version is seen. Values must be
+    JSON-serializable to go through Redis.
+    """
+
+    def __init__(self, maxsize=2048, ttl=300, redis_client=None, prefix="results"):
+        self.l1 = LRUCache(maxsize, ttl)
+        self.ttl = ttl
+        self.redis = redis_client
+        self.prefix = prefix
+        self.l2_hits = 0
+        self.l2_errors = 0
+        self._version = None
+
+    def _key(self, query, category, version, variant):
+        if version != self._version:
+            self._version = version
+            self.l1.clear()
+        return f"{self.prefix}:{version}:{variant}:{category or ''}:{normalize_query(query)}"
+
+    def get(self, query, category, version, variant=""):
+        """``variant`` separates results of the same query computed differently."""
+        key = self._key(query, category, version, variant)
+        value = self.l1.get(key)
+        if value is not None or self.redis is None:
+            return value
+        try:
+            raw = self.redis.get(key)
+        except Exception:
+            self.l2_errors += 1
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.l2_hits += 1
+        self.l1.put(key, value)
+        return value
+
+    def put(self, query, category, version, value, variant=""):
+        key = self._key(query, category, version, variant)
+        self.l1.put(key, value)
+        if self.redis is not None:
+            try:
+                self.redis.set(key, json.dumps(value), ex=self.ttl)
+            except Exception:
+                self.l2_errors += 1
+
+    def stats(self):
+        stats = self.l1.stats()
+        stats["l2_enabled"] = self.redis is not None
+        stats["l2_hits"] = self.l2_hits
+        stats["l2_errors"] = self.l2_errors
+        return stats
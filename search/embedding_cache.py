@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+EMBEDDINGS_DIR = "data/embeddings"
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def vectors_hash(vectors):
+    return hashlib.sha1(np.ascontiguousarray(vectors, dtype=np.float32)).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk document embeddings keyed by (doc id, content hash, model).
+
+    Vectors live in ``<name>-<model>-<checksum>.npy`` (float32, opened with
+    mmap so they are loaded lazily and shared between processes) with a
+    JSON sidecar listing the (doc_id, content hash) of each row plus the
+    vectors file, its row count and checksum. The sidecar is replaced last
+    and names its vectors file, so a crash mid-save leaves the old pair
+    intact; a sidecar that does not match its vectors is a cold cache.
+    sync() only encodes documents that are new or whose text changed, and
+    drops rows for documents that no longer exist.
+    """
+
+    def __init__(self, model_name, name="docs", directory=EMBEDDINGS_DIR):
+        self.model_name = model_name
+        self.slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{name}-{model_name}")
+        self.meta_path = os.path.join(directory, self.slug + ".json")
+        self.directory = directory
+        self.vectors_path = None        # set by _load() / _save()
+
+        self._vectors = None
+        self._keys = None               # [(doc_id, hash), ...] per row
+
+    def _load(self):
+        """Read the sidecar and its vectors together; cold if they disagree."""
+        if self._keys is not None:
+            return
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model") != self.model_name:
+                raise ValueError("embedding cache built with another model")
+            keys = [tuple(k) for k in meta["keys"]]
+            path = os.path.join(self.directory, meta["vectors"])
+            vectors = np.load(path, mmap_mode="r")
+            if len(keys) != meta["rows"] or vectors.shape[0] != meta["rows"]:
+                raise ValueError("embedding cache rows do not match its keys")
+            if vectors_hash(vectors) != meta["sha1"]:
+                raise ValueError("embedding cache vectors do not match their checksum")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if os.path.exists(self.meta_path):
+                print(f"⚠ Ignoring embedding cache {self.meta_path}: {e}")
+            keys, vectors, path = [], np.zeros((0, 0), dtype=np.float32), None
+        self._keys, self._vectors, self.vectors_path = keys, vectors, path
+
+    @property
+    def vectors(self):
+        """The cached matrix, memory-mapped on first access."""
+        self._load()
+        return self._vectors
+
+    @property
+    def ids(self):
+        self._load()
+        return [doc_id for doc_id, _ in self._keys]
+
+    def sync(self, items, encode, batch_size=64):
+        """Make the cache hold exactly ``items`` ((doc_id, text) pairs).
+
+        ``encode(list_of_texts)`` is only called, in batches, for missing or
+        changed texts. Returns (vectors, ids) in the order of ``items``.
+        """
+        self._load()
+        items = list(items)
+        cached = {doc_id: (row, h) for row, (doc_id, h) in enumerate(self._keys)}
+
+        keys = []
+        reuse = []                      # (new row, cached row)
+        missing = []                    # (new row, text)
+        for i, (doc_id, text) in enumerate(items):
+            h = text_hash(text)
+            keys.append((doc_id, h))
+            hit = cached.get(doc_id)
+            if hit is not None and hit[1] == h:
+                reuse.append((i, hit[0]))
+            else:
+                missing.append((i, text))
+
+        if not missing and keys == self._keys:
+            return self.vectors, self.ids
+
+        fresh = []
+        for start in range(0, len(missing), batch_size):
+            batch = [text for _, text in missing[start:start + batch_size]]
+            fresh.append(np.asarray(encode(batch), dtype=np.float32))
+
+        dim = fresh[0].shape[1] if fresh else self.vectors.shape[1]
+        out = np.zeros((len(items), dim), dtype=np.float32)
+        if reuse:
+            new_rows, old_rows = zip(*reuse)
+            out[list(new_rows)] = self.vectors[list(old_rows)]
+        if missing:
+            out[[i for i, _ in missing]] = np.concatenate(fresh)
+
+        self._save(out, keys)
+        print(f"Embedding cache: {len(reuse)} reused, {len(missing)} encoded, "
+              f"{len(cached) - len(reuse)} evicted.")
+        return self.vectors, self.ids
+
+    def _save(self, vectors, keys):
+        os.makedirs(self.directory, exist_ok=True)
+        digest = vectors_hash(vectors)
+        name = f"{self.slug}-{digest[:16]}.npy"
+        path = os.path.join(self.directory, name)
+        np.save(path + ".tmp.npy", vectors)
+        os.replace(path + ".tmp.npy", path)
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "keys": keys, "vectors": name,
+                       "rows": len(keys), "sha1": digest}, f)
+        # the sidecar switches to the new vectors in one step
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+        old = self.vectors_path
+        self._keys = [tuple(k) for k in keys]
+        self._vectors = np.load(path, mmap_mode="r")
+        self.vectors_path = path
+        if old and old != path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
@@ -0,0 +1,110 @@
+import time
+
+import numpy as np
+
+from search.ann import normalize
+from search.query import build_snippet, rank
+from search.ranking import get_ranker
+
+
+FUSIONS = ("rrf", "weighted")
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """Fuse ranked [(doc_id, score), ...] lists by sum of w / (k + rank)."""
+    weights = weights or [1.0] * len(rankings)
+    fused = {}
+    for ranking, w in zip(rankings, weights):
+        for r, (doc_id, _) in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + w / (k + r + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def weighted_fusion(rankings, weights):
+    """Fuse by weighted sum of max-normalized scores (missing = 0)."""
+    fused = {}
+    for ranking, w in zip(rankings, weights):
+        top = max((s for _, s in ranking), default=0.0)
+        if top <= 0:
+            continue
+        for doc_id, s in ranking:
+            fused[doc_id] = fused.get(doc_id, 0.0) + w * s / top
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+class HybridSearcher:
+    """Lexical + semantic retrieval with rank fusion under a per-request budget.
+
+    1. lexical top-N from the inverted index (MaxScore, no snippets)
+    2. semantic top-N from the ANN index
+    3. fuse both lists (RRF or weighted) and keep ``max_candidates``
+    4. exact cosine for that candidate set only, then fuse again to rerank
+
+    Each stage after the first checks the ``time_budget``; if it is used up
+    the best ranking so far is returned and the response marked partial.
+    """
+
+    def __init__(self, index, docs, ann, vectors, vector_ids, encode):
+        self.index = index
+        self.docs = docs
+        self.ann = ann
+        self.vectors = vectors
+        self.rows = {doc_id: i for i, doc_id in enumerate(vector_ids)}
+        self.encode = encode                # query text -> embedding
+
+    def _exact(self, query_vec, doc_ids):
+        rows = [self.rows[d] for d in doc_ids if d in self.rows]
+        ids = [d for d in doc_ids if d in self.rows]
+        if not rows:
+            return []
+        sims = normalize(self.vectors[rows]) @ query_vec
+        order = np.argsort(-sims, kind="stable")
+        return [(ids[i], float(sims[i])) for i in order]
+
+    def search(self, query, top_k=10, n_lexical=50, n_semantic=50,
+               max_candidates=100, time_budget=0.25, fusion="rrf", alpha=0.5, scorer=None):
+        """``scorer`` ranks the lexical list (default BM25F, as /search);
+        ``fusion`` is one of FUSIONS."""
+        if fusion not in FUSIONS:
+            raise ValueError("unknown fusion %r (choose from %s)" % (fusion, ", ".join(FUSIONS)))
+        deadline = time.monotonic() + time_budget
+        partial = False
+
+        scorer = scorer or get_ranker("bm25f")
+        lexical = rank(query, self.index, len(self.docs), top_k=n_lexical, scorer=scorer)
+        ranked = lexical
+        weights = [1.0 - alpha, alpha] if fusion == "weighted" else None
+
+        def fuse(lists):
+            if fusion == "weighted":
+                return weighted_fusion(lists, weights)
+            return reciprocal_rank_fusion(lists)
+
+        if time.monotonic() < deadline:
+            q = normalize(self.encode(query))
+            semantic = self.ann.search(q, top_k=n_semantic)
+            candidates = fuse([lexical, semantic])[:max_candidates]
+            ranked = candidates
+
+            if time.monotonic() < deadline:
+                exact = self._exact(q, [d for d, _ in candidates])
+                in_set = {d for d, _ in candidates}
+                ranked = fuse([[x for x in lexical if x[0] in in_set], exact])
+            else:
+                partial = True
+        else:
+            partial = True
+
+        lexical_scores = dict(lexical)
+        results = []
+        for doc_id, score in ranked[:top_k]:
+            doc = self.docs.get(doc_id, {})
+            results.append({
+                "url": doc_id,
+                "title": doc.get("title", doc_id),
+                "snippet": build_snippet(doc.get("text", ""), query),
+                "image": doc.get("image"),
+                "score": float(score),
+                "lexical_score": lexical_scores.get(doc_id),
+            })
+        return {"results": results, "partial": partial}
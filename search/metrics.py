@@ -0,0 +1,167 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# seconds; fine-grained at the low end where query stages live
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)      # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters, gauges and histograms, rendered as Prometheus text.
+
+    Each update is a dict lookup and a few additions under one lock, cheap
+    enough to stay on in production. Every gunicorn worker keeps its own
+    registry; scrapes report the worker that answered.
+    """
+
+    def __init__(self):
+        self.counters = {}          # (name, labels) -> value
+        self.histograms = {}        # (name, labels) -> Histogram
+        self.help = {}              # name -> help text
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self, gauges=None):
+        """Prometheus text exposition; ``gauges`` maps name -> value or
+        [(labels dict, value), ...] for values read at scrape time."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda x: x[0])
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+
+        seen = set()
+
+        def header(name, kind):
+            if (name, kind) not in seen:
+                seen.add((name, kind))
+                if name in self.help:
+                    lines.append("# HELP %s %s" % (name, self.help[name]))
+                lines.append("# TYPE %s %s" % (name, kind))
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append("%s%s %s" % (name, _labels(labels), _number(value)))
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append("%s_bucket%s %d" % (name, _labels(labels + (("le", le),)), cumulative))
+            lines.append("%s_sum%s %s" % (name, _labels(labels), _number(total)))
+            lines.append("%s_count%s %d" % (name, _labels(labels), count))
+
+        for name, value in sorted((gauges or {}).items()):
+            header(name, "gauge")
+            if not isinstance(value, list):
+                value = [({}, value)]
+            for labels, v in value:
+                lines.append("%s%s %s" % (name, _labels(tuple(sorted(labels.items()))), _number(v)))
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append('%s="%s"' % (k, v))
+    return "{" + ",".join(parts) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+METRICS = Metrics()
+METRICS.describe("search_stage_seconds", "Time spent per /search stage.")
+METRICS.describe("search_postings_scanned_total", "Postings read while scoring queries.")
+METRICS.describe("search_docs_scored_total", "Documents given a full score.")
+
+
+# ---------------------------
+# Per-request breakdown
+# ---------------------------
+_request = threading.local()
+
+
+def begin_breakdown():
+    """Start collecting this thread's stage timings for ?debug=timing."""
+    _request.breakdown = {"stages_ms": {}, "counters": {}}
+
+
+def end_breakdown():
+    """Stop collecting and return {"stages_ms": ..., "counters": ...} (or None)."""
+    breakdown = getattr(_request, "breakdown", None)
+    _request.breakdown = None
+    return breakdown
+
+
+@contextmanager
+def stage(name):
+    """Time one search stage into search_stage_seconds{stage=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe("search_stage_seconds", elapsed, stage=name)
+        breakdown = getattr(_request, "breakdown", None)
+        if breakdown is not None:
+            stages = breakdown["stages_ms"]
+            stages[name] = round(stages.get(name, 0.0) + elapsed * 1000.0, 3)
+
+
+def count(name, n):
+    """Add n to search_<name>_total (and to the request breakdown)."""
+    METRICS.inc("search_%s_total" % name, n)
+    breakdown = getattr(_request, "breakdown", None)
+    if breakdown is not None:
+        counters = breakdown["counters"]
+        counters[name] = counters.get(name, 0) + n
@@ -1,10 +1,103 @@
+import heapq
 import math
+import re
+from itertools import islice
 
+from crawler.analyzer import ANALYZER
+from crawler.parser import clean, token_spans
+from search.metrics import stage
 
-def build_snippet(text, query, window=160):
+PROXIMITY_WEIGHT = 0.5     # max score boost when all query terms are adjacent
+PROXIMITY_POOL = 4         # rerank the top k * POOL lexical hits by proximity
+
+
+def parse_query(query):
+    """Split a query into (words, phrases); quoted parts become phrases.
+
+    All words go through the same analyzer as the indexed text, so they
+    match its terms and phrase positions line up; every phrase word is also
+    a scoring word. An unmatched quote is ignored.
+    """
+    phrases = [clean(p) for p in re.findall(r'"([^"]*)"', query)]
+    loose = ANALYZER.tokens(re.sub(r'"[^"]*"', " ", query))
+    words = loose + [w for p in phrases for w in p]
+    return words, [p for p in phrases if len(p) > 1]
+
+
+def min_window(term_positions):
+    """Smallest token window covering one position of every term.
+
+    ``term_positions`` maps term -> sorted positions. Returns (start, end)
+    inclusive, or None if no term has positions.
+    """
+    lists = [p for p in term_positions.values() if len(p)]
+    if not lists:
+        return None
+    heap = [(int(p[0]), i, 0) for i, p in enumerate(lists)]
+    heapq.heapify(heap)
+    hi = max(pos for pos, _, _ in heap)
+    best = (heap[0][0], hi)
+    while True:
+        lo, i, j = heapq.heappop(heap)
+        if hi - lo < best[1] - best[0]:
+            best = (lo, hi)
+        if j + 1 == len(lists[i]):
+            return best
+        nxt = int(lists[i][j + 1])
+        hi = max(hi, nxt)
+        heapq.heappush(heap, (nxt, i, j + 1))
+
+
+def proximity(term_positions):
+    """1.0 when the matched terms are adjacent, falling towards 0 with distance."""
+    present = sum(1 for p in term_positions.values() if len(p))
+    if present < 2:
+        return 0.0
+    lo, hi = min_window(term_positions)
+    return present / (hi - lo + 1)
+
+
+def _text_spans(text):
+    if isinstance(text, str):
+        yield from token_spans(text)
+        return
+    # stored text comes in pieces cut between tokens
+    for offset, piece in text.chunks():
+        for start, end in token_spans(piece):
+            yield start + offset, end + offset
+
+
+def build_snippet(text, query, window=160, positions=None):
+    """Snippet around the query in text.
+
+    With ``positions`` (term -> token positions in this doc, from a
+    positional index) the snippet is centred on the tightest window holding
+    the query terms, located by walking tokens only up to that point.
+    ``text`` may be a StoredText (indexer/docstore.py), of which that walk
+    and the window inflate only the chunks they reach.
+    """
     if not text:
         return ""
 
+    if positions:
+        span = min_window(positions)
+        if span is not None:
+            lo, hi = span
+            spans = list(islice(_text_spans(text), lo, hi + 1))
+            if spans:
+                if spans[-1][1] - spans[0][0] <= window:
+                    start = (spans[0][0] + spans[-1][1] - window) // 2
+                else:
+                    start = spans[0][0] - window // 4
+                start = max(0, start)
+                end = min(len(text), start + window)
+                if isinstance(text, str):
+                    snippet = text[start:end]
+                else:
+                    snippet = text.window(start, end)
+                return ("..." + snippet.replace("\n", " ") + "...").strip()
+
+    text = str(text)
     query = query.lower()
     clean_text = text.replace("\n", " ")
 
@@ -19,12 +112,55 @@ def build_snippet(text, query, window=160):
     return ("..." + snippet + "...").strip()
 
 
-def search(query, idx, docs, total_docs):
-    query = query.strip().lower()
-    if not query:
-        return []  # do not return everything when search box empty!
+def rank(query, idx, total_docs, top_k=None, scorer=None, filters=None):
+    """Return [(doc_id, score), ...] best first, without building results.
+
+    Quoted phrases are required to match exactly and, with a positional
+    index, the best hits are reranked by how close the query terms occur.
+    ``scorer`` is a ranking function from search/ranking.py (None: TF-IDF);
+    ``filters`` ({"category": value}) restricts the docs before scoring.
+    The dict-based InvertedIndex only supports unfiltered TF-IDF.
+    """
+    query_words, phrases = parse_query(query.strip())
+    if not query_words:
+        return []
+
+    kwargs = {"scorer": scorer} if scorer is not None else {}
+    if filters:
+        if not hasattr(idx, "rank"):
+            raise ValueError("filters need a frozen or segmented index")
+        kwargs["filters"] = filters
+    if getattr(idx, "has_positions", False):
+        # phrase filter + proximity rerank of the top of the list
+        if phrases:
+            kwargs["phrases"] = phrases
+        pool = max(top_k or 10, 10) * PROXIMITY_POOL
+        with stage("rank"):
+            if top_k is not None:
+                ranked = idx.top_k(query_words, pool, total_docs, **kwargs)
+            else:
+                ranked = idx.rank(query_words, total_docs, **kwargs)
+        if len(set(query_words)) > 1:
+            with stage("proximity"):
+                head = ranked[:pool]
+                positions = idx.doc_positions(query_words, [d for d, _ in head])
+                head = [
+                    (d, s * (1 + PROXIMITY_WEIGHT * proximity(positions.get(d, {}))))
+                    for d, s in head
+                ]
+                head.sort(key=lambda x: x[1], reverse=True)
+                ranked = head + ranked[pool:]
+        return ranked[:top_k]
+
+    if top_k is not None and hasattr(idx, "top_k"):
+        # MaxScore pruning: only the top k docs are kept
+        with stage("rank"):
+            return idx.top_k(query_words, top_k, total_docs, **kwargs)
+    if hasattr(idx, "rank"):
+        # frozen / array-backed index: vectorized scoring + sort
+        with stage("rank"):
+            return idx.rank(query_words, total_docs, **kwargs)[:top_k]
 
-    query_words = query.split()
     scores = {}
 
     # Compute TF-IDF relevance
@@ -34,20 +170,38 @@ def search(query, idx, docs, total_docs):
                 scores[doc_id] = scores.get(doc_id, 0) + idx.tfidf(word, doc_id, total_docs)
 
     # Sort by relevance score
-    ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-
-    results = []
-    for doc_id, score in ranked:
-        doc = docs.get(doc_id, {})
-        snippet = build_snippet(doc.get("text", ""), query)
-
-        results.append({
-            "url": doc_id,
-            "title": doc.get("title", doc_id),
-            "snippet": snippet,
-            "image": doc.get("image"),
-            "score": float(score)
-        })
+    if top_k is not None:
+        return heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+def search(query, idx, docs, total_docs, top_k=None, scorer=None, filters=None):
+    query = query.strip().lower()
+    if not query:
+        return []  # do not return everything when search box empty!
+
+    ranked = rank(query, idx, total_docs, top_k, scorer, filters)
+
+    with stage("snippets"):
+        positions = {}
+        if getattr(idx, "has_positions", False):
+            words, _ = parse_query(query)
+            positions = idx.doc_positions(words, [d for d, _ in ranked])
+
+        results = []
+        for doc_id, score in ranked:
+            doc = docs.get(doc_id, {})
+            # stored pages inflate only the part of the text the snippet needs
+            text = doc.lazy("text") if hasattr(doc, "lazy") and "text" in doc else doc.get("text", "")
+            snippet = build_snippet(text, query, positions=positions.get(doc_id))
+
+            results.append({
+                "url": doc_id,
+                "title": doc.get("title", doc_id),
+                "snippet": snippet,
+                "image": doc.get("image"),
+                "score": float(score)
+            })
 
     return results
 def quick_summary(text, max_sentences=2):
@@ -0,0 +1,109 @@
+import math
+
+import numpy as np
+
+
+class TfIdf:
+    """tf / doc_length * log(N / df): the original InvertedIndex.tfidf formula."""
+
+    name = "tfidf"
+
+    def df(self, index, term):
+        return index.df(term)
+
+    def idf(self, df, total_docs):
+        return math.log(max(total_docs, df) / df)
+
+    def contributions(self, index, term, idf, avgdl=None):
+        """Return (doc_ords, per-doc scores, upper bound) for one term."""
+        ords, weights, _ = index.postings(term)
+        bound = float(index.max_weights[index.terms[term]]) * idf
+        return ords, weights * idf, bound
+
+
+class BM25:
+    """Okapi BM25 over the body field.
+
+    k1 * (1 - b + b * len / avgdl) is computed once per index for all docs
+    (FrozenIndex.length_norms) and reused, so a term costs one vectorized
+    expression over its postings. ``avgdl`` maps field -> average length;
+    callers spanning several indexes pass the global one.
+    """
+
+    name = "bm25"
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+
+    def df(self, index, term):
+        return index.df(term)
+
+    def idf(self, df, total_docs):
+        return math.log(1.0 + (total_docs - df + 0.5) / (df + 0.5))
+
+    def contributions(self, index, term, idf, avgdl=None):
+        ords, tfs = index.raw_postings(term)
+        avg = avgdl["body"] if avgdl else index.avg_length()
+        norms = self.k1 * index.length_norms(self.b, avg)[ords]
+        scores = idf * tfs * (self.k1 + 1) / (tfs + norms)
+        return ords, scores, float(scores.max()) if len(scores) else 0.0
+
+
+class BM25F(BM25):
+    """BM25F over body + title: per-field length-normalized tfs are
+    weighted and summed before the k1 saturation, so a title match counts
+    ``title_weight`` times a body match. Indexes without a title field
+    score like plain BM25.
+    """
+
+    name = "bm25f"
+
+    def __init__(self, k1=1.2, b=0.75, title_weight=3.0, title_b=0.5):
+        super().__init__(k1, b)
+        self.title_weight = title_weight
+        self.title_b = title_b
+
+    def df(self, index, term):
+        title = index.fields.get("title")
+        return max(index.df(term), title.df(term) if title is not None else 0)
+
+    def _fields(self, index, avgdl):
+        yield index, 1.0, self.b, avgdl["body"] if avgdl else index.avg_length()
+        title = index.fields.get("title")
+        if title is not None:
+            avg = avgdl.get("title") if avgdl else None
+            avg = avg or title.avg_length()
+            yield title, self.title_weight, self.title_b, avg
+
+    def contributions(self, index, term, idf, avgdl=None):
+        postings = []
+        for field, weight, b, avg in self._fields(index, avgdl):
+            raw = field.raw_postings(term)
+            if raw is not None:
+                ords, tfs = raw
+                postings.append((ords, weight * tfs / field.length_norms(b, avg)[ords]))
+
+        ords = np.unique(np.concatenate([o for o, _ in postings]))
+        tf = np.zeros(len(ords), dtype=np.float64)
+        for field_ords, field_tf in postings:
+            tf[np.searchsorted(ords, field_ords)] += field_tf
+        scores = idf * tf * (self.k1 + 1) / (tf + self.k1)
+        return ords, scores, float(scores.max()) if len(scores) else 0.0
+
+
+RANKERS = {
+    "tfidf": TfIdf(),
+    "bm25": BM25(),
+    "bm25f": BM25F(),
+}
+
+
+def get_ranker(name):
+    """Ranking function by name (None -> TF-IDF); ValueError if unknown."""
+    if name is None:
+        return RANKERS["tfidf"]
+    try:
+        return RANKERS[name.lower()]
+    except KeyError:
+        raise ValueError("unknown ranking %r (choose from %s)" % (name, ", ".join(RANKERS)))
@@ -1,20 +1,27 @@
 # search/semantic.py
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
+
+from search.ann import IVFIndex
 
 class SemanticSearch:
-    def __init__(self, docs):
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(self, docs, cache=None, model=None):
+        if model is None:
+            # torch is heavy to import; only pay for it when used
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.model = model
         self.doc_ids = list(docs.keys())
-        self.texts = [docs[id]["text"] for id in self.doc_ids]
-        self.embeddings = self.model.encode(self.texts, convert_to_tensor=True)
+        texts = [docs[id]["text"] for id in self.doc_ids]
+        if cache is not None:
+            # EmbeddingCache: re-encode only new / changed docs
+            self.embeddings, _ = cache.sync(
+                zip(self.doc_ids, texts),
+                lambda batch: self.model.encode(batch, convert_to_numpy=True),
+            )
+        else:
+            self.embeddings = self.model.encode(texts, convert_to_numpy=True)
+        self.ann = IVFIndex(self.embeddings, self.doc_ids)
 
-    def search(self, query, top_k=10):
-        q_emb = self.model.encode(query, convert_to_tensor=True)
-        hits = util.semantic_search(q_emb, self.embeddings, top_k=top_k)[0]
-        results = []
-        for h in hits:
-            doc_id = self.doc_ids[h["corpus_id"]]
-            score = float(h["score"])
-            results.append((doc_id, score))
-        return results
+    def search(self, query, top_k=10, nprobe=None):
+        q_emb = self.model.encode(query, convert_to_numpy=True)
+        return self.ann.search(q_emb, top_k=top_k, nprobe=nprobe)
@@ -1,24 +1,23 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
+from search.ann import IVFIndex
+
 class SemanticSearch:
     def __init__(self):
+        from sentence_transformers import SentenceTransformer
         self.model = SentenceTransformer("all-MiniLM-L6-v2")
         self.embeddings = {}  # url -> vector
+        self.ann = None
 
     def build_embeddings(self, docs):
-        for url, data in docs.items():
-            text = data["text"]
-            self.embeddings[url] = self.model.encode(text)
-
-    def search(self, query, top_k=10):
-        q_vec = self.model.encode(query).reshape(1, -1)
-        scores = []
-
-        for url, vec in self.embeddings.items():
-            sim = cosine_similarity(q_vec, vec.reshape(1, -1))[0][0]
-            scores.append((url, float(sim)))
+        urls = list(docs.keys())
+        texts = [docs[url]["text"] for url in urls]
+        vectors = self.model.encode(texts, convert_to_numpy=True)
+        self.embeddings = dict(zip(urls, vectors))
+        self.ann = IVFIndex(vectors, urls)
 
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:top_k]
+    def search(self, query, top_k=10, nprobe=None):
+        if self.ann is None:
+            return []
+        q_vec = self.model.encode(query, convert_to_numpy=True)
+        return self.ann.search(q_vec, top_k=top_k, nprobe=nprobe)
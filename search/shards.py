@@ -0,0 +1,348 @@
+import argparse
+import heapq
+import os
+import secrets
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener
+
+from indexer.segments import SEGMENTS_DIR, SegmentedIndex, avgdl_from_lengths, idf_from_dfs
+from search.metrics import METRICS, stage
+from search.query import parse_query, search
+from search.ranking import get_ranker
+
+SHARDS_DIR = "data/shards"
+SHARD_METHODS = ("info", "stats", "search")
+
+METRICS.describe("search_shard_failures_total", "Shard calls that errored or timed out.")
+
+
+def shard_of(doc_id, n):
+    """Shard number of a doc: crc32 of its url, stable across processes."""
+    return zlib.crc32(doc_id.encode("utf-8")) % n
+
+
+def shard_name(address):
+    return "%s:%d" % address
+
+
+def shard_key():
+    """The SEARCH_SHARD_KEY shared secret. Shard connections unpickle what
+    an authenticated peer sends, so there is deliberately no default."""
+    key = os.environ.get("SEARCH_SHARD_KEY")
+    if not key:
+        raise RuntimeError("SEARCH_SHARD_KEY is not set: shard servers and their "
+                           "clients need a shared secret")
+    return key.encode()
+
+
+# ---------------------------
+# Shards
+# ---------------------------
+class _GlobalView:
+    """A shard's index scored with corpus-wide idf / avgdl, so that
+    query.search ranks its docs as one unsharded index would."""
+
+    def __init__(self, index, idf, avgdl):
+        self.index = index
+        self.idf = idf
+        self.avgdl = avgdl
+
+    @property
+    def has_positions(self):
+        return self.index.has_positions
+
+    def doc_positions(self, words, doc_ids):
+        return self.index.doc_positions(words, doc_ids)
+
+    def rank(self, words, total_docs=None, **kwargs):
+        return self.index.rank(words, total_docs, idf=self.idf, avgdl=self.avgdl, **kwargs)
+
+    def top_k(self, words, k, total_docs=None, **kwargs):
+        return self.index.top_k(words, k, total_docs, idf=self.idf, avgdl=self.avgdl, **kwargs)
+
+
+class LocalShard:
+    """One shard (a segments directory) opened in this process."""
+
+    def __init__(self, directory):
+        self.name = directory
+        self.index = SegmentedIndex(directory)
+
+    def call(self, method, timeout=None, **kwargs):
+        # same interface as RemoteShard; the coordinator enforces the timeout
+        return getattr(self, method)(**kwargs)
+
+    def info(self):
+        self.index.refresh()
+        return {"docs": len(self.index), "version": self.index.version}
+
+    def stats(self, words, ranking=None):
+        self.index.refresh()
+        scorer = get_ranker(ranking) if ranking else None
+        return self.index.term_stats(words, scorer)
+
+    def search(self, query, k, idf, avgdl=None, ranking=None, filters=None):
+        """Top ``k`` results (with snippets) and category counts for ``query``."""
+        scorer = get_ranker(ranking) if ranking else None
+        view = _GlobalView(self.index, idf, avgdl)
+        results = search(query, view, self.index.docs, None, top_k=k, scorer=scorer, filters=filters)
+        words, phrases = parse_query(query.strip().lower())
+        facets = self.index.facet_counts("category", words, phrases) if words else {}
+        return {"results": results, "facets": facets}
+
+
+class RemoteShard:
+    """A shard served by another process (``python -m search.shards serve``).
+
+    Each calling thread keeps its own connection. A call that times out or
+    fails drops it, so a late reply is never read as the next answer.
+    """
+
+    def __init__(self, address, authkey=None):
+        self.address = address
+        self.name = shard_name(address)
+        self.authkey = authkey or shard_key()
+        self._local = threading.local()
+
+    def call(self, method, timeout=None, **kwargs):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send((method, kwargs))
+            if not conn.poll(timeout):
+                raise TimeoutError("shard %s timed out" % self.name)
+            status, value = conn.recv()
+        except BaseException:
+            self._local.conn = None
+            conn.close()
+            raise
+        if status != "ok":
+            raise RuntimeError("shard %s: %s" % (self.name, value))
+        return value
+
+
+def open_shards(spec, authkey=None):
+    """Shards from a comma-separated list: "host:port" entries are remote
+    (authenticated with ``authkey`` or SEARCH_SHARD_KEY), anything else is
+    a segments directory opened in-process."""
+    shards = []
+    for entry in (e.strip() for e in spec.split(",")):
+        if not entry:
+            continue
+        host, _, port = entry.rpartition(":")
+        if host and port.isdigit():
+            shards.append(RemoteShard((host, int(port)), authkey))
+        else:
+            shards.append(LocalShard(entry))
+    return shards
+
+
+# ---------------------------
+# Coordinator
+# ---------------------------
+class ShardedSearcher:
+    """Scatter-gather search over document-partitioned shards.
+
+    Two rounds per query. First every shard reports doc counts, lengths and
+    the df of the query terms; their sums give corpus-wide idf and avgdl.
+    Then every shard runs the normal query path (phrases, proximity rerank,
+    snippets) with those statistics, so scores are comparable across shards
+    and the per-shard top k lists merge into the global top k. A shard that
+    fails or misses ``timeout`` (seconds, per round) is left out and the
+    response is marked partial.
+    """
+
+    def __init__(self, shards, timeout=0.5):
+        self.shards = list(shards)
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=4 * max(1, len(self.shards)),
+                                        thread_name_prefix="shard")
+
+    def _scatter(self, method, shards, **kwargs):
+        """({shard: answer} for shards that answered in time, [failed names])."""
+        futures = {self._pool.submit(s.call, method, self.timeout, **kwargs): s for s in shards}
+        done, _ = wait(futures, timeout=self.timeout)
+        answers, failed = {}, []
+        for future, shard in futures.items():
+            if future in done and future.exception() is None:
+                answers[shard] = future.result()
+                continue
+            reason = "error" if future in done else "timeout"
+            future.cancel()
+            failed.append(shard.name)
+            METRICS.inc("search_shard_failures_total", shard=shard.name, reason=reason)
+        return answers, failed
+
+    def global_stats(self, stats, scorer=None):
+        """Corpus-wide (idf, avgdl) from the shards' term_stats()."""
+        n = sum(s["docs"] for s in stats)
+        dfs = {}
+        for s in stats:
+            for word, df in s["df"].items():
+                dfs[word] = dfs.get(word, 0) + df
+        avgdl = None
+        if scorer is not None and stats:
+            # title norms only if every shard has a title field
+            fields = set.intersection(*(set(s["lengths"]) for s in stats))
+            lengths = {f: sum(s["lengths"][f] for s in stats) for f in fields}
+            avgdl = avgdl_from_lengths(lengths, sum(s["indexed_docs"] for s in stats))
+        return idf_from_dfs(dfs, n, scorer), avgdl
+
+    def search(self, query, top_k=10, scorer=None, filters=None):
+        """{"results", "facets", "partial", "failed_shards"} for ``query``."""
+        out = {"results": [], "facets": {"category": {}}, "partial": False, "failed_shards": []}
+        words, _ = parse_query(query.strip().lower())
+        if not words:
+            return out
+        ranking = scorer.name if scorer is not None else None
+
+        with stage("shard_stats"):
+            stats, failed = self._scatter("stats", self.shards, words=words, ranking=ranking)
+        idf, avgdl = self.global_stats(list(stats.values()), scorer)
+
+        with stage("shard_search"):
+            answers, late = self._scatter("search", list(stats), query=query, k=top_k, idf=idf,
+                                          avgdl=avgdl, ranking=ranking, filters=filters)
+        failed += late
+
+        with stage("shard_merge"):
+            hits = [r for answer in answers.values() for r in answer["results"]]
+            out["results"] = heapq.nlargest(top_k, hits, key=lambda r: r["score"])
+            facets = out["facets"]["category"]
+            for answer in answers.values():
+                for value, n in answer["facets"].items():
+                    facets[value] = facets.get(value, 0) + n
+        out["partial"] = bool(failed)
+        out["failed_shards"] = failed
+        return out
+
+    def info(self):
+        """{shard name: {"docs", "version"} or None if unreachable}."""
+        answers, _ = self._scatter("info", self.shards)
+        return {s.name: answers.get(s) for s in self.shards}
+
+
+# ---------------------------
+# Shard server
+# ---------------------------
+def _handle(shard, conn):
+    with conn:
+        while True:
+            try:
+                method, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            if method not in SHARD_METHODS:
+                reply = ("error", "unknown method %r" % (method,))
+            else:
+                try:
+                    reply = ("ok", shard.call(method, **kwargs))
+                except Exception as e:
+                    reply = ("error", "%s: %s" % (type(e).__name__, e))
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+
+def serve(directory, address, authkey=None):
+    """Answer shard calls for ``directory`` on ``address`` until killed,
+    one thread per coordinator connection."""
+    authkey = authkey or shard_key()
+    shard = LocalShard(directory)
+    listener = Listener(address, authkey=authkey)
+    print(f"Shard {directory} ({len(shard.index)} docs) listening on {shard_name(address)}")
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            # failed handshake (wrong key, port scan): keep serving
+            print(f"⚠ Rejected connection: {e}")
+            continue
+        threading.Thread(target=_handle, args=(shard, conn), daemon=True).start()
+
+
+def start_local(directories, host="127.0.0.1", port=6100, authkey=None, wait_seconds=30):
+    """Serve each directory from its own process on consecutive ports.
+
+    Returns (processes, RemoteShard clients) once every shard answers; for
+    running the sharded path on one machine. Without ``authkey`` a random
+    one is shared with the child processes.
+    """
+    authkey = authkey or secrets.token_bytes(32)
+    processes, shards = [], []
+    for i, directory in enumerate(directories):
+        address = (host, port + i)
+        process = Process(target=serve, args=(directory, address, authkey), daemon=True)
+        process.start()
+        processes.append(process)
+        shards.append(RemoteShard(address, authkey))
+
+    deadline = time.time() + wait_seconds
+    for shard in shards:
+        while True:
+            try:
+                shard.call("info", timeout=wait_seconds)
+                break
+            except (ConnectionError, OSError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+    return processes, shards
+
+
+def split_index(source, out, n, processes=None, positional=True):
+    """Partition the docs of ``source`` (a SegmentedIndex) by shard_of() into
+    ``n`` segments directories out/shard_00 ...; returns their paths."""
+    from indexer.build import build_index
+
+    if os.path.exists(out):
+        raise FileExistsError("%s already exists" % out)
+    os.makedirs(out)
+    paths = []
+    for i in range(n):
+        path = os.path.join(out, "shard_%02d" % i)
+        pages = ((u, p) for u, p in source.docs.items() if shard_of(u, n) == i)
+        build_index(pages, path, processes, positional=positional)
+        paths.append(path)
+    return paths
+
+
+def main():
+    """python -m search.shards split|serve"""
+    parser = argparse.ArgumentParser(description="Document-partitioned index shards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split = commands.add_parser("split", help="partition an index into shard directories")
+    split.add_argument("--source", default=SEGMENTS_DIR)
+    split.add_argument("--out", default=SHARDS_DIR)
+    split.add_argument("--shards", type=int, default=4)
+    split.add_argument("--processes", type=int, default=None)
+    split.add_argument("--no-positions", action="store_true")
+
+    srv = commands.add_parser("serve", help="serve one shard directory over a socket")
+    srv.add_argument("--directory", required=True)
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=6100)
+    args = parser.parse_args()
+
+    if args.command == "split":
+        paths = split_index(SegmentedIndex(args.source), args.out, args.shards,
+                            args.processes, positional=not args.no_positions)
+        print("Serve each shard with: python -m search.shards serve --directory <dir> --port <port>")
+        print("then set SEARCH_SHARDS=" + ",".join("127.0.0.1:%d" % (6100 + i) for i in range(len(paths))))
+    else:
+        try:
+            key = shard_key()
+        except RuntimeError as e:
+            parser.error(str(e))
+        serve(args.directory, (args.host, args.port), key)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,278 @@
 # search/spell.py
-import math
+import mmap
+import os
+import re
+from collections.abc import Mapping
+
+import numpy as np
+
+from crawler.analyzer import ANALYZER
+from indexer.codec import StringTable, pack_strings, read_sections, write_sections
+
+SPELL_MAGIC = b"SPL1"
+# (leading punctuation, word, trailing punctuation) of a whitespace token
+_AFFIXES = re.compile(r"([^A-Za-z0-9]*)(.*?)([^A-Za-z0-9]*)", re.S)
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance (Levenshtein + adjacent swaps).
+
+    Stops early and returns max_distance + 1 once the bound is exceeded.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                v = min(v, prev2[j - 2] + 1)
+            cur[j] = v
+            if v < row_min:
+                row_min = v
+        if row_min > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], max_distance + 1)
+
+
+def deletes(word, max_distance):
+    """All strings obtained by deleting up to max_distance characters."""
+    out = {word}
+    level = {word}
+    for _ in range(max_distance):
+        level = {w[:i] + w[i + 1:] for w in level for i in range(len(w))}
+        out |= level
+    return out
+
+
+def build_deletes(words, max_distance=2, prefix_length=7):
+    """{delete: [word, ...]} for some vocabulary words; the tables of
+    several shards can be concatenated key by key (see indexer/build.py)."""
+    table = {}
+    for word in words:
+        for d in deletes(word[:prefix_length], max_distance):
+            table.setdefault(d, []).append(word)
+    return table
+
+
+class _Frequencies(Mapping):
+    """word -> frequency over a sorted, mmap'd string table."""
+
+    def __init__(self, words, freqs):
+        self.words = words
+        self.freqs = freqs
+
+    def __getitem__(self, word):
+        i = self.words.find(word)
+        if i < 0:
+            raise KeyError(word)
+        return int(self.freqs[i])
+
+    def __contains__(self, word):
+        return self.words.find(word) >= 0
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+
+class _Deletes:
+    """delete -> [word, ...] over sorted keys and flat word ordinals."""
+
+    def __init__(self, keys, offsets, ords, words):
+        self.keys = keys
+        self.offsets = offsets
+        self.ords = ords
+        self.words = words
+
+    def get(self, key, default=()):
+        i = self.keys.find(key)
+        if i < 0:
+            return default
+        return [self.words[int(o)] for o in self.ords[self.offsets[i]:self.offsets[i + 1]]]
+
 
 class Speller:
-    def __init__(self, vocabulary):
-        self.vocab = set(vocabulary)
-
-    def edits1(self, word):
-        letters = "abcdefghijklmnopqrstuvwxyz"
-        splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
-        deletes = [L + R[1:] for L, R in splits if R]
-        transposes = [L + R[1] + R[0] + R[2:] for L, R in splits if len(R) > 1]
-        replaces = [L + c + R[1:] for L, R in splits if R for c in letters]
-        inserts  = [L + c + R for L, R in splits for c in letters]
-        return set(deletes + transposes + replaces + inserts)
+    """Symmetric-delete (SymSpell-style) spelling corrector.
+
+    Every vocabulary word is indexed once under the strings reachable by
+    deleting up to ``max_distance`` characters from its first
+    ``prefix_length`` characters. A lookup only generates the deletes of the
+    input and verifies the hits with a bounded edit distance, so it costs a
+    few dict probes instead of ~54n+25 generated edits.
+
+    ``vocabulary`` is an iterable of words or a mapping word -> frequency
+    (document frequency); suggestions are ranked by distance, then
+    frequency, then alphabetically, so results are deterministic.
+
+    save() / load() store the tables in one file that load() maps without
+    decoding, so server processes start without rebuilding them.
+    """
+
+    def __init__(self, vocabulary, max_distance=2, prefix_length=7, _deletes=None):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.version = None
+        if _deletes is not None:
+            # tables built elsewhere (load(), parallel builds)
+            self.freq = vocabulary
+            self.deletes = _deletes
+        else:
+            if hasattr(vocabulary, "items"):
+                self.freq = {w: int(f) for w, f in vocabulary.items()}
+            else:
+                self.freq = {w: 1 for w in vocabulary}
+            # delete -> [word, ...]
+            self.deletes = build_deletes(self.freq, max_distance, prefix_length)
+        self.vocab = self.freq            # kept for callers doing `w in vocab`
+
+    @classmethod
+    def from_index(cls, index, **kwargs):
+        """Build from an index, weighting words by document frequency."""
+        if hasattr(index, "df"):
+            return cls({w: index.df(w) for w in index.vocabulary()}, **kwargs)
+        return cls({w: len(postings) for w, postings in index.index.items()}, **kwargs)
+
+    def save(self, path, version=None):
+        """Write the tables; ``version`` ties them to the index they came from."""
+        words = sorted(self.freq)
+        ordinal = {w: i for i, w in enumerate(words)}
+        keys = sorted(self.deletes)
+        lists = [self.deletes[k] for k in keys]
+        offsets = np.zeros(len(keys) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum([len(l) for l in lists])
+        ords = np.array([ordinal[w] for l in lists for w in l], dtype=np.int32)
+
+        word_offsets, word_blob = pack_strings(words)
+        key_offsets, key_blob = pack_strings(keys)
+        sections = [
+            word_offsets.tobytes(), word_blob,
+            np.array([self.freq[w] for w in words], dtype=np.int64).tobytes(),
+            key_offsets.tobytes(), key_blob,
+            offsets.tobytes(), ords.tobytes(),
+            (version or "").encode("utf-8"),
+        ]
+        with open(path + ".tmp", "wb") as f:
+            write_sections(f, SPELL_MAGIC, [self.max_distance, self.prefix_length], sections)
+        os.replace(path + ".tmp", path)
+        self.version = version
+
+    @classmethod
+    def load(cls, path):
+        """Open tables written by save() via mmap; lookups binary-search them."""
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (max_distance, prefix_length), s = read_sections(buf, SPELL_MAGIC, 2)
+        words = StringTable(np.frombuffer(s[0], dtype=np.uint64), s[1])
+        freq = _Frequencies(words, np.frombuffer(s[2], dtype=np.int64))
+        table = _Deletes(StringTable(np.frombuffer(s[3], dtype=np.uint64), s[4]),
+                         np.frombuffer(s[5], dtype=np.uint64),
+                         np.frombuffer(s[6], dtype=np.int32), words)
+        speller = cls(freq, max_distance, prefix_length, _deletes=table)
+        speller.version = bytes(s[7]).decode("utf-8") or None
+        return speller
+
+    def _max_distance(self, word):
+        # two edits on a short word reach too many unrelated words
+        return min(self.max_distance, 1 if len(word) <= 4 else 2)
+
+    def lookup(self, word, max_distance=None, limit=5):
+        """Return up to ``limit`` (suggestion, distance, frequency), best first."""
+        if word in self.freq:
+            return [(word, 0, self.freq[word])]
+        if max_distance is None:
+            max_distance = self._max_distance(word)
+        max_distance = min(max_distance, self.max_distance)
+
+        found = {}
+        checked = set()
+        for d in deletes(word[:self.prefix_length], max_distance):
+            for suggestion in self.deletes.get(d, ()):
+                if suggestion in checked:
+                    continue
+                checked.add(suggestion)
+                dist = edit_distance(word, suggestion, max_distance)
+                if dist <= max_distance:
+                    found[suggestion] = dist
+
+        ranked = sorted(found.items(), key=lambda x: (x[1], -self.freq[x[0]], x[0]))
+        return [(w, dist, self.freq[w]) for w, dist in ranked[:limit]]
 
     def candidates(self, word):
-        if word in self.vocab:
-            return [word]
-        edits = self.edits1(word)
-        return [w for w in edits if w in self.vocab]
+        return [w for w, _, _ in self.lookup(word)]
+
+    def correct_word(self, word):
+        """Best correction of one token as (tokens, cost); cost None if none.
+
+        Also considers splitting the word in two ("newyork" -> "new york");
+        the inserted space counts as one edit. Punctuation around the word
+        (quotes of a phrase, a trailing comma) is kept as is.
+        """
+        prefix, core, suffix = _AFFIXES.fullmatch(word).groups()
+        if (prefix or suffix) and core:
+            tokens, cost = self.correct_word(core)
+            tokens = list(tokens)
+            tokens[0] = prefix + tokens[0]
+            tokens[-1] += suffix
+            return tokens, cost
+
+        terms = ANALYZER.tokens(word)
+        if all(t in self.freq for t in terms) or any(c.isdigit() for c in word):
+            # indexed as is (stopwords, punctuation and stems included)
+            return [word], 0
+
+        best = None
+        hits = self.lookup(word, limit=1)
+        if hits:
+            best = ([hits[0][0]], hits[0][1], hits[0][2])
+
+        for i in range(1, len(word)):
+            left, right = word[:i], word[i:]
+            parts = []
+            for part in (left, right):
+                hit = self.lookup(part, max_distance=0 if len(part) < 3 else 1, limit=1)
+                if not hit:
+                    break
+                parts.append(hit[0])
+            else:
+                cost = 1 + parts[0][1] + parts[1][1]
+                freq = min(parts[0][2], parts[1][2])
+                if best is None or (cost, -freq) < (best[1], -best[2]):
+                    best = ([parts[0][0], parts[1][0]], cost, freq)
+
+        if best is None:
+            return [word], None
+        return best[0], best[1]
 
     def correct_query(self, query):
         words = query.lower().split()
+        fixes = [self.correct_word(w) for w in words]
+        unfixable = self.max_distance + 1
         corrected = []
-        changed = False
-
-        for w in words:
-            if w in self.vocab:
-                corrected.append(w)
-                continue
-            cands = self.candidates(w)
-            if cands:
-                corrected.append(cands[0])  # first candidate
-                changed = True
-            else:
-                corrected.append(w)
+        i = 0
+
+        while i < len(words):
+            tokens, cost = fixes[i]
+            # merge a wrongly split word ("wiki pedia" -> "wikipedia")
+            if i + 1 < len(words) and (cost != 0 or fixes[i + 1][1] != 0):
+                nxt_cost = fixes[i + 1][1]
+                separate = (unfixable if cost is None else cost) + \
+                    (unfixable if nxt_cost is None else nxt_cost)
+                prefix, left, inner = _AFFIXES.fullmatch(words[i]).groups()
+                inner2, right, suffix = _AFFIXES.fullmatch(words[i + 1]).groups()
+                # never merge across punctuation ("wiki, pedia")
+                merged = None if inner or inner2 else self.lookup(left + right, limit=1)
+                if merged and 1 + merged[0][1] < separate:
+                    corrected.append(prefix + merged[0][0] + suffix)
+                    i += 2
+                    continue
+            corrected.extend(tokens)
+            i += 1
 
-        return " ".join(corrected), changed
+        return " ".join(corrected), corrected != words
@@ -0,0 +1,87 @@
+import heapq
+from bisect import bisect_left
+
+from search.metrics import count
+
+
+def max_score_top_k(postings, k):
+    """Document-at-a-time MaxScore top-k over per-term posting lists.
+
+    ``postings`` is a list of ``(ords, contribs, upper_bound)`` where ``ords``
+    is an ascending list of doc ordinals, ``contribs`` the score each doc gets
+    from that term and ``upper_bound`` the largest value in ``contribs``.
+
+    Terms whose cumulative upper bound can no longer lift a document past the
+    current k-th best score become "non-essential": they are only probed (by
+    binary search) for docs found through the essential terms, and probing
+    stops as soon as the remaining bound cannot reach the threshold.
+
+    Returns ``[(ord, score), ...]`` best first, ties broken by lower ordinal.
+    """
+    if k <= 0:
+        return []
+
+    postings = sorted((p for p in postings if len(p[0])), key=lambda p: p[2])
+    n = len(postings)
+    ords = [p[0] for p in postings]
+    contribs = [p[1] for p in postings]
+    lengths = [len(o) for o in ords]
+
+    # bounds[i] = best possible score from terms 0..i together
+    bounds = []
+    total = 0.0
+    for p in postings:
+        total += p[2]
+        bounds.append(total)
+
+    pos = [0] * n
+    heap = []                     # min-heap of (score, -ord)
+    threshold = float("-inf")
+    first = 0                     # terms [first, n) are essential
+    scored = 0                    # docs that got a full score
+
+    while first < n:
+        doc = None
+        for i in range(first, n):
+            if pos[i] < lengths[i]:
+                o = ords[i][pos[i]]
+                if doc is None or o < doc:
+                    doc = o
+        if doc is None:
+            break
+
+        score = 0.0
+        for i in range(first, n):
+            j = pos[i]
+            if j < lengths[i] and ords[i][j] == doc:
+                score += contribs[i][j]
+                pos[i] = j + 1
+
+        pruned = False
+        for i in range(first - 1, -1, -1):
+            if score + bounds[i] <= threshold:
+                pruned = True
+                break
+            j = bisect_left(ords[i], doc, pos[i])
+            pos[i] = j
+            if j < lengths[i] and ords[i][j] == doc:
+                score += contribs[i][j]
+
+        if pruned:
+            continue
+        scored += 1
+        if len(heap) < k:
+            heapq.heappush(heap, (score, -doc))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, -doc))
+        else:
+            continue
+
+        if len(heap) == k:
+            threshold = heap[0][0]
+            while first < n and bounds[first] <= threshold:
+                first += 1
+
+    count("docs_scored", scored)
+    heap.sort(reverse=True)
+    return [(-neg_ord, score) for score, neg_ord in heap]
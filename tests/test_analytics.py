@@ -0,0 +1,31 @@
+import threading
+import time
+
+from search.analytics import QueryTracker
+
+
+def test_concurrent_first_records_start_one_batcher():
+    tracker = QueryTracker(flush_interval=0.05)
+    barrier = threading.Barrier(16)
+    start = tracker._start
+
+    def slow_start():
+        time.sleep(0.02)            # widen the check-then-start window
+        start()
+
+    tracker._start = slow_start
+
+    def first_request(i):
+        barrier.wait()
+        tracker.record("query %d" % (i % 4), "user%d" % i)
+
+    threads = [threading.Thread(target=first_request, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(1 for t in threading.enumerate() if t.name == "query-tracker") == 1
+    tracker.flush()
+    assert tracker.trending.total == 16
+    assert sorted(c for _, c in tracker.trending.top()) == [4, 4, 4, 4]
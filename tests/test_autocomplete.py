@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from search.autocomplete import Trie
+
+
+def _weights(n=400, seed=2):
+    rng = random.Random(seed)
+    words = {"".join(rng.choice("abcd") for _ in range(rng.randint(1, 6))) for _ in range(n)}
+    return {w: rng.randint(1, 20) for w in words}
+
+
+def _expected(weights, prefix, k):
+    hits = sorted((-w, word) for word, w in weights.items() if word.startswith(prefix))
+    return [word for _, word in hits[:k]]
+
+
+@pytest.fixture(scope="module")
+def weights():
+    return _weights()
+
+
+def test_top_k_by_weight_then_alphabetical(weights):
+    trie = Trie(weights)
+    assert len(trie) == len(weights)
+    prefixes = [""] + sorted({w[:n] for w in weights for n in (1, 2, 3)})
+    for prefix in prefixes:
+        for k in (1, 3, 10):
+            assert trie.autocomplete(prefix, k) == _expected(weights, prefix, k), (prefix, k)
+    assert trie.autocomplete("ab", 2, with_weights=True) == \
+        [(w, float(weights[w])) for w in _expected(weights, "ab", 2)]
+    assert trie.autocomplete("x") == []
+    assert "x" not in trie and next(iter(weights)) in trie
+
+
+def test_save_load_round_trip(weights, tmp_path):
+    path = str(tmp_path / "autocomplete.trie")
+    trie = Trie(weights)
+    trie.save(path, version="v3")
+    loaded = Trie.load(path)
+    assert loaded.version == "v3"
+    assert len(loaded) == len(trie)
+    for prefix in ("", "a", "bc", "dda"):
+        assert loaded.autocomplete(prefix, 10, with_weights=True) == \
+            trie.autocomplete(prefix, 10, with_weights=True)
+
+
+def test_add_weight_on_loaded_trie(weights, tmp_path):
+    path = str(tmp_path / "autocomplete.trie")
+    Trie(weights).save(path)
+    with open(path, "rb") as f:
+        saved = f.read()
+
+    loaded = Trie.load(path)
+    raised = dict(weights)
+    rng = random.Random(8)
+    for word in rng.sample(sorted(weights), 40):
+        delta = rng.randint(1, 30)
+        loaded.add_weight(word, delta)
+        raised[word] += delta
+    loaded.add_weight("not-a-word", 100)
+    loaded.add_weight("a", -5)                  # weights only go up
+    for prefix in ("", "a", "b", "cd", "dab"):
+        assert loaded.autocomplete(prefix, 10) == _expected(raised, prefix, 10), prefix
+
+    # copy-on-write: the file and other readers are unchanged
+    with open(path, "rb") as f:
+        assert f.read() == saved
+    assert Trie.load(path).autocomplete("", 10) == _expected(weights, "", 10)
@@ -0,0 +1,221 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crawler.concurrent import ConcurrentCrawler
+from crawler.state import CrawlState
+from indexer.pipeline import run_pipeline
+from indexer.segments import SegmentedIndex
+
+ROBOTS = "User-agent: *\nDisallow: /wiki/Secret\n"
+DUP_TEXT = " ".join("duplicate body word%d" % i for i in range(40))
+
+
+def _article(title, links, text=None):
+    anchors = "".join('<a href="/wiki/%s">%s</a> ' % (l, l) for l in links)
+    text = text or "%s article text about %s" % (title, title.lower())
+    return ("<html><head><title>%s</title></head><body><div class=\"mw-parser-output\">"
+            "<p>%s</p>%s</div></body></html>" % (title, text, anchors))
+
+
+def _site():
+    names = ["A", "B", "C", "D", "E"]
+    pages = {"Start": _article("Start", names + ["Secret", "Dup_1", "Dup_2"])}
+    for name in names:
+        # every page links to every other one (and back to the start)
+        pages[name] = _article(name, ["Start"] + names)
+    pages["Secret"] = _article("Secret", [])
+    pages["Dup_1"] = _article("Dup 1", [], DUP_TEXT)
+    pages["Dup_2"] = _article("Dup 2", [], DUP_TEXT)
+    pages["NoEtag"] = _article("NoEtag", [])
+    return pages
+
+
+class Site:
+    """Fixture pages behind a real HTTP server, with a request log."""
+
+    def __init__(self, latency=0.0):
+        self.pages = _site()
+        self.latency = latency
+        self.requests = []              # (path, start time)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests.append((self.path, time.monotonic()))
+                    site.in_flight += 1
+                    site.max_in_flight = max(site.max_in_flight, site.in_flight)
+                try:
+                    time.sleep(site.latency)
+                    site.respond(self)
+                finally:
+                    with site._lock:
+                        site.in_flight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, handler):
+        if handler.path == "/robots.txt":
+            body, etag = ROBOTS, None
+        else:
+            name = handler.path[len("/wiki/"):]
+            if name not in self.pages:
+                handler.send_response(404)
+                handler.end_headers()
+                return
+            body = self.pages[name]
+            etag = None if name == "NoEtag" else '"%s"' % hashlib.sha1(body.encode()).hexdigest()
+        if etag is not None and handler.headers.get("If-None-Match") == etag:
+            handler.send_response(304)
+            handler.end_headers()
+            return
+        data = body.encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/html; charset=utf-8")
+        handler.send_header("Content-Length", str(len(data)))
+        if etag is not None:
+            handler.send_header("ETag", etag)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def fetched(self, path):
+        return sum(1 for p, _ in self.requests if p == path)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def site():
+    s = Site()
+    yield s
+    s.close()
+
+
+def test_crawl_respects_robots_and_queues_each_url_once(site):
+    crawler = ConcurrentCrawler(max_pages=50, concurrency=4, delay=0)
+    pages = crawler.crawl(site.url + "/wiki/Start")
+
+    assert site.fetched("/wiki/Secret") == 0
+    assert crawler.stats["robots_blocked"] == 1
+    assert site.fetched("/robots.txt") == 1
+    # linked from every page, fetched once
+    for name in ("Start", "A", "B", "C", "D", "E"):
+        assert site.fetched("/wiki/" + name) == 1
+        assert site.url + "/wiki/" + name in pages
+
+
+def test_near_duplicates_are_counted_and_dropped(site):
+    crawler = ConcurrentCrawler(max_pages=50, concurrency=1, delay=0)
+    pages = crawler.crawl(site.url + "/wiki/Start")
+
+    dups = [u for u in pages if "/wiki/Dup_" in u]
+    assert len(dups) == 1
+    assert crawler.stats["duplicates"] == 1
+    assert crawler.stats["duplicate_rate"] == pytest.approx(1 / crawler.dedup.checked, abs=1e-4)
+
+
+def test_concurrency_limit_is_held():
+    site = Site(latency=0.1)
+    try:
+        ConcurrentCrawler(max_pages=50, concurrency=3, delay=0).crawl(site.url + "/wiki/Start")
+    finally:
+        site.close()
+    assert 2 <= site.max_in_flight <= 3
+
+
+def test_requests_to_a_host_are_spaced(site):
+    delay = 0.15
+    ConcurrentCrawler(max_pages=6, concurrency=4, delay=delay).crawl(site.url + "/wiki/Start")
+
+    starts = sorted(t for path, t in site.requests if path.startswith("/wiki/"))
+    assert len(starts) >= 4
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert min(gaps) >= delay - 0.02
+
+
+def _committed(crawler, pages):
+    """Consume pages like an indexer that commits each one."""
+    out = {}
+    for url, page in pages:
+        out[url] = page
+        crawler.commit(url)
+    return out
+
+
+def test_refresh_skips_304_and_reindexes_changed_pages(site, tmp_path):
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    crawler = ConcurrentCrawler(max_pages=50, concurrency=4, delay=0, state=state)
+    first = _committed(crawler, crawler.iter_pages(site.url + "/wiki/Start"))
+    assert site.url + "/wiki/A" in first
+    state.record(site.url + "/wiki/NoEtag", None, None, "stale")
+
+    site.pages["A"] = _article("A", ["Start"], "A article with new text")
+    site.requests.clear()
+    refresher = ConcurrentCrawler(concurrency=4, delay=0, state=state)
+    changed = _committed(refresher, refresher.iter_changed(
+        [site.url + "/wiki/" + n for n in ("A", "B", "C", "NoEtag")]))
+
+    # B and C answer 304; NoEtag has no validator but a new content hash
+    assert set(changed) == {site.url + "/wiki/A", site.url + "/wiki/NoEtag"}
+    assert "new text" in changed[site.url + "/wiki/A"]["text"]
+    assert refresher.stats["not_modified"] == 2
+    assert site.fetched("/wiki/B") == 1
+
+    # nothing changed since: a second refresh yields nothing
+    again = ConcurrentCrawler(concurrency=4, delay=0, state=state)
+    assert dict(again.iter_changed([site.url + "/wiki/" + n for n in ("A", "B", "NoEtag")])) == {}
+    assert again.stats["not_modified"] == 2
+    assert again.stats["unchanged"] == 1
+    state.close()
+
+
+def test_pages_are_recorded_only_once_indexed(site, tmp_path):
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    index = SegmentedIndex(str(tmp_path / "segments"), flush_docs=2)
+    failing = site.url + "/wiki/C"
+    add = index.add_document
+
+    def add_or_fail(url, page, words=None):
+        if url == failing:
+            raise RuntimeError("indexing failed")
+        add(url, page, words)
+
+    index.add_document = add_or_fail
+    crawler = ConcurrentCrawler(max_pages=50, concurrency=1, delay=0, state=state,
+                                indexed=index.docs.__contains__)
+    with pytest.raises(RuntimeError):
+        run_pipeline(crawler.iter_pages(site.url + "/wiki/Start"), index, commit=crawler.commit)
+    # only flushed pages were committed; the rest of the buffer is lost with the process
+    assert set(state.urls()) == set(index.docs) - set(index._buffer)
+    assert state.get(failing) is None
+
+    index = SegmentedIndex(index.directory, flush_docs=2)
+    crawler = ConcurrentCrawler(max_pages=50, concurrency=1, delay=0, state=state,
+                                indexed=index.docs.__contains__)
+    before = set(index.docs)
+    assert run_pipeline(crawler.iter_pages(site.url + "/wiki/Start"), index, commit=crawler.commit) > 0
+    assert failing in index.docs and failing not in before
+    assert set(state.urls()) == set(index.docs)
+
+    # a fresh index with the old state file gets every page again
+    fresh = SegmentedIndex(str(tmp_path / "fresh"))
+    crawler = ConcurrentCrawler(max_pages=50, concurrency=1, delay=0, state=state,
+                                indexed=fresh.docs.__contains__)
+    run_pipeline(crawler.iter_pages(site.url + "/wiki/Start"), fresh, commit=crawler.commit)
+    assert set(fresh.docs) == set(index.docs)
+    assert crawler.stats.get("unchanged", 0) == 0
+    state.close()
@@ -0,0 +1,85 @@
+from indexer.docstore import DocStore, write_doc_store
+from indexer.inverted_index import InvertedIndex
+from search.query import search
+
+
+def _store(tmp_path, docs):
+    path = str(tmp_path / "test.docs")
+    write_doc_store(path, docs)
+    return DocStore(path)
+
+
+def _page(i):
+    # the match is in the first of several text chunks
+    filler = " ".join("filler%d" % j for j in range(3000))
+    return {"title": "Page %d" % i, "category": "c%d" % (i % 2), "image": None,
+            "text": "needle haystack %d. %s" % (i, filler)}
+
+
+def test_round_trip(tmp_path):
+    docs = {"http://a/%d" % i: _page(i) for i in range(40)}
+    docs["http://a/none"] = {"title": "no text"}
+    store = _store(tmp_path, docs)
+    assert set(store) == set(docs)
+    for url, page in docs.items():
+        assert dict(store[url]) == page
+        assert ("text" in store[url]) == ("text" in page)
+    assert store["http://a/none"].get("text", "") == ""
+
+
+def test_search_inflates_only_snippet_chunks(tmp_path, monkeypatch):
+    docs = {"http://a/%d" % i: _page(i) for i in range(20)}
+    store = _store(tmp_path, docs)
+
+    idx = InvertedIndex(positional=True)
+    for url, page in docs.items():
+        idx.add_document(url, page["text"])
+    frozen = idx.freeze()
+
+    calls = []
+    chunk = DocStore._chunk
+    monkeypatch.setattr(DocStore, "_chunk", lambda self, c: calls.append(c) or chunk(self, c))
+    results = search("needle haystack", frozen, store, len(store), top_k=10)
+
+    assert len(results) == 10
+    assert all("needle haystack" in r["snippet"] for r in results)
+    assert all(r["title"].startswith("Page ") for r in results)
+    # one chunk per result: the snippet lies in the first chunk of each text
+    assert len(calls) == 10
+
+
+def test_stored_page_pickles_as_dict(tmp_path):
+    import pickle
+
+    docs = {"http://a/%d" % i: _page(i) for i in range(3)}
+    store = _store(tmp_path, docs)
+    page = pickle.loads(pickle.dumps(store["http://a/1"]))
+    assert type(page) is dict and page == docs["http://a/1"]
+
+
+def test_merge_copies_compressed_text(tmp_path, monkeypatch):
+    from indexer.segments import merge_docs
+
+    docs = {"http://a/%d" % i: _page(i) for i in range(70)}
+    docs["http://a/none"] = {"title": "no text", "text": None}
+    urls = sorted(docs)
+    left = _store(tmp_path, {u: docs[u] for u in urls[::2]})
+    path = str(tmp_path / "right.docs")
+    write_doc_store(path, {u: docs[u] for u in urls[1::2]})
+    right = DocStore(path)
+
+    calls = []
+    chunk = DocStore._chunk
+    monkeypatch.setattr(DocStore, "_chunk", lambda self, c: calls.append(c) or chunk(self, c))
+    merged_path = str(tmp_path / "merged.docs")
+    dropped = urls[3]
+    write_doc_store(merged_path, merge_docs([(left, list(left)), (right, [u for u in right if u != dropped])]))
+    # no text was inflated: the compressed chunks were copied
+    assert calls == []
+
+    monkeypatch.undo()
+    merged = DocStore(merged_path)
+    del docs[dropped]
+    assert list(merged) == sorted(docs)
+    for url, page in docs.items():
+        assert dict(merged[url]) == page
@@ -0,0 +1,47 @@
+import json
+import os
+
+import numpy as np
+
+from search.embedding_cache import EmbeddingCache
+
+
+def _encode(calls):
+    def encode(texts):
+        calls.extend(texts)
+        return np.array([[len(t), t.count("a")] for t in texts], dtype=np.float32)
+    return encode
+
+
+def test_sync_encodes_only_changes(tmp_path):
+    calls = []
+    cache = EmbeddingCache("m", directory=str(tmp_path))
+    cache.sync([("a", "aa"), ("b", "bbb")], _encode(calls))
+    vectors, ids = EmbeddingCache("m", directory=str(tmp_path)).sync(
+        [("b", "bbb"), ("c", "cacc")], _encode(calls))
+    assert calls == ["aa", "bbb", "cacc"]
+    assert ids == ["b", "c"]
+    assert vectors.tolist() == [[3, 0], [4, 1]]
+    # the replaced vectors file is gone
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".npy")]) == 1
+
+
+def test_torn_cache_is_cold(tmp_path):
+    calls = []
+    cache = EmbeddingCache("m", directory=str(tmp_path))
+    cache.sync([("a", "aa"), ("b", "bbb")], _encode(calls))
+    with open(cache.meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+
+    # vectors that do not match the sidecar's checksum
+    np.save(cache.vectors_path, np.zeros((2, 2), dtype=np.float32))
+    assert EmbeddingCache("m", directory=str(tmp_path)).ids == []
+
+    # sidecar without its vectors file
+    os.remove(cache.vectors_path)
+    cold = EmbeddingCache("m", directory=str(tmp_path))
+    vectors, ids = cold.sync([("a", "aa"), ("b", "bbb")], _encode(calls))
+    assert calls == ["aa", "bbb", "aa", "bbb"]
+    assert ids == ["a", "b"] and vectors.tolist() == [[2, 2], [3, 0]]
+    with open(cold.meta_path, encoding="utf-8") as f:
+        assert json.load(f)["sha1"] == meta["sha1"]
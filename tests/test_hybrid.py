@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+import pytest
+
+from indexer.segments import freeze_pages
+from search.ann import IVFIndex
+from search.hybrid import HybridSearcher, reciprocal_rank_fusion, weighted_fusion
+
+
+def test_reciprocal_rank_fusion():
+    fused = dict(reciprocal_rank_fusion([[("a", 9.0), ("b", 1.0)], [("b", 0.2), ("c", 0.1)]], k=60))
+    assert fused == pytest.approx({"a": 1 / 61, "b": 1 / 62 + 1 / 61, "c": 1 / 62})
+    weighted = reciprocal_rank_fusion([[("a", 1.0)], [("c", 1.0)]], k=0, weights=[1.0, 3.0])
+    assert weighted == [("c", 3.0), ("a", 1.0)]
+
+
+def test_weighted_fusion():
+    fused = weighted_fusion([[("a", 2.0), ("b", 1.0)], [("c", 1.0), ("b", 0.5)], [("d", 0.0)]],
+                            [0.3, 0.7, 1.0])
+    # scores are divided by each list's best; an all-zero list adds nothing
+    assert [d for d, _ in fused] == ["c", "b", "a"]
+    assert dict(fused) == pytest.approx({"a": 0.3, "b": 0.3 * 0.5 + 0.7 * 0.5, "c": 0.7})
+
+
+@pytest.fixture(scope="module")
+def searcher_parts():
+    rng = np.random.default_rng(1)
+    pages = {"http://x/%d" % i: {"title": "doc %d" % i, "text": "apple pie %s" % ("banana " * (i % 5))}
+             for i in range(40)}
+    vectors = rng.normal(size=(len(pages), 8)).astype(np.float32)
+    ids = list(pages)
+    return freeze_pages(pages), pages, IVFIndex(vectors, ids), vectors, ids
+
+
+def _searcher(parts, encode_delay=0.0):
+    index, pages, ann, vectors, ids = parts
+
+    def encode(query):
+        time.sleep(encode_delay)
+        return vectors[3]
+
+    return HybridSearcher(index, pages, ann, vectors, ids, encode)
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "weighted"])
+def test_hybrid_search_within_budget(searcher_parts, fusion):
+    out = _searcher(searcher_parts).search("apple banana", top_k=5, time_budget=5, fusion=fusion)
+    assert not out["partial"]
+    assert len(out["results"]) == 5
+    # the doc whose vector is the query's wins on the semantic side
+    assert "http://x/3" in [r["url"] for r in out["results"]]
+
+
+def test_hybrid_budget_gives_partial_results(searcher_parts):
+    searcher = _searcher(searcher_parts, encode_delay=0.05)
+    # used up before the semantic stage: lexical order only
+    out = searcher.search("apple banana", top_k=5, time_budget=0)
+    assert out["partial"]
+    assert [r["score"] for r in out["results"]] == [r["lexical_score"] for r in out["results"]]
+
+    # used up by encoding: first fusion is returned, exact rerank skipped
+    out = searcher.search("apple banana", top_k=5, time_budget=0.02)
+    assert out["partial"] and len(out["results"]) == 5
+
+
+def test_unknown_fusion_is_rejected(searcher_parts):
+    with pytest.raises(ValueError, match="fusion"):
+        _searcher(searcher_parts).search("apple", fusion="sum")
@@ -0,0 +1,219 @@
+import gc
+import os
+import random
+import time
+
+import numpy as np
+import pytest
+
+import indexer.segments
+from indexer.codec import decode_varints, encode_varints
+from indexer.segments import SegmentedIndex, avgdl_from_lengths, freeze_pages, idf_from_dfs
+from indexer.storage import load_segment, save_segment
+from search.ranking import RANKERS
+
+VOCAB = ["t%d" % i for i in range(150)]
+
+
+def _pages(n=300, seed=3):
+    rng = random.Random(seed)
+    pages = {}
+    for i in range(n):
+        # skewed term use, so postings lengths (and MaxScore bounds) vary
+        words = [VOCAB[min(int(rng.expovariate(0.03)), len(VOCAB) - 1)] for _ in range(rng.randint(1, 80))]
+        pages["http://x/%d" % i] = {"text": " ".join(words), "title": " ".join(rng.sample(VOCAB, 2)),
+                                    "category": rng.choice("ab")}
+    return pages
+
+
+@pytest.fixture(scope="module")
+def indexes(tmp_path_factory):
+    pages = _pages()
+    frozen = freeze_pages(pages)
+    path = str(tmp_path_factory.mktemp("segment") / "seg")
+    save_segment(frozen, pages, path)
+    segment, _ = load_segment(path)
+    return frozen, segment
+
+
+def test_varint_round_trip():
+    rng = np.random.default_rng(0)
+    for values in (
+        [],
+        [0],
+        [127, 128, 16383, 16384, 2 ** 32, 2 ** 63 - 1, 2 ** 64 - 1],
+        rng.integers(0, 2 ** 40, size=5000, dtype=np.uint64),
+    ):
+        values = np.asarray(values, dtype=np.uint64)
+        assert np.array_equal(decode_varints(encode_varints(values)), values)
+
+
+def test_segment_round_trip(indexes):
+    frozen, segment = indexes
+    assert list(segment.doc_ids) == list(frozen.doc_ids)
+    assert list(segment.vocabulary()) == list(frozen.vocabulary())
+    assert segment.total_length() == frozen.total_length()
+    assert segment.has_positions
+    for t, term in enumerate(frozen.vocabulary()):
+        assert segment.df(term) == frozen.df(term)
+        for a, b in zip(segment.postings_at(t, positional=True), frozen.postings_at(t, positional=True)):
+            assert np.array_equal(a, b), term
+    title = segment.fields["title"]
+    for term in frozen.fields["title"].vocabulary():
+        assert all(np.array_equal(a, b) for a, b in
+                   zip(title.raw_postings(term), frozen.fields["title"].raw_postings(term)))
+
+
+@pytest.mark.parametrize("ranking", [None] + sorted(RANKERS))
+def test_max_score_top_k_matches_rank(indexes, ranking):
+    scorer = RANKERS[ranking] if ranking else None
+    rng = random.Random(11)
+    for index in indexes:
+        for _ in range(60):
+            words = [rng.choice(VOCAB[:60]) for _ in range(rng.randint(1, 4))]
+            k = rng.choice([1, 5, 10, 50])
+            full = index.rank(words, scorer=scorer)[:k]
+            top = index.top_k(words, k, scorer=scorer)
+            assert [s for _, s in top] == pytest.approx([s for _, s in full]), words
+            # ties at the k-th score may be broken either way
+            cut = full[-1][1] if full else 0
+            assert {d for d, s in top if s > cut + 1e-9} == {d for d, s in full if s > cut + 1e-9}
+
+
+# ---------------------------
+# SegmentedIndex vs one FrozenIndex of the live pages
+# ---------------------------
+def _reference_stats(frozen, words, scorer):
+    """idf / avgdl of ``frozen``, passed to both sides: until a merge purges
+    them, tombstoned docs still count in a SegmentedIndex's own df."""
+    dfs = {w: (scorer.df(frozen, w) if scorer else frozen.df(w)) for w in words}
+    lengths = {"body": frozen.total_length(), "title": frozen.fields["title"].total_length()}
+    return idf_from_dfs(dfs, frozen.total_docs, scorer), avgdl_from_lengths(lengths, frozen.total_docs)
+
+
+def _assert_same_results(index, live, seed=5):
+    frozen = freeze_pages(live)
+    assert len(index) == len(live)
+    assert set(index.docs) == set(live)
+    for url, page in live.items():
+        assert dict(index.docs[url]) == page
+    rng = random.Random(seed)
+    for ranking in [None] + sorted(RANKERS):
+        scorer = RANKERS[ranking] if ranking else None
+        for _ in range(20):
+            words = [rng.choice(VOCAB[:60]) for _ in range(rng.randint(1, 3))]
+            idf, avgdl = _reference_stats(frozen, words, scorer)
+            words = [w for w in words if w in idf]
+            expected = dict(frozen.rank(words, idf=idf, scorer=scorer, avgdl=avgdl))
+            got = dict(index.rank(words, scorer=scorer, idf=idf, avgdl=avgdl))
+            assert got.keys() == expected.keys(), (ranking, words)
+            assert [got[d] for d in expected] == pytest.approx(list(expected.values()))
+            top = index.top_k(words, 10, scorer=scorer, idf=idf, avgdl=avgdl)
+            assert [s for _, s in top] == pytest.approx(sorted(expected.values(), reverse=True)[:10])
+
+
+def _churn(index, rng, pages):
+    """Add ``pages``, then update and delete some; returns the live pages."""
+    live = {}
+    for url, page in pages.items():
+        index.add_document(url, page)
+        live[url] = page
+    fresh = _pages(len(pages), seed=rng.random())
+    for url in rng.sample(sorted(live), len(live) // 5):
+        # update = tombstone the old copy + add the new one
+        live[url] = fresh[url]
+        index.add_document(url, live[url])
+    for url in rng.sample(sorted(live), len(live) // 6):
+        del live[url]
+        index.delete_document(url)
+    return live
+
+
+def test_segmented_index_matches_frozen(tmp_path):
+    rng = random.Random(1)
+    index = SegmentedIndex(str(tmp_path / "segments"), flush_docs=16, merge_factor=3)
+    live = _churn(index, rng, _pages(150))
+    assert len(index._segments) > 3 and index._buffer     # flushed and unflushed docs
+    _assert_same_results(index, live)
+
+    index.flush()
+    flushed = {s.name for s in index._segments}
+    stored = sum(s.index.total_docs for s in index._segments)
+    assert index.maybe_merge() > 0
+    # merged segments keep no tombstoned copies
+    assert sum(s.index.total_docs for s in index._segments) < stored
+    assert all(not s.deleted for s in index._segments if s.name not in flushed)
+    _assert_same_results(index, live)
+
+    # and the manifest on disk describes the same index
+    _assert_same_results(SegmentedIndex(index.directory), live)
+
+
+def test_deletes_during_merge_are_reapplied(tmp_path, monkeypatch):
+    pages = _pages(48)
+    index = SegmentedIndex(str(tmp_path / "segments"), flush_docs=16, merge_factor=3)
+    for url, page in pages.items():
+        index.add_document(url, page)
+    victim = "http://x/20"
+
+    merge_docs = indexer.segments.merge_docs
+
+    def delete_while_merging(parts):
+        index.delete_document(victim)
+        index.flush()
+        return merge_docs(parts)
+
+    monkeypatch.setattr(indexer.segments, "merge_docs", delete_while_merging)
+    assert index.maybe_merge() == 1
+    assert len(index._segments) == 1 and victim in index._segments[0].deleted
+    del pages[victim]
+    _assert_same_results(index, pages)
+    _assert_same_results(SegmentedIndex(index.directory), pages)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc")
+def test_refresh_picks_up_another_writer(tmp_path):
+    directory = str(tmp_path / "segments")
+    writer = SegmentedIndex(directory, flush_docs=16)
+    reader = SegmentedIndex(directory)
+    assert not reader.refresh()
+
+    pages = _pages(40)
+    for url, page in pages.items():
+        writer.add_document(url, page)
+    time.sleep(0.01)    # the manifest's mtime tells the reader it changed
+    writer.flush()
+    assert reader.refresh() and not reader.refresh()
+    _assert_same_results(reader, pages)
+
+    for url in ["http://x/3", "http://x/30"]:
+        writer.delete_document(url)
+        del pages[url]
+    writer.add_document("http://x/5", _pages(6, seed=9)["http://x/5"])
+    pages["http://x/5"] = writer.docs["http://x/5"]
+    time.sleep(0.01)
+    writer.flush()
+    time.sleep(0.01)
+    assert writer.maybe_merge() == 1
+    old = reader._snapshot()
+    assert reader.refresh()
+    assert [s.name for s in reader._segments] == [s.name for s in writer._segments]
+    _assert_same_results(reader, pages)
+
+    # a query still running on the old segments is not cut off ...
+    assert old[0][0].top_k(["t1"], 3)
+    # ... and once it is done they are neither open nor mapped
+    del old
+    gc.collect()
+    assert not [f for f in _open_files() if "(deleted)" in f and directory in f]
+
+
+def _open_files():
+    out = []
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            out.append(os.readlink("/proc/self/fd/" + fd))
+        except OSError:
+            pass
+    with open("/proc/self/maps") as f:
+        return out + [line.strip() for line in f]
@@ -0,0 +1,99 @@
+import random
+import time
+
+import pytest
+
+from indexer.build import build_index
+from search.query import search
+from search.ranking import get_ranker
+from search.shards import LocalShard, ShardedSearcher, split_index, start_local
+
+VOCAB = ["w%d" % i for i in range(200)]
+
+
+def _pages(n=240, seed=7):
+    rng = random.Random(seed)
+    for i in range(n):
+        text = " ".join(rng.choice(VOCAB[:rng.randint(20, 200)]) for _ in range(rng.randint(5, 60)))
+        yield "http://x/%d" % i, {"text": text, "title": " ".join(rng.sample(VOCAB, 3)),
+                                  "category": rng.choice("abc")}
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    root = tmp_path_factory.mktemp("shards")
+    single = build_index(_pages(), str(root / "single"), processes=1)
+    paths = split_index(single, str(root / "shards"), 3, processes=1)
+    return single, paths
+
+
+@pytest.fixture(scope="module")
+def served(corpus):
+    _, paths = corpus
+    port = random.randint(20000, 50000)
+    processes, shards = start_local(paths, port=port)
+    yield processes, shards
+    for p in processes:
+        p.terminate()
+        p.join()
+
+
+def _same_top(expected, got):
+    """Same scores in order and same docs above the last (tied) score."""
+    a = [(r["url"], round(r["score"], 6)) for r in expected]
+    b = [(r["url"], round(r["score"], 6)) for r in got]
+    cut = a[-1][1] if a else 0
+    return [s for _, s in a] == [s for _, s in b] and \
+        {u for u, s in a if s > cut} == {u for u, s in b if s > cut}
+
+
+# BM25F's df is a per-segment max over fields, which only adds up exactly
+# when every part has the same segmentation; BM25 and TF-IDF sum exactly.
+@pytest.mark.parametrize("ranking", ["bm25", "tfidf"])
+def test_sharded_top_k_matches_single_index(corpus, served, ranking):
+    single, _ = corpus
+    _, shards = served
+    scorer = get_ranker(ranking)
+    coordinator = ShardedSearcher(shards, timeout=5)
+    rng = random.Random(1)
+    queries = VOCAB[:20] + ["%s %s" % tuple(rng.sample(VOCAB, 2)) for _ in range(20)] + ['"w1 w2"']
+    for q in queries:
+        for filters in (None, {"category": "b"}):
+            expected = search(q, single, single.docs, len(single.docs), top_k=10,
+                              scorer=scorer, filters=filters)
+            out = coordinator.search(q, top_k=10, scorer=scorer, filters=filters)
+            assert not out["partial"]
+            assert _same_top(expected, out["results"]), q
+
+
+def test_killed_shard_gives_partial_results(corpus):
+    _, paths = corpus
+    processes, shards = start_local(paths, port=random.randint(20000, 50000))
+    try:
+        processes[1].terminate()
+        processes[1].join()
+        out = ShardedSearcher(shards, timeout=2).search("w3", scorer=get_ranker("bm25"))
+        assert out["partial"]
+        assert out["failed_shards"] == [shards[1].name]
+        assert out["results"]
+    finally:
+        for p in processes:
+            p.terminate()
+            p.join()
+
+
+class _SlowShard(LocalShard):
+    def search(self, *args, **kwargs):
+        time.sleep(1.0)
+        return super().search(*args, **kwargs)
+
+
+def test_slow_shard_times_out(corpus):
+    _, paths = corpus
+    shards = [LocalShard(paths[0]), _SlowShard(paths[1]), LocalShard(paths[2])]
+    started = time.perf_counter()
+    out = ShardedSearcher(shards, timeout=0.2).search("w3", scorer=get_ranker("bm25"))
+    assert time.perf_counter() - started < 0.9
+    assert out["partial"]
+    assert out["failed_shards"] == [paths[1]]
+    assert out["results"]
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from search.spell import Speller, edit_distance
+
+VOCAB = {"new": 50, "york": 40, "wikipedia": 30, "search": 20, "engine": 15,
+         "seared": 3, "yolk": 5, "cat": 5, "bat": 9, "hat": 9}
+
+
+@pytest.fixture(scope="module")
+def speller():
+    return Speller(VOCAB)
+
+
+def test_edit_distance():
+    assert edit_distance("search", "search", 2) == 0
+    assert edit_distance("yrok", "york", 2) == 1          # adjacent swap
+    assert edit_distance("serch", "search", 2) == 1
+    assert edit_distance("engin", "engine", 2) == 1
+    assert edit_distance("abcdef", "uvwxyz", 2) == 3      # stops at max + 1
+
+
+def test_lookup(speller):
+    assert speller.lookup("new") == [("new", 0, 50)]
+    assert speller.lookup("serch") == [("search", 1, 20)]
+    assert speller.lookup("yrok", limit=1) == [("york", 1, 40)]
+    # same distance: higher frequency first, then alphabetical
+    assert speller.lookup("xat") == [("bat", 1, 9), ("hat", 1, 9), ("cat", 1, 5)]
+    # short words allow one edit only
+    assert speller.lookup("xyt") == []
+    assert speller.lookup("zzzzzz") == []
+
+
+def test_correct_words(speller):
+    assert speller.correct_word("serch") == (["search"], 1)
+    assert speller.correct_word("engine") == (["engine"], 0)
+    assert speller.correct_word("qqqqqqqq") == (["qqqqqqqq"], None)
+    # split in two; the space counts as one edit
+    assert speller.correct_word("newyork") == (["new", "york"], 1)
+
+
+def test_correct_query(speller):
+    assert speller.correct_query("serch engin") == ("search engine", True)
+    assert speller.correct_query("new york") == ("new york", False)
+    assert speller.correct_query("newyork search") == ("new york search", True)
+    # merge of a wrongly split word
+    assert speller.correct_query("wiki pedia") == ("wikipedia", True)
+
+
+def test_punctuation_is_kept(speller):
+    assert speller.correct_word('"yrok,') == (['"york,'], 1)
+    assert speller.correct_query('"new yrok"') == ('"new york"', True)
+    assert speller.correct_query('"newyork"') == ('"new york"', True)
+    # never merged across punctuation
+    assert speller.correct_query("wiki, pedia") == ("wiki, pedia", False)
+
+
+def test_save_load_round_trip(speller, tmp_path):
+    path = str(tmp_path / "speller.tables")
+    speller.save(path, version="v1")
+    loaded = Speller.load(path)
+
+    assert loaded.version == "v1"
+    assert (loaded.max_distance, loaded.prefix_length) == (speller.max_distance, speller.prefix_length)
+    assert dict(loaded.freq) == VOCAB
+    assert "york" in loaded.vocab and "yrok" not in loaded.vocab
+    rng = random.Random(4)
+    words = list(VOCAB)
+    for _ in range(200):
+        word = list(rng.choice(words))
+        for _ in range(rng.randint(0, 2)):
+            i = rng.randrange(len(word))
+            word[i:i + 1] = rng.choice([[], [rng.choice("aeiorst")], word[i:i + 1] * 2])
+        word = "".join(word)
+        assert loaded.lookup(word) == speller.lookup(word), word
+        assert loaded.correct_word(word) == speller.correct_word(word), word
+    for query in ("serch engin", "wiki pedia", '"new yrok"', "newyork"):
+        assert loaded.correct_query(query) == speller.correct_query(query)